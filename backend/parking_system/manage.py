@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'parking_system.settings')
+    # Tests run against in-process cache and channel layers (parking_system/test_settings.py)
+    default_settings = 'parking_system.test_settings' if sys.argv[1:2] == ['test'] else 'parking_system.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', default_settings)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -1,6 +1,9 @@
 # Register your models here.
 from django.contrib import admin
-from .models import PermitType, User, Vehicle, ParkingLot, ParkingSpot, Event, Session
+from .models import (
+    PermitType, User, Vehicle, ParkingLot, ParkingSpot, Event, Session,
+    OccupancySample, OccupancyRollup, SensorDevice,
+)
 
 @admin.register(PermitType)
 class PermitTypeAdmin(admin.ModelAdmin):
@@ -28,4 +31,17 @@ class EventAdmin(admin.ModelAdmin):
 
 @admin.register(Session)
 class SessionAdmin(admin.ModelAdmin):
-    list_display = ('session_id', 'user', 'parking_spot', 'start_time', 'end_time')
\ No newline at end of file
+    list_display = ('session_id', 'user', 'parking_spot', 'start_time', 'end_time')
+
+@admin.register(OccupancySample)
+class OccupancySampleAdmin(admin.ModelAdmin):
+    list_display = ('sample_id', 'parking_lot', 'recorded_at', 'occupancy', 'total_spots')
+
+@admin.register(OccupancyRollup)
+class OccupancyRollupAdmin(admin.ModelAdmin):
+    list_display = ('parking_lot', 'granularity', 'bucket_start', 'avg_occupancy', 'samples')
+
+@admin.register(SensorDevice)
+class SensorDeviceAdmin(admin.ModelAdmin):
+    list_display = ('sensor_device_id', 'name', 'is_active')
+    filter_horizontal = ('spots',)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ParkingConfig(AppConfig):
     name = 'parking'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,248 @@
+"""In-process availability bitmaps - one bit per spot, one bitmap per lot.
+
+Each worker process keeps a ``LotBitmap`` per ``ParkingLot``: a sorted
+``array('q')`` of spot ids and a ``bytearray`` with one bit per spot
+(1 = available). Spot lookups are O(1) when a lot's spot ids are contiguous
+(the normal case, spots are created in bulk) and O(log n) otherwise, and
+"first N free spots" scans whole bytes at a time.
+
+Multi-worker invalidation
+-------------------------
+The shared cache holds a version number per lot
+(``availability_index:version:<lot_id>``) and a versioned snapshot of the
+lot's bitmap (``availability_index:snapshot:<lot_id>``).
+
+1. Once the DB transaction commits, a writer updates its own bitmap, INCRs
+   the lot version and publishes a snapshot tagged with the new version. A
+   rolled back write never touches any bitmap.
+2. Before serving a lot, a reader compares its local version with the cached
+   one. On mismatch it adopts the cached snapshot when the versions match,
+   otherwise it reloads that one lot from the database.
+3. Layout changes (spots added, moved or deleted) only bump the version, so
+   every worker reloads the lot from the database.
+
+With the default per-process ``LocMemCache`` this only coordinates inside one
+process; deployments running several workers need a shared cache, which is
+why ``CACHES`` uses Redis whenever ``REDIS_URL`` is set.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .counters import bump_counter
+from .models import ParkingLot, ParkingSpot
+
+VERSION_KEY = 'availability_index:version:{}'
+SNAPSHOT_KEY = 'availability_index:snapshot:{}'
+SNAPSHOT_TIMEOUT = 60 * 60
+
+
+class LotBitmap:
+    """Availability bits for the spots of one lot."""
+    __slots__ = ('_base', 'bits', 'spot_ids', 'version')
+
+    def __init__(self, spot_ids, bits, version=0):
+        self.spot_ids = spot_ids
+        self.bits = bits
+        self.version = version
+        # Contiguous ids allow direct offset lookups instead of bisecting
+        contiguous = len(spot_ids) > 0 and spot_ids[-1] - spot_ids[0] == len(spot_ids) - 1
+        self._base = spot_ids[0] if contiguous else None
+
+    @classmethod
+    def from_rows(cls, rows, version=0):
+        """Build from (spot_id, available) pairs sorted by spot_id."""
+        spot_ids = array('q')
+        bits = bytearray((len(rows) + 7) // 8)
+        for position, (spot_id, available) in enumerate(rows):
+            spot_ids.append(spot_id)
+            if available:
+                bits[position >> 3] |= 1 << (position & 7)
+        return cls(spot_ids, bits, version)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        version, spot_id_bytes, bits = snapshot
+        spot_ids = array('q')
+        spot_ids.frombytes(spot_id_bytes)
+        return cls(spot_ids, bytearray(bits), version)
+
+    def to_snapshot(self):
+        return (self.version, self.spot_ids.tobytes(), bytes(self.bits))
+
+    def __len__(self):
+        return len(self.spot_ids)
+
+    def __contains__(self, spot_id):
+        return self._position(spot_id) is not None
+
+    def _position(self, spot_id):
+        if self._base is not None:
+            position = spot_id - self._base
+            return position if 0 <= position < len(self.spot_ids) else None
+        position = bisect_left(self.spot_ids, spot_id)
+        if position < len(self.spot_ids) and self.spot_ids[position] == spot_id:
+            return position
+        return None
+
+    def is_available(self, spot_id):
+        """True/False for a known spot, None if the spot isn't in this lot."""
+        position = self._position(spot_id)
+        if position is None:
+            return None
+        return bool(self.bits[position >> 3] >> (position & 7) & 1)
+
+    def set(self, spot_id, available):
+        """Set a spot's bit. Returns False if the spot isn't in this lot."""
+        position = self._position(spot_id)
+        if position is None:
+            return False
+        if available:
+            self.bits[position >> 3] |= 1 << (position & 7)
+        else:
+            self.bits[position >> 3] &= ~(1 << (position & 7)) & 0xFF
+        return True
+
+    def available_count(self):
+        return int.from_bytes(self.bits, 'little').bit_count()
+
+    def iter_available(self):
+        """Yield available spot ids in id order, skipping full bytes of occupied spots."""
+        spot_ids = self.spot_ids
+        for byte_index, byte in enumerate(self.bits):
+            if not byte:
+                continue
+            base = byte_index << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield spot_ids[base + bit]
+
+    def first_available(self, limit):
+        return list(islice(self.iter_available(), limit))
+
+    def iter_spots(self):
+        """Yield (spot_id, available) pairs in id order."""
+        bits = self.bits
+        for position, spot_id in enumerate(self.spot_ids):
+            yield spot_id, bool(bits[position >> 3] >> (position & 7) & 1)
+
+
+class AvailabilityIndex:
+    """Per-process registry of lot bitmaps kept fresh via cache versions."""
+
+    def __init__(self):
+        self._lots = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def reset(self):
+        """Forget all local bitmaps (they are reloaded on next access)."""
+        with self._lock:
+            self._lots.clear()
+            self._loaded = False
+
+    def load(self):
+        """Load every lot's bitmap with a single query over the spot table."""
+        lot_ids = list(ParkingLot.objects.values_list('parking_lot_id', flat=True))
+        # Read versions before the spots so a concurrent bump is never missed
+        versions = self._versions(lot_ids)
+        rows = {lot_id: [] for lot_id in lot_ids}
+        spots = ParkingSpot.objects.order_by('parking_lot_id', 'parking_spot_id').values_list(
+            'parking_lot_id', 'parking_spot_id', 'availability'
+        )
+        for lot_id, spot_id, available in spots.iterator(chunk_size=5000):
+            rows.setdefault(lot_id, []).append((spot_id, available))
+
+        with self._lock:
+            self._lots = {
+                lot_id: LotBitmap.from_rows(lot_rows, versions.get(lot_id, 0))
+                for lot_id, lot_rows in rows.items()
+            }
+            self._loaded = True
+
+    def get(self, lot_id):
+        """Return an up-to-date bitmap for the lot."""
+        if not self._loaded:
+            self.load()
+        version = cache.get(VERSION_KEY.format(lot_id), 0)
+        bitmap = self._lots.get(lot_id)
+        if bitmap is None or bitmap.version != version:
+            bitmap = self._refresh(lot_id, version)
+        return bitmap
+
+    def _refresh(self, lot_id, version):
+        snapshot = cache.get(SNAPSHOT_KEY.format(lot_id))
+        if snapshot is not None and snapshot[0] == version:
+            bitmap = LotBitmap.from_snapshot(snapshot)
+        else:
+            rows = list(ParkingSpot.objects.filter(parking_lot_id=lot_id).order_by(
+                'parking_spot_id'
+            ).values_list('parking_spot_id', 'availability'))
+            bitmap = LotBitmap.from_rows(rows, version)
+        with self._lock:
+            self._lots[lot_id] = bitmap
+        return bitmap
+
+    def _versions(self, lot_ids):
+        keys = {VERSION_KEY.format(lot_id): lot_id for lot_id in lot_ids}
+        return {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    def apply(self, changes):
+        """Record (lot_id, spot_id, available) changes made by this process, after commit."""
+        changes = list(changes)
+        if changes:
+            transaction.on_commit(lambda: self._set_bits(changes))
+
+    def _set_bits(self, changes):
+        touched = set()
+        with self._lock:
+            for lot_id, spot_id, available in changes:
+                touched.add(lot_id)
+                bitmap = self._lots.get(lot_id)
+                if bitmap is not None and not bitmap.set(spot_id, available):
+                    # Spot we don't know about - rebuild the lot on next read
+                    self._lots.pop(lot_id, None)
+        self._publish(touched)
+
+    def invalidate(self, *lot_ids):
+        """Spots were added, moved or removed - every worker must reload these lots."""
+        with self._lock:
+            for lot_id in lot_ids:
+                self._lots.pop(lot_id, None)
+        transaction.on_commit(lambda: self._publish(lot_ids, snapshot=False))
+
+    def _publish(self, lot_ids, snapshot=True):
+        for lot_id in lot_ids:
+            version = bump_counter(VERSION_KEY.format(lot_id))
+            with self._lock:
+                bitmap = self._lots.get(lot_id)
+                if bitmap is None:
+                    continue
+                if not snapshot or bitmap.version != version - 1:
+                    # Someone else wrote in between - our copy may be missing their change
+                    self._lots.pop(lot_id, None)
+                    continue
+                bitmap.version = version
+                cache.set(SNAPSHOT_KEY.format(lot_id), bitmap.to_snapshot(), timeout=SNAPSHOT_TIMEOUT)
+
+    def lot_spots(self, lot_id):
+        return [
+            {'spot_id': spot_id, 'available': available}
+            for spot_id, available in self.get(lot_id).iter_spots()
+        ]
+
+    def available_spot_ids(self, lot_id, limit=None):
+        bitmap = self.get(lot_id)
+        if limit is None:
+            return list(bitmap.iter_available())
+        return bitmap.first_available(limit)
+
+    def occupied_spot_ids(self, lot_id):
+        return [spot_id for spot_id, available in self.get(lot_id).iter_spots() if not available]
+
+
+availability_index = AvailabilityIndex()
@@ -0,0 +1,20 @@
+"""REST hot-path benchmarks with query-count and latency budgets.
+
+Not part of the default test run (the module isn't named ``test*``). Run with::
+
+    python manage.py test parking.benchmarks.suite
+
+Environment:
+
+``PARKING_BENCH_SIZES``
+    Comma-separated ``<lots>x<spots per lot>`` campus sizes
+    (default ``10x50,100x50``; e.g. ``10x50,100x200,1000x500`` for a full run).
+``PARKING_BENCH_OUTPUT``
+    Path for the JSON results (default: print them only).
+``PARKING_BENCH_REPEAT``
+    Timed requests per endpoint; the median is reported (default 5).
+
+Budgets live in ``budgets.json`` (``max_queries``, ``max_ms``, ``max_bytes``;
+each a number or a per-size map). A size without a budget entry is measured
+but never fails.
+"""
@@ -0,0 +1,80 @@
+"""Seed synthetic campuses of a given size with bulk inserts."""
+import random
+from datetime import time
+
+from django.utils import timezone
+
+from parking.models import Event, ParkingLot, ParkingSpot, PermitType, User
+from parking.permits import rebuild_permit_masks
+
+PERMIT_NAMES = ('Student', 'Faculty', 'Visitor')
+
+# Lots sit on a grid ~200 m apart around this point; spots in rows of 10
+ORIGIN = (37.2284, -80.4234)
+LOT_SPACING = 0.002
+SPOT_SPACING = 0.00005
+
+
+def lot_position(index):
+    return ORIGIN[0] + index // 10 * LOT_SPACING, ORIGIN[1] + index % 10 * LOT_SPACING
+
+
+def parse_size(size):
+    """'100x50' -> (100, 50)"""
+    lots, spots = size.lower().split('x')
+    return int(lots), int(spots)
+
+
+def seed_campus(lot_count, spots_per_lot, occupied_fraction=0.3, seed=0):
+    """Create lots, spots, permit mappings, a permit holder and today's events."""
+    rng = random.Random(seed)
+    permits = [PermitType.objects.create(name=name) for name in PERMIT_NAMES]
+
+    lots = ParkingLot.objects.bulk_create([
+        ParkingLot(parking_lot_name=f'Bench Lot {i}', latitude=lat, longitude=lon)
+        for i, (lat, lon) in enumerate(map(lot_position, range(lot_count)))
+    ])
+    lot_permits = ParkingLot.permit_types.through
+    lot_permits.objects.bulk_create([
+        lot_permits(parkinglot_id=lot.parking_lot_id, permittype_id=permit.permit_type_id)
+        for i, lot in enumerate(lots)
+        # Every lot takes Faculty; Student and Visitor alternate
+        for permit in (permits[1], permits[i % 2 * 2])
+    ], batch_size=1000)
+
+    spots = []
+    for lot in lots:
+        occupied = 0
+        for n in range(spots_per_lot):
+            available = rng.random() >= occupied_fraction
+            occupied += not available
+            spots.append(ParkingSpot(
+                parking_lot=lot, availability=available,
+                latitude=lot.latitude + n // 10 * SPOT_SPACING,
+                longitude=lot.longitude + n % 10 * SPOT_SPACING,
+            ))
+        # bulk_create skips save(), so set the maintained counters directly
+        lot.total_spots = spots_per_lot
+        lot.available_spots = spots_per_lot - occupied
+        lot.occupancy = occupied
+    ParkingSpot.objects.bulk_create(spots, batch_size=1000)
+    ParkingLot.objects.bulk_update(lots, ParkingLot.COUNTER_FIELDS, batch_size=1000)
+
+    spot_permits = ParkingSpot.lot_permit_access.through
+    spot_permits.objects.bulk_create([
+        spot_permits(parkingspot_id=spot.parking_spot_id, permittype_id=permits[1].permit_type_id)
+        for spot in spots
+    ], batch_size=1000)
+    # The through-table bulk inserts bypass the m2m_changed handlers
+    rebuild_permit_masks()
+
+    today = timezone.now().date()
+    for i in range(3):
+        event = Event.objects.create(event_name=f'Bench Event {i}', date=today, time_start=time(12 + i))
+        event.restricted_lots.set(lots[i::7][:20])
+
+    user = User.objects.create_user(
+        username='bench', password='bench', first_name='Bench', last_name='User',
+        permit_type=permits[0]
+    )
+    return {'lots': lots, 'permits': permits, 'user': user}
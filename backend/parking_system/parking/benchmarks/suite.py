@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import statistics
+import time
+from pathlib import Path
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from parking.models import ParkingSpot, SensorDevice
+from parking.sensor_filter import sensor_filter
+from parking.signing import sensor_keys, sign_batch
+
+from .campus import parse_size, seed_campus
+
+BUDGETS_PATH = Path(__file__).with_name('budgets.json')
+DEFAULT_SIZES = '10x50,100x50'
+# Added with PARKING_BENCH_LARGE=1 - too slow for every run
+LARGE_SIZES = '1000x50'
+# Budget keys that fail the run; max_ms only warns, wall time is too noisy for CI
+GATED_METRICS = (('queries', 'max_queries'), ('bytes', 'max_bytes'))
+
+logger = logging.getLogger(__name__)
+# Spots per sensor batch in the ingest benchmarks
+INGEST_SPOTS = 1000
+
+
+def _budget(limit, size):
+    """Budgets are a single number or a {size: number} map."""
+    if isinstance(limit, dict):
+        return limit.get(size)
+    return limit
+
+
+class QueryCounter:
+    """Counts executed queries (no DEBUG query log, so no 9000-query cap)."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class HotPathBenchmark(TestCase):
+    """Benchmark the REST hot paths against the budgets in budgets.json"""
+
+    def endpoints(self, campus):
+        lot_id = campus['lots'][len(campus['lots']) // 2].parking_lot_id
+        return [
+            ('dashboard_summary', '/api/dashboard/', None),
+            ('lots_for_permit', '/api/lots/for-my-permit/', campus['user']),
+            ('lots_list', '/api/lots/', None),
+            ('lots_list_spots', '/api/lots/?expand=spots', None),
+            ('spots_for_lot', f'/api/spots/?parking_lot={lot_id}', None),
+            ('active_events', '/api/events/active/', None),
+            ('nearest_available', '/api/spots/nearest-available/?lat=37.2294&lon=-80.4224&k=10', campus['user']),
+        ]
+
+    def measure(self, url, user, repeat):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user=user)
+
+        timings = []
+        queries = response = None
+        for _ in range(repeat + 1):
+            # Measure the uncached path - caches are what we'd be hiding
+            cache.clear()
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - started
+            self.assertEqual(response.status_code, 200, url)
+            if queries is None:
+                # First request also warms per-process state; report but don't time it
+                queries = counter.count
+                continue
+            timings.append(elapsed)
+        return {
+            'queries': queries,
+            'ms': round(statistics.median(timings) * 1000, 2),
+            'bytes': len(response.content),
+        }
+
+    def ingest_requests(self, campus):
+        """Unsigned and signed ingest of one batch, and verifying it on its own.
+
+        Each entry maps a request number to ``(call, bytes)``; batches
+        alternate every spot's state so each one does the full write, and
+        envelopes are signed before the clock starts.
+        """
+        spot_ids = list(
+            ParkingSpot.objects.filter(parking_lot__in=campus['lots'])
+            .order_by('parking_spot_id').values_list('parking_spot_id', flat=True)[:INGEST_SPOTS]
+        )
+        device = SensorDevice.objects.create(name='bench-gateway')
+        device.spots.set(spot_ids)
+        sensor_keys.reset()
+        client = APIClient()
+
+        def batch(i):
+            return [[spot_id, bool(i % 2)] for spot_id in spot_ids]
+
+        def post(body):
+            response = client.post('/api/sensors/ingest/', body, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+
+        def unsigned(i):
+            body = {'readings': batch(i)}
+            return lambda: post(body), len(json.dumps(body))
+
+        def signed(i):
+            envelope = sign_batch(device.name, device.secret, batch(i))
+            return lambda: post(envelope), len(json.dumps(envelope))
+
+        def verify(i):
+            envelope = sign_batch(device.name, device.secret, batch(i))
+            return lambda: sensor_keys.verify(envelope), len(envelope['payload'])
+
+        return [('sensor_ingest', unsigned), ('signed_ingest', signed), ('signature_verify', verify)]
+
+    def measure_calls(self, request, repeat):
+        timings = []
+        queries = size = None
+        for i in range(repeat + 1):
+            call, size = request(i)
+            # Every batch is news to the filter
+            sensor_filter.reset()
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                started = time.perf_counter()
+                call()
+                elapsed = time.perf_counter() - started
+            if i:
+                # The first call loads the device key; report the steady state
+                timings.append(elapsed)
+                queries = counter.count
+        return {
+            'queries': queries,
+            'ms': round(statistics.median(timings) * 1000, 2),
+            'bytes': size,
+        }
+
+    def test_hot_paths_within_budget(self):
+        """Test each endpoint stays within its query and size budgets (latency only warns)"""
+        sizes = os.environ.get('PARKING_BENCH_SIZES', DEFAULT_SIZES).split(',')
+        if os.environ.get('PARKING_BENCH_LARGE') == '1':
+            sizes += [size for size in LARGE_SIZES.split(',') if size not in sizes]
+        repeat = int(os.environ.get('PARKING_BENCH_REPEAT', '5'))
+        budgets = json.loads(BUDGETS_PATH.read_text())
+
+        results = []
+        failures = []
+        slow = []
+        for size in sizes:
+            lot_count, spots_per_lot = parse_size(size)
+            with transaction.atomic():
+                campus = seed_campus(lot_count, spots_per_lot)
+                measurements = [
+                    (name, lambda url=url, user=user: self.measure(url, user, repeat))
+                    for name, url, user in self.endpoints(campus)
+                ] + [
+                    (name, lambda request=request: self.measure_calls(request, repeat))
+                    for name, request in self.ingest_requests(campus)
+                ]
+                for name, measure in measurements:
+                    result = {'size': size, 'endpoint': name, **measure()}
+                    results.append(result)
+                    budget = budgets.get(name, {})
+                    for metric, key in GATED_METRICS:
+                        limit = _budget(budget.get(key), size)
+                        if limit is not None and result[metric] > limit:
+                            failures.append(f'{size} {name}: {metric} {result[metric]} > {limit}')
+                    limit = _budget(budget.get('max_ms'), size)
+                    if limit is not None and result['ms'] > limit:
+                        slow.append(f'{size} {name}: ms {result["ms"]} > {limit}')
+                # Each size starts from an empty campus
+                transaction.set_rollback(True)
+
+        output = json.dumps({'results': results, 'failures': failures, 'slow': slow}, indent=2)
+        path = os.environ.get('PARKING_BENCH_OUTPUT')
+        if path:
+            Path(path).write_text(output)
+        logger.info(output)
+        for line in slow:
+            logger.warning('Over latency budget: %s', line)
+        self.assertEqual(failures, [], 'Benchmark budgets exceeded')
@@ -0,0 +1,177 @@
+"""Channel-layer fan-out for parking updates.
+
+Clients join the summary group on connect and receive one ``lots_summary``
+frame per producer batch with the counters of every lot that changed.
+Spot-level frames (``batch_update`` / ``parking_update``) only go to the
+per-lot groups that clients explicitly subscribe to.
+
+Producers hand their changes to ``broadcaster`` rather than calling
+``group_send`` themselves, so bursts are coalesced into one frame per lot per
+``PARKING_BROADCAST_WINDOW`` seconds.
+"""
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import changelog
+from .history import record_samples
+from .snapshot import refresh_status_snapshot
+
+SUMMARY_GROUP = 'parking_summary'
+
+# Keys of a lot summary that are sent to the summary group (no spot lists)
+SUMMARY_FIELDS = (
+    'lot_id', 'lot_name', 'occupancy', 'total_spots',
+    'available_spots', 'occupancy_percent', 'timestamp', 'sequence',
+)
+
+
+def lot_group(lot_id):
+    """Channel group carrying spot-level updates for one lot."""
+    return f'parking_lot_{lot_id}'
+
+
+def lot_summary(lot, spots=()):
+    """Broadcast payload for a lot, read from its maintained counters."""
+    total = lot.total_spots
+    return {
+        'lot_id': lot.parking_lot_id,
+        'lot_name': lot.parking_lot_name,
+        'occupancy': lot.occupancy,
+        'total_spots': total,
+        'available_spots': lot.available_spots,
+        'occupancy_percent': round(lot.occupancy / total * 100, 1) if total > 0 else 0,
+        'spots': list(spots),
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+async def apublish_lot_updates(summaries, channel_layer=None):
+    """Send each lot's batch to its own group, then one aggregated summary frame."""
+    channel_layer = channel_layer or get_channel_layer()
+    if channel_layer is None or not summaries:
+        return
+    for summary in summaries:
+        await channel_layer.group_send(
+            lot_group(summary['lot_id']),
+            {
+                'type': 'batch_update',
+                'data': summary,
+            }
+        )
+    await channel_layer.group_send(
+        SUMMARY_GROUP,
+        {
+            'type': 'lots_summary',
+            'data': [
+                {field: summary[field] for field in SUMMARY_FIELDS if field in summary}
+                for summary in summaries
+            ],
+        }
+    )
+
+
+def publish_lot_updates(summaries, channel_layer=None):
+    """Synchronous wrapper for management commands and views."""
+    if summaries:
+        async_to_sync(apublish_lot_updates)(summaries, channel_layer)
+
+
+class CoalescingBroadcaster:
+    """Buffers lot updates for a short window and flushes them as one batch.
+
+    Within a window only the latest counters per lot and the latest state per
+    spot are kept. The first update into an empty buffer arms a timer; when it
+    fires every buffered lot is published with ``publish_lot_updates``. A
+    window of 0 publishes synchronously. Each flush also refreshes the shared
+    status snapshot used by WebSocket connects and stamps every lot frame with
+    the lot's next sequence number (see ``changelog``). With
+    ``record_history`` it also appends one occupancy sample per lot (see
+    ``history``).
+    """
+
+    def __init__(self, window=None, channel_layer=None, record_history=False):
+        self._window = window
+        self._channel_layer = channel_layer
+        self._record_history = record_history
+        self._pending = {}
+        self._timer = None
+        self._lock = threading.Lock()
+
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, 'PARKING_BROADCAST_WINDOW', 0.15)
+
+    def add(self, summary, spots=()):
+        """Queue a lot's latest counters and the spots that changed."""
+        self.add_many([{**summary, 'spots': spots}])
+
+    def add_many(self, summaries):
+        """Queue several lot summaries, each carrying its changed ``spots``."""
+        with self._lock:
+            for summary in summaries:
+                entry = self._pending.setdefault(summary['lot_id'], {'spots': {}})
+                entry['summary'] = {key: value for key, value in summary.items() if key != 'spots'}
+                for spot in summary.get('spots', ()):
+                    entry['spots'][spot['spot_id']] = spot['available']
+
+            window = self.window
+            if window > 0 and self._timer is None:
+                self._timer = threading.Timer(window, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if window <= 0:
+            self.flush()
+
+    def flush(self):
+        """Publish everything buffered so far."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return
+        summaries = [
+            {
+                **entry['summary'],
+                'spots': [
+                    {'spot_id': spot_id, 'available': available}
+                    for spot_id, available in entry['spots'].items()
+                ],
+            }
+            for _, entry in sorted(pending.items())
+        ]
+        self.stage(summaries)
+        publish_lot_updates(summaries, self._channel_layer)
+
+    def stage(self, summaries):
+        """Sequence, record and snapshot summaries about to be published.
+
+        ``flush`` calls this before sending; producers that send frames on
+        their own event loop (the sensor gateway) call it from their DB thread.
+        """
+        for summary in summaries:
+            # Sequence each frame per lot so reconnecting clients can resume
+            summary['sequence'] = changelog.next_sequence(summary['lot_id'])
+            changelog.record(summary['lot_id'], summary['sequence'], summary['spots'])
+        if self._record_history:
+            record_samples(summaries)
+        # Refresh the connect snapshot first so new clients never lag the frames
+        refresh_status_snapshot()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # Timer threads open their own DB connection - don't leak it
+            connections.close_all()
+
+
+broadcaster = CoalescingBroadcaster(record_history=True)
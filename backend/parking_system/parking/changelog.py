@@ -0,0 +1,74 @@
+"""Per-lot sequence numbers and a bounded change log for delta resync.
+
+Every ``batch_update`` frame published for a lot takes the next value of that
+lot's sequence (an atomic cache INCR) and is appended to the lot's change log,
+which keeps the last ``PARKING_CHANGE_LOG_SIZE`` entries. A reconnecting client
+sends the last sequence it saw per lot; if the log still holds every entry
+after it, the client gets only the merged deltas, otherwise a full lot
+snapshot.
+
+Appends are read-modify-write on the cache. A lost append (two workers
+appending to the same lot at once) shows up as a gap in the sequence and
+makes ``changes_since`` fall back to a snapshot, so it never produces a wrong
+delta. Like the other shared state, this needs a shared cache (Redis) when
+producers and consumers run in different processes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .counters import bump_counter
+
+SEQUENCE_KEY = 'parking_changes:sequence:{}'
+LOG_KEY = 'parking_changes:log:{}'
+
+
+def _log_size():
+    return getattr(settings, 'PARKING_CHANGE_LOG_SIZE', 256)
+
+
+def next_sequence(lot_id):
+    # Clock-seeded: after a cache flush, resuming clients fall back to a
+    # snapshot instead of being matched against reused sequence numbers
+    return bump_counter(SEQUENCE_KEY.format(lot_id))
+
+
+def current_sequence(lot_id):
+    return cache.get(SEQUENCE_KEY.format(lot_id), 0)
+
+
+def record(lot_id, sequence, spots):
+    """Append one published change set: (sequence, {spot_id: available})."""
+    key = LOG_KEY.format(lot_id)
+    entries = cache.get(key) or []
+    entries.append((sequence, {spot['spot_id']: spot['available'] for spot in spots}))
+    entries.sort(key=lambda entry: entry[0])
+    cache.set(key, entries[-_log_size():], timeout=None)
+
+
+def changes_since(lot_id, last_seen):
+    """Return (latest_sequence, merged {spot_id: available}) after ``last_seen``.
+
+    The merged changes are None when the log can no longer prove it covers
+    the whole range (truncated, lost appends, or a client ahead of the
+    server) - the caller should send a full snapshot instead.
+    """
+    latest = current_sequence(lot_id)
+    if last_seen == latest:
+        return latest, {}
+    if last_seen > latest:
+        return latest, None
+    expected = last_seen + 1
+    merged = {}
+    for sequence, spots in cache.get(LOG_KEY.format(lot_id)) or []:
+        if sequence <= last_seen:
+            continue
+        if sequence > latest:
+            # Appended after we read the sequence - the next frame carries it
+            break
+        if sequence != expected:
+            return latest, None
+        merged.update(spots)
+        expected += 1
+    if expected != latest + 1:
+        return latest, None
+    return latest, merged
@@ -1,22 +1,51 @@
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from parking.models import ParkingLot, ParkingSpot
+from parking import changelog
+from parking.availability_index import availability_index
+from parking.broadcast import SUMMARY_GROUP, lot_group
+from parking.models import ParkingLot
+from parking.permits import permit_bit
+from parking.restrictions import resolver as restrictions
+from parking.snapshot import status_frame
+
+# Upper bound on lot groups a single connection may join
+MAX_SUBSCRIPTIONS = 50
 
 
 class ParkingConsumer(AsyncWebsocketConsumer):
+    """Live parking updates.
+
+    Every client receives aggregated ``lots_summary`` frames. Spot-level
+    updates are opt-in per lot:
+
+        {"type": "subscribe", "lot_ids": [1, 2]}
+        {"type": "subscribe", "permit": 3}        # every lot open to a permit
+        {"type": "unsubscribe", "lot_ids": [2]}
+        {"type": "set_mode", "mode": "summary"}   # or "detail"
+        {"type": "resume", "sequences": {"1": 42}}  # last sequence seen per lot
+
+    Summary mode drops all lot subscriptions and ignores new ones; it can also
+    be chosen at connect time with ``?mode=summary``. ``resume`` answers with a
+    ``lot_delta`` (only the spots that changed since) or, when the client is
+    too far behind, a full ``lot_snapshot`` per lot.
+    """
+
     async def connect(self):
-        await self.channel_layer.group_add('parking_updates', self.channel_name)
+        self.lot_ids = set()
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.summary_only = query.get('mode', ['detail'])[0] == 'summary'
+
+        await self.channel_layer.group_add(SUMMARY_GROUP, self.channel_name)
         await self.accept()
-        # Send initial state on connect
-        initial_state = await self.get_all_lots_status()
-        await self.send(text_data=json.dumps({
-            'type': 'initial_state',
-            'data': initial_state
-        }))
+        # Send initial state on connect (pre-serialized shared snapshot)
+        await self.send(text_data=await self.get_status_frame('initial_state'))
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard('parking_updates', self.channel_name)
+        await self.channel_layer.group_discard(SUMMARY_GROUP, self.channel_name)
+        for lot_id in getattr(self, 'lot_ids', ()):
+            await self.channel_layer.group_discard(lot_group(lot_id), self.channel_name)
 
     async def receive(self, text_data):
         """Handle incoming messages from client."""
@@ -26,11 +55,7 @@ class ParkingConsumer(AsyncWebsocketConsumer):
 
             if msg_type == 'get_status':
                 # Client requesting current status
-                status = await self.get_all_lots_status()
-                await self.send(text_data=json.dumps({
-                    'type': 'status_update',
-                    'data': status
-                }))
+                await self.send(text_data=await self.get_status_frame('status_update'))
             elif msg_type == 'get_lot_spots':
                 # Client requesting spots for a specific lot
                 lot_id = data.get('lot_id')
@@ -41,9 +66,87 @@ class ParkingConsumer(AsyncWebsocketConsumer):
                         'lot_id': lot_id,
                         'data': spots
                     }))
+            elif msg_type == 'subscribe' and 'permit' in data:
+                await self.subscribe_permit(data.get('permit'))
+            elif msg_type == 'subscribe':
+                await self.subscribe(data.get('lot_ids'))
+            elif msg_type == 'unsubscribe':
+                await self.unsubscribe(data.get('lot_ids'))
+            elif msg_type == 'set_mode':
+                await self.set_mode(data.get('mode'))
+            elif msg_type == 'resume':
+                await self.resume(data.get('sequences'))
         except json.JSONDecodeError:
             pass
 
+    async def subscribe(self, lot_ids):
+        lot_ids = self.parse_lot_ids(lot_ids)
+        if lot_ids is None:
+            return await self.send_error('lot_ids must be a list of integers')
+        if self.summary_only:
+            return await self.send_error('Subscriptions are disabled in summary mode')
+        new_ids = lot_ids - self.lot_ids
+        if len(self.lot_ids) + len(new_ids) > MAX_SUBSCRIPTIONS:
+            return await self.send_error(f'At most {MAX_SUBSCRIPTIONS} lot subscriptions allowed')
+        for lot_id in new_ids:
+            await self.channel_layer.group_add(lot_group(lot_id), self.channel_name)
+        self.lot_ids |= new_ids
+        await self.send_subscriptions()
+
+    async def subscribe_permit(self, permit):
+        if not isinstance(permit, int) or isinstance(permit, bool):
+            return await self.send_error('permit must be an integer')
+        await self.subscribe(await self.get_permit_lot_ids(permit))
+
+    async def unsubscribe(self, lot_ids):
+        lot_ids = self.parse_lot_ids(lot_ids)
+        if lot_ids is None:
+            return await self.send_error('lot_ids must be a list of integers')
+        for lot_id in lot_ids & self.lot_ids:
+            await self.channel_layer.group_discard(lot_group(lot_id), self.channel_name)
+        self.lot_ids -= lot_ids
+        await self.send_subscriptions()
+
+    async def set_mode(self, mode):
+        if mode not in ('summary', 'detail'):
+            return await self.send_error("mode must be 'summary' or 'detail'")
+        self.summary_only = mode == 'summary'
+        if self.summary_only:
+            await self.unsubscribe(list(self.lot_ids))
+        else:
+            await self.send_subscriptions()
+
+    async def resume(self, sequences):
+        try:
+            sequences = {int(lot_id): int(seen) for lot_id, seen in sequences.items()}
+        except (AttributeError, TypeError, ValueError):
+            return await self.send_error('sequences must map lot ids to sequence numbers')
+        if len(sequences) > MAX_SUBSCRIPTIONS:
+            return await self.send_error(f'At most {MAX_SUBSCRIPTIONS} lots can be resumed')
+        for frame in await self.get_resume_frames(sequences):
+            await self.send(text_data=json.dumps(frame))
+
+    @staticmethod
+    def parse_lot_ids(lot_ids):
+        if not isinstance(lot_ids, list) or not all(
+            isinstance(lot_id, int) and not isinstance(lot_id, bool) for lot_id in lot_ids
+        ):
+            return None
+        return set(lot_ids)
+
+    async def send_subscriptions(self):
+        await self.send(text_data=json.dumps({
+            'type': 'subscriptions',
+            'mode': 'summary' if self.summary_only else 'detail',
+            'lot_ids': sorted(self.lot_ids),
+        }))
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'message': message
+        }))
+
     async def parking_update(self, event):
         """Broadcast parking update to connected client."""
         await self.send(text_data=json.dumps({
@@ -58,34 +161,54 @@ class ParkingConsumer(AsyncWebsocketConsumer):
             'data': event['data']
         }))
 
+    async def lots_summary(self, event):
+        """Broadcast aggregated lot counters (no spot detail)."""
+        await self.send(text_data=json.dumps({
+            'type': 'lots_summary',
+            'data': event['data']
+        }))
+
+    @database_sync_to_async
+    def get_status_frame(self, message_type):
+        """Status of all lots from the shared snapshot (rebuilt single-flight)."""
+        return status_frame(message_type)
+
+    @database_sync_to_async
+    def get_resume_frames(self, sequences):
+        """Delta frames from the change log, or snapshots when it can't cover the gap."""
+        frames = []
+        restricted = restrictions.restricted_lots()
+        for lot_id, last_seen in sorted(sequences.items()):
+            sequence, changes = changelog.changes_since(lot_id, last_seen)
+            if changes is not None:
+                frames.append({
+                    'type': 'lot_delta',
+                    'lot_id': lot_id,
+                    'from_sequence': last_seen,
+                    'sequence': sequence,
+                    'spots': [
+                        {'spot_id': spot_id, 'available': available}
+                        for spot_id, available in changes.items()
+                    ],
+                })
+            else:
+                frames.append({
+                    'type': 'lot_snapshot',
+                    'lot_id': lot_id,
+                    'sequence': sequence,
+                    'restricted': lot_id in restricted,
+                    'spots': availability_index.lot_spots(lot_id),
+                })
+        return frames
+
     @database_sync_to_async
-    def get_all_lots_status(self):
-        """Get current status of all parking lots."""
-        lots = ParkingLot.objects.all().order_by('parking_lot_id')
-        result = []
-        for lot in lots:
-            total = lot.spots.count()
-            available = lot.spots.filter(availability=True).count()
-            result.append({
-                'lot_id': lot.parking_lot_id,
-                'lot_name': lot.parking_lot_name,
-                'total_spots': total,
-                'available_spots': available,
-                'occupancy': total - available,
-                'occupancy_percent': round((total - available) / total * 100, 1) if total > 0 else 0
-            })
-        return result
+    def get_permit_lot_ids(self, permit_id):
+        """Lots open to a permit - one predicate on the lot permit mask."""
+        return list(ParkingLot.objects.filter(
+            permit_mask__hasbit=permit_bit(permit_id)
+        ).order_by('parking_lot_id').values_list('parking_lot_id', flat=True))
 
     @database_sync_to_async
     def get_lot_spots(self, lot_id):
-        """Get all spots for a specific lot."""
-        spots = ParkingSpot.objects.filter(
-            parking_lot_id=lot_id
-        ).order_by('parking_spot_id')
-        return [
-            {
-                'spot_id': spot.parking_spot_id,
-                'available': spot.availability
-            }
-            for spot in spots
-        ]
+        """Get all spots for a specific lot from the in-memory bitmap index."""
+        return availability_index.lot_spots(int(lot_id))
@@ -0,0 +1,35 @@
+"""Versions, generations and sequences kept as counters in the shared cache.
+
+Clients hold on to these numbers (ETags, WebSocket sequences) and workers
+compare them with their local copies, so a counter must never run through
+values it has had before. A missing counter - first use, a flushed or
+restarted cache - is therefore seeded from the clock (microseconds), which
+is far above anything it handed out earlier, instead of from 0.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def clock_seed():
+    return time.time_ns() // 1000
+
+
+def read_counter(key):
+    """Current value of ``key``, seeding it if missing."""
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, clock_seed(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def seed_counter(key):
+    """Create ``key`` from the clock unless it exists; no-op otherwise."""
+    cache.add(key, clock_seed(), timeout=None)
+
+
+def bump_counter(key):
+    """Increment ``key`` (seeding it if missing) and return the new value."""
+    seed_counter(key)
+    return cache.incr(key)
@@ -0,0 +1,59 @@
+"""ETags for the dashboard and lot endpoints, built from state versions.
+
+Responses are tagged with counters that already move on every change, so a
+tag can be computed without touching the database:
+
+- the status generation (``snapshot.GENERATION_KEY``) for lists - bumped on
+  every availability, lot and permit mapping change;
+- the lot's availability index version (``availability_index.VERSION_KEY``)
+  for a single lot - bumped after every committed change to its spots - plus
+  the catalog version, bumped when lot or permit metadata changes.
+
+Versions are always read *before* the response data, so a tag is never newer
+than the body it is sent with. Every counter a tag is built from is seeded
+from the clock when missing (``counters.py``), so a cache flush can never
+make an old tag valid again.
+"""
+from django.utils.cache import get_conditional_response
+
+from .availability_index import VERSION_KEY
+from .counters import bump_counter, read_counter
+from .snapshot import GENERATION_KEY
+
+CATALOG_KEY = 'parking_state:catalog'
+
+
+def global_version():
+    return read_counter(GENERATION_KEY)
+
+
+def lot_version(lot_id):
+    return f'{read_counter(VERSION_KEY.format(lot_id))}.{read_counter(CATALOG_KEY)}'
+
+
+def bump_catalog():
+    """Lot or permit metadata changed; single-lot tags must change too."""
+    return bump_counter(CATALOG_KEY)
+
+
+def make_etag(*parts):
+    return 'W/"{}"'.format('-'.join(str(part) for part in parts if part not in (None, '')))
+
+
+def tagged(response, etag):
+    response['ETag'] = etag
+    return response
+
+
+def conditional(request, etag, respond):
+    """304 if the client's If-None-Match matches ``etag``, else ``respond()``.
+
+    Either way the response carries an ETag; ``respond`` may set its own when
+    it serves a value built for an older version.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = respond()
+    if (200 <= response.status_code < 300 or response.status_code == 304) and not response.has_header('ETag'):
+        response['ETag'] = etag
+    return response
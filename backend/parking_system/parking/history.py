@@ -0,0 +1,299 @@
+"""Occupancy history: raw samples plus per-lot rollups.
+
+Producers never insert per spot change. The broadcaster appends one
+``OccupancySample`` per lot per flush with a single ``bulk_create``
+(``record_samples``), so sample volume follows the broadcast window rather
+than the sensor rate.
+
+Rollups are built in tiers - 1-minute buckets from raw samples, 15-minute
+buckets from 1-minute ones, hourly from 15-minute ones. Samples are only
+written on change, so a minute bucket weights each value by how long it
+held, starting from the value the previous bucket ended on
+(``last_occupancy``): a steady lot still gets a bucket every minute, and a
+burst of changes doesn't outweigh the quiet rest of the minute. Coarser
+tiers average their (equal-length) source buckets.
+
+``rollup_all`` aggregates complete buckets after the newest one already
+stored, once they are ``PARKING_ROLLUP_GRACE_SECONDS`` old - samples
+committed a little late still land in their bucket - so it is cheap to run
+every minute (``manage.py rollup_occupancy --every 60``).
+
+``lot_history`` answers chart queries from the rollup tier matching the
+requested range, so a week reads ~170 hourly rows instead of every sample.
+"""
+from datetime import UTC, datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import OccupancyRollup, OccupancySample, ParkingLot
+
+RAW = 'raw'
+
+BUCKET_WIDTHS = {
+    OccupancyRollup.MINUTE: timedelta(minutes=1),
+    OccupancyRollup.QUARTER_HOUR: timedelta(minutes=15),
+    OccupancyRollup.HOUR: timedelta(hours=1),
+}
+
+# Each tier is aggregated from the one before it (None = raw samples)
+ROLLUP_SOURCES = {
+    OccupancyRollup.MINUTE: None,
+    OccupancyRollup.QUARTER_HOUR: OccupancyRollup.MINUTE,
+    OccupancyRollup.HOUR: OccupancyRollup.QUARTER_HOUR,
+}
+
+# Most buckets a history response should contain
+HISTORY_MAX_POINTS = 500
+# Raw samples follow the broadcast rate - only serve them for short ranges
+RAW_MAX_SPAN = timedelta(hours=1)
+
+WRITE_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 2000
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+
+
+def bucket_floor(moment, width):
+    """Start of the bucket of ``width`` that contains ``moment``."""
+    return moment - (moment - _EPOCH) % width
+
+
+def record_samples(summaries, recorded_at=None):
+    """Append one sample per lot summary in a single bulk insert."""
+    recorded_at = recorded_at or timezone.now()
+    samples = [
+        OccupancySample(
+            parking_lot_id=summary['lot_id'],
+            recorded_at=recorded_at,
+            occupancy=summary['occupancy'],
+            total_spots=summary['total_spots'],
+        )
+        for summary in summaries
+    ]
+    OccupancySample.objects.bulk_create(samples, batch_size=WRITE_BATCH_SIZE)
+    return len(samples)
+
+
+def _save_rollups(rollups):
+    # Upsert so re-running a range (or a crashed run) never duplicates buckets
+    OccupancyRollup.objects.bulk_create(
+        rollups,
+        batch_size=WRITE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['parking_lot', 'granularity', 'bucket_start'],
+        update_fields=[
+            'samples', 'avg_occupancy', 'min_occupancy', 'max_occupancy', 'total_spots', 'last_occupancy',
+        ],
+    )
+
+
+def _starting_values(start, width, samples):
+    """{lot_id: (occupancy, total)} each lot holds when the bucket at ``start`` opens."""
+    values = {
+        lot_id: (occupancy, total)
+        for lot_id, occupancy, total in OccupancyRollup.objects.filter(
+            granularity=OccupancyRollup.MINUTE, bucket_start=start - width, last_occupancy__isnull=False
+        ).values_list('parking_lot_id', 'last_occupancy', 'total_spots')
+    }
+    sampled = set(samples.values_list('parking_lot_id', flat=True).distinct())
+    # Lots without history that don't change now either hold their live counters
+    for lot_id, occupancy, total in ParkingLot.objects.values_list(
+        'parking_lot_id', 'occupancy', 'total_spots'
+    ):
+        if lot_id not in values and lot_id not in sampled:
+            values[lot_id] = (occupancy, total)
+    return values
+
+
+def _minute_rollups(start, end, width):
+    """Buckets from raw samples, each value weighted by how long it held."""
+    samples = OccupancySample.objects.filter(recorded_at__lt=end)
+    if start is None:
+        first = samples.order_by('recorded_at').values_list('recorded_at', flat=True).first()
+        if first is None:
+            # No history to anchor the first bucket to yet
+            return
+        start = bucket_floor(first, width)
+    samples = samples.filter(recorded_at__gte=start)
+    values = _starting_values(start, width, samples)
+    rows = samples.order_by('recorded_at').values_list(
+        'parking_lot_id', 'recorded_at', 'occupancy', 'total_spots'
+    ).iterator(chunk_size=READ_CHUNK_SIZE)
+    row = next(rows, None)
+
+    bucket = start
+    while bucket < end:
+        bucket_end = bucket + width
+        # {lot_id: [occupancy-seconds, samples, min, max, covered since, last change]}
+        stats = {lot_id: [0.0, 0, value, value, bucket, bucket] for lot_id, (value, _) in values.items()}
+        while row is not None and row[1] < bucket_end:
+            lot_id, moment, occupancy, total = row
+            entry = stats.get(lot_id)
+            if entry is None:
+                # First sample of a lot without history: the bucket starts here
+                stats[lot_id] = entry = [0.0, 0, occupancy, occupancy, moment, moment]
+            else:
+                entry[0] += values[lot_id][0] * (moment - entry[5]).total_seconds()
+                entry[2] = min(entry[2], occupancy)
+                entry[3] = max(entry[3], occupancy)
+                entry[5] = moment
+            entry[1] += 1
+            values[lot_id] = (occupancy, total)
+            row = next(rows, None)
+        for lot_id, (weighted, count, low, high, since, changed) in stats.items():
+            occupancy, total = values[lot_id]
+            weighted += occupancy * (bucket_end - changed).total_seconds()
+            yield OccupancyRollup(
+                parking_lot_id=lot_id,
+                granularity=OccupancyRollup.MINUTE,
+                bucket_start=bucket,
+                samples=count,
+                avg_occupancy=weighted / (bucket_end - since).total_seconds(),
+                min_occupancy=low,
+                max_occupancy=high,
+                total_spots=total,
+                last_occupancy=occupancy,
+            )
+        if not values and row is not None:
+            # Nothing to carry - skip the empty stretch
+            bucket = max(bucket_end, bucket_floor(row[1], width))
+        else:
+            bucket = bucket_end
+
+
+def _tier_rollups(granularity, start, end, width):
+    """Buckets averaged from the finer tier's buckets (all of one length)."""
+    rows = OccupancyRollup.objects.filter(granularity=ROLLUP_SOURCES[granularity], bucket_start__lt=end)
+    if start is not None:
+        rows = rows.filter(bucket_start__gte=start)
+    rows = rows.order_by('bucket_start').values_list(
+        'parking_lot_id', 'bucket_start', 'samples', 'avg_occupancy',
+        'min_occupancy', 'max_occupancy', 'total_spots', 'last_occupancy'
+    )
+    # Source rows arrive in time order, so a bucket is final once a later one starts
+    current_bucket = None
+    buckets = {}
+
+    def close_buckets():
+        for lot_id, (count, sources, total_occupancy, low, high, total, last) in buckets.items():
+            yield OccupancyRollup(
+                parking_lot_id=lot_id,
+                granularity=granularity,
+                bucket_start=current_bucket,
+                samples=count,
+                avg_occupancy=total_occupancy / sources,
+                min_occupancy=low,
+                max_occupancy=high,
+                total_spots=total,
+                last_occupancy=last,
+            )
+        buckets.clear()
+
+    for lot_id, moment, count, avg, low, high, total, last in rows.iterator(chunk_size=READ_CHUNK_SIZE):
+        bucket = bucket_floor(moment, width)
+        if bucket != current_bucket:
+            yield from close_buckets()
+            current_bucket = bucket
+        entry = buckets.get(lot_id)
+        if entry is None:
+            buckets[lot_id] = [count, 1, avg, low, high, total, last]
+        else:
+            entry[0] += count
+            entry[1] += 1
+            entry[2] += avg
+            entry[3] = min(entry[3], low)
+            entry[4] = max(entry[4], high)
+            # Latest size and value of the lot win
+            entry[5] = total
+            entry[6] = last
+    yield from close_buckets()
+
+
+def rollup(granularity, now=None):
+    """Aggregate complete buckets of ``granularity`` not rolled up yet.
+
+    Returns the number of rollup rows written.
+    """
+    width = BUCKET_WIDTHS[granularity]
+    grace = timedelta(seconds=getattr(settings, 'PARKING_ROLLUP_GRACE_SECONDS', 30))
+    end = bucket_floor((now or timezone.now()) - grace, width)
+    last = OccupancyRollup.objects.filter(granularity=granularity).aggregate(
+        last=Max('bucket_start')
+    )['last']
+    start = last + width if last is not None else None
+    if start is not None and start >= end:
+        return 0
+
+    if ROLLUP_SOURCES[granularity] is None:
+        rollups = _minute_rollups(start, end, width)
+    else:
+        rollups = _tier_rollups(granularity, start, end, width)
+    written = 0
+    pending = []
+    for row in rollups:
+        pending.append(row)
+        if len(pending) >= WRITE_BATCH_SIZE:
+            _save_rollups(pending)
+            written += len(pending)
+            pending = []
+    if pending:
+        _save_rollups(pending)
+        written += len(pending)
+    return written
+
+
+def rollup_all(now=None):
+    """Run every tier finest-first; returns {granularity: rows written}."""
+    now = now or timezone.now()
+    return {granularity: rollup(granularity, now) for granularity in ROLLUP_SOURCES}
+
+
+def choose_granularity(start, end):
+    """Finest rollup tier that keeps the range within HISTORY_MAX_POINTS buckets."""
+    span = end - start
+    for granularity, width in BUCKET_WIDTHS.items():
+        if span / width <= HISTORY_MAX_POINTS:
+            return granularity
+    return OccupancyRollup.HOUR
+
+
+def _point(moment, avg, low, high, total):
+    return {
+        'time': moment.isoformat(),
+        'avg_occupancy': round(avg, 2),
+        'min_occupancy': low,
+        'max_occupancy': high,
+        'total_spots': total,
+        'occupancy_percent': round(avg / total * 100, 1) if total > 0 else 0,
+    }
+
+
+def lot_history(lot_id, start, end, granularity=None):
+    """Return (granularity, points) for a lot between ``start`` and ``end``.
+
+    Raises ValueError for raw ranges longer than ``RAW_MAX_SPAN``.
+    """
+    granularity = granularity or choose_granularity(start, end)
+    if granularity == RAW:
+        if end - start > RAW_MAX_SPAN:
+            raise ValueError('raw history is limited to one hour')
+        rows = OccupancySample.objects.filter(
+            parking_lot_id=lot_id, recorded_at__gte=start, recorded_at__lt=end
+        ).order_by('recorded_at').values_list('recorded_at', 'occupancy', 'total_spots')
+        return granularity, [
+            _point(moment, occupancy, occupancy, occupancy, total)
+            for moment, occupancy, total in rows
+        ]
+
+    rows = OccupancyRollup.objects.filter(
+        parking_lot_id=lot_id,
+        granularity=granularity,
+        bucket_start__gte=bucket_floor(start, BUCKET_WIDTHS[granularity]),
+        bucket_start__lt=end,
+    ).order_by('bucket_start').values_list(
+        'bucket_start', 'avg_occupancy', 'min_occupancy', 'max_occupancy', 'total_spots'
+    )
+    return granularity, [_point(*row) for row in rows]
+
@@ -0,0 +1,173 @@
+"""Bulk sensor ingest - applies batches of spot readings with set-based UPDATEs."""
+from collections import defaultdict
+from datetime import UTC, datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import sessions
+from .availability_index import availability_index
+from .broadcast import lot_summary
+from .models import ParkingLot, ParkingSpot
+
+# Keep IN (...) lists under SQLite's bound-parameter limit
+CHUNK_SIZE = 900
+
+
+class InvalidReading(ValueError):
+    """A reading in the batch could not be parsed."""
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _parse_timestamp(value):
+    """Sensor timestamps are epoch seconds or ISO-8601 strings (optional)."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise InvalidReading(f'Invalid sensor_timestamp: {value!r}')
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise InvalidReading(f'Invalid sensor_timestamp: {value!r}')
+        if timezone.is_naive(parsed):
+            parsed = parsed.replace(tzinfo=UTC)
+        return parsed.timestamp()
+    raise InvalidReading(f'Invalid sensor_timestamp: {value!r}')
+
+
+def reading_time(timestamp):
+    """Aware datetime of a parsed sensor timestamp (None stays None)."""
+    return None if timestamp is None else datetime.fromtimestamp(timestamp, UTC)
+
+
+def parse_readings(raw):
+    """Normalize a batch into {spot_id: (available, timestamp)}.
+
+    Each reading is either a compact ``[spot_id, available, sensor_timestamp]``
+    triple or an object with the same keys. When a spot is reported more than
+    once, the newest reading wins; readings without a timestamp are ordered by
+    their position in the batch.
+    """
+    if not isinstance(raw, list):
+        raise InvalidReading('readings must be a list')
+
+    latest = {}
+    for reading in raw:
+        if isinstance(reading, dict):
+            spot_id = reading.get('spot_id')
+            available = reading.get('available')
+            timestamp = reading.get('sensor_timestamp')
+        elif isinstance(reading, (list, tuple)) and len(reading) in (2, 3):
+            spot_id, available = reading[0], reading[1]
+            timestamp = reading[2] if len(reading) == 3 else None
+        else:
+            raise InvalidReading(f'Malformed reading: {reading!r}')
+
+        if isinstance(spot_id, bool) or not isinstance(spot_id, int):
+            raise InvalidReading(f'Invalid spot_id: {spot_id!r}')
+        if available not in (True, False):
+            raise InvalidReading(f'Invalid available flag for spot {spot_id}: {available!r}')
+        timestamp = _parse_timestamp(timestamp)
+
+        if supersedes(timestamp, latest.get(spot_id)):
+            latest[spot_id] = (bool(available), timestamp)
+    return latest
+
+
+def supersedes(timestamp, previous):
+    """Whether a reading at ``timestamp`` replaces ``previous`` (available, timestamp).
+
+    Out-of-order readings lose to newer ones; readings without a timestamp
+    go by arrival order.
+    """
+    return previous is None or None in (previous[1], timestamp) or timestamp >= previous[1]
+
+
+def merge_readings(into, readings):
+    """Fold parsed readings into ``into`` (both {spot_id: (available, timestamp)})."""
+    for spot_id, reading in readings.items():
+        if supersedes(reading[1], into.get(spot_id)):
+            into[spot_id] = reading
+    return into
+
+
+def apply_readings(readings):
+    """Apply parsed readings and return one summary per lot that changed.
+
+    Spots whose state already matches the reading are skipped, so replaying a
+    batch is a no-op. Changes are written with one UPDATE per (lot, state)
+    group, each affected lot's counters are adjusted once, and sessions are
+    opened and closed in bulk at the sensor timestamps.
+
+    The current states are read with the rows locked, so every planned change
+    is one the UPDATEs make: a spot a concurrent writer already flipped is
+    seen in its new state and skipped, never re-sent to the index, sessions
+    or summaries as this batch's change.
+    """
+    if not readings:
+        return []
+
+    with transaction.atomic():
+        current = {}
+        # Lock in id order so concurrent batches can't deadlock
+        for chunk in _chunks(sorted(readings)):
+            current.update(
+                (spot_id, (lot_id, available))
+                for spot_id, lot_id, available in ParkingSpot.objects.select_for_update().filter(
+                    parking_spot_id__in=chunk
+                ).values_list('parking_spot_id', 'parking_lot_id', 'availability')
+            )
+
+        changes = defaultdict(lambda: {True: [], False: []})
+        for spot_id, (available, _) in readings.items():
+            state = current.get(spot_id)
+            if state is None or state[1] == available:
+                continue
+            changes[state[0]][available].append(spot_id)
+
+        if not changes:
+            return []
+
+        lot_ids = sorted(changes)
+        for lot_id in lot_ids:
+            freed = 0
+            for available, spot_ids in changes[lot_id].items():
+                for chunk in _chunks(spot_ids):
+                    # Filtering on the old state keeps concurrent writers idempotent
+                    updated = ParkingSpot.objects.filter(
+                        parking_spot_id__in=chunk, availability=not available
+                    ).update(availability=available)
+                    freed += updated if available else -updated
+            ParkingLot.adjust_counters(lot_id, available=freed, occupied=-freed)
+
+        availability_index.apply(
+            (lot_id, spot_id, available)
+            for lot_id in lot_ids
+            for available, spot_ids in changes[lot_id].items()
+            for spot_id in spot_ids
+        )
+        sessions.apply_transitions(
+            (spot_id, available, reading_time(readings[spot_id][1]))
+            for lot_id in lot_ids
+            for available, spot_ids in changes[lot_id].items()
+            for spot_id in spot_ids
+        )
+
+    lots = ParkingLot.objects.filter(parking_lot_id__in=lot_ids).order_by('parking_lot_id')
+
+    return [
+        lot_summary(lot, (
+            {'spot_id': spot_id, 'available': available}
+            for available, spot_ids in changes[lot.parking_lot_id].items()
+            for spot_id in spot_ids
+        ))
+        for lot in lots
+    ]
+
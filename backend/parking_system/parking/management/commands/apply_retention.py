@@ -0,0 +1,53 @@
+import time
+from django.core.management.base import BaseCommand
+from parking.retention import DELETE_CHUNK_SIZE, apply_retention
+
+
+class Command(BaseCommand):
+    help = 'Deletes occupancy history past its retention tier (raw 48h, 1-minute 30d, hourly forever by default)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many rows would be removed without deleting'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DELETE_CHUNK_SIZE,
+            help=f'Rows deleted per statement (default: {DELETE_CHUNK_SIZE})'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to sleep between delete chunks (default: 0)'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        started = time.monotonic()
+        report = apply_retention(
+            chunk_size=options['chunk_size'],
+            pause=options['pause'],
+            dry_run=dry_run,
+        )
+        elapsed = time.monotonic() - started
+
+        verb = 'would remove' if dry_run else 'removed'
+        for tier, result in report.items():
+            if result['cutoff'] is None:
+                self.stdout.write(f'  {tier}: kept (no expiry or not rolled up yet)')
+                continue
+            self.stdout.write(
+                f"  {tier}: {verb} {result['removed']} row(s) older than "
+                f"{result['cutoff'].isoformat()} in {result['seconds']:.2f}s"
+            )
+
+        total = sum(result['removed'] for result in report.values())
+        message = f'Retention {verb} {total} row(s) in {elapsed:.2f}s'
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Dry run: {message}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,231 @@
+import asyncio
+import json
+import random
+import time
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.test import override_settings
+from parking.broadcast import CoalescingBroadcaster, broadcaster
+from parking.consumers import ParkingConsumer
+from parking.ingest import apply_readings
+from parking.models import OccupancySample, ParkingSpot, Session
+
+# Everything stays in this process - no Redis for channels or the shared cache
+LOCAL_SETTINGS = {
+    'CHANNEL_LAYERS': {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {'capacity': 10000},
+        },
+    },
+    'CACHES': {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    },
+}
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Drives sensor ingest at a fixed event rate and measures end-to-end latency '
+            'to simulated WebSocket clients (in-memory channel layer, no Redis)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=200.0,
+                            help='Spot changes per second, open-loop (default: 200)')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Seconds to generate load (default: 10)')
+        parser.add_argument('--lots', type=int, default=10,
+                            help='Number of lots to spread events across (default: 10)')
+        parser.add_argument('--clients', type=int, default=50,
+                            help='Simulated WebSocket clients (default: 50)')
+        parser.add_argument('--tick', type=float, default=0.05,
+                            help='Seconds between ingest batches (default: 0.05)')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed for event generation')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the results as JSON')
+        parser.add_argument('--i-know', action='store_true',
+                            help='Flip spots in the configured database (they, their sessions and '
+                                 'samples are restored afterwards; live sensor changes meanwhile are lost)')
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0 or options['duration'] <= 0 or options['tick'] <= 0:
+            raise CommandError('--rate, --duration and --tick must be positive')
+        if not options['i_know']:
+            raise CommandError(
+                'loadgen writes spot changes, sessions and samples to the configured database - '
+                'run it against a throwaway database, or pass --i-know'
+            )
+        self.random = random.Random(options['seed'])
+
+        lots = {}
+        for spot_id, lot_id, available in ParkingSpot.objects.order_by(
+            'parking_lot_id', 'parking_spot_id'
+        ).values_list('parking_spot_id', 'parking_lot_id', 'availability'):
+            if lot_id not in lots and len(lots) == options['lots']:
+                break
+            lots.setdefault(lot_id, {})[spot_id] = available
+        if not lots:
+            raise CommandError('No parking spots found - run seed_data first')
+
+        original = {spot_id: available for spots in lots.values() for spot_id, available in spots.items()}
+        marks = {
+            'session': Session.objects.aggregate(last=Max('session_id'))['last'] or 0,
+            'sample': OccupancySample.objects.aggregate(last=Max('sample_id'))['last'] or 0,
+            'open': list(Session.objects.filter(
+                parking_spot__parking_lot_id__in=lots, end_time__isnull=True
+            ).values_list('session_id', flat=True)),
+        }
+        try:
+            with override_settings(**LOCAL_SETTINGS):
+                results = async_to_sync(self.run)(lots, options)
+        finally:
+            self.restore(original, marks)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.report(results)
+
+    def restore(self, original, marks):
+        """Put the spots back and drop the sessions and samples the run wrote."""
+        summaries = apply_readings({spot_id: (available, None) for spot_id, available in original.items()})
+        if summaries:
+            # Outside LOCAL_SETTINGS: versions and snapshots in the real cache move on,
+            # so nothing read from the database during the run stays cached
+            broadcaster.add_many(summaries)
+            broadcaster.flush()
+        Session.objects.filter(session_id__gt=marks['session']).delete()
+        Session.objects.filter(session_id__in=marks['open']).update(end_time=None)
+        OccupancySample.objects.filter(sample_id__gt=marks['sample']).delete()
+
+    async def run(self, lots, options):
+        self.lots = lots
+        self.lot_ids = sorted(lots)
+        self.spot_ids = {lot_id: list(spots) for lot_id, spots in lots.items()}
+        # Publish every batch straight away - the tick already batches events
+        self.broadcaster = CoalescingBroadcaster(window=0)
+        # (spot_id, available) -> when that change was scheduled
+        self.scheduled = {}
+        self.latencies = []
+        self.frames = 0
+        self.apply_times = []
+
+        clients = [await self.connect_client(i) for i in range(options['clients'])]
+        readers = [asyncio.create_task(self.read(client)) for client in clients]
+
+        started = time.perf_counter()
+        generated = await self.produce(options['rate'], options['duration'], options['tick'])
+        elapsed = time.perf_counter() - started
+        await self.drain()
+
+        for reader in readers:
+            reader.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        for client in clients:
+            await client.disconnect()
+
+        ordered = sorted(self.latencies)
+        return {
+            'lots': len(self.lot_ids),
+            'spots': sum(len(spots) for spots in self.lots.values()),
+            'clients': len(clients),
+            'target_rate': options['rate'],
+            'events': generated,
+            'achieved_rate': round(generated / elapsed, 1),
+            'frames_received': self.frames,
+            'deliveries': len(ordered),
+            'batch_apply_ms_p50': self._ms(percentile(sorted(self.apply_times), 0.5)),
+            'latency_ms': {
+                'p50': self._ms(percentile(ordered, 0.5)),
+                'p90': self._ms(percentile(ordered, 0.9)),
+                'p99': self._ms(percentile(ordered, 0.99)),
+                'max': self._ms(ordered[-1] if ordered else None),
+            },
+        }
+
+    async def connect_client(self, index):
+        communicator = WebsocketCommunicator(ParkingConsumer.as_asgi(), '/ws/parking/')
+        connected, _ = await communicator.connect()
+        if not connected:
+            raise CommandError('WebSocket client failed to connect')
+        await communicator.receive_from()  # initial_state
+        lot_id = self.lot_ids[index % len(self.lot_ids)]
+        await communicator.send_json_to({'type': 'subscribe', 'lot_ids': [lot_id]})
+        await communicator.receive_from()  # subscriptions
+        return communicator
+
+    async def read(self, communicator):
+        while True:
+            message = json.loads(await communicator.receive_from(timeout=3600))
+            received = time.perf_counter()
+            self.frames += 1
+            if message['type'] != 'batch_update':
+                continue
+            for spot in message['data']['spots']:
+                scheduled = self.scheduled.get((spot['spot_id'], spot['available']))
+                if scheduled is not None:
+                    self.latencies.append(received - scheduled)
+
+    async def produce(self, rate, duration, tick):
+        """Open-loop: events are due by the clock, whether or not ingest kept up."""
+        started = time.perf_counter()
+        sent = 0
+        total = int(rate * duration)
+        while sent < total:
+            due = min(total, int((time.perf_counter() - started) * rate))
+            if due > sent:
+                readings = {}
+                for n in range(sent, due):
+                    lot_id = self.random.choice(self.lot_ids)
+                    lot = self.lots[lot_id]
+                    spot_id = self.random.choice(self.spot_ids[lot_id])
+                    lot[spot_id] = not lot[spot_id]
+                    readings[spot_id] = (lot[spot_id], None)
+                    # Latency is measured from when the event was due, not sent
+                    self.scheduled[(spot_id, lot[spot_id])] = started + n / rate
+                sent = due
+                await self.apply(readings)
+            await asyncio.sleep(tick)
+        return sent
+
+    @database_sync_to_async
+    def apply(self, readings):
+        started = time.perf_counter()
+        self.broadcaster.add_many(apply_readings(readings))
+        self.apply_times.append(time.perf_counter() - started)
+
+    async def drain(self, quiet=0.5, limit=5.0):
+        """Wait until frames stop arriving (or ``limit`` seconds pass)."""
+        deadline = time.perf_counter() + limit
+        last = -1
+        while time.perf_counter() < deadline and last != self.frames:
+            last = self.frames
+            await asyncio.sleep(quiet)
+
+    @staticmethod
+    def _ms(seconds):
+        return None if seconds is None else round(seconds * 1000, 2)
+
+    def report(self, results):
+        latency = results['latency_ms']
+        self.stdout.write(self.style.SUCCESS('Load generation finished'))
+        self.stdout.write(f"  Lots: {results['lots']} ({results['spots']} spots), clients: {results['clients']}")
+        self.stdout.write(
+            f"  Events: {results['events']} "
+            f"({results['achieved_rate']}/s achieved, {results['target_rate']}/s target)"
+        )
+        self.stdout.write(f"  Frames received: {results['frames_received']}, spot deliveries: {results['deliveries']}")
+        self.stdout.write(f"  Ingest batch p50: {results['batch_apply_ms_p50']} ms")
+        self.stdout.write(
+            f"  End-to-end latency: p50 {latency['p50']} ms, p90 {latency['p90']} ms, "
+            f"p99 {latency['p99']} ms, max {latency['max']} ms"
+        )
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from parking.models import ParkingLot, ParkingSpot
+from parking.permits import mask_drift, rebuild_permit_masks
+
+
+class Command(BaseCommand):
+    help = 'Recounts spots per lot and repairs drifted total/available/occupancy counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drift without writing any changes'
+        )
+        parser.add_argument(
+            '--permit-masks',
+            action='store_true',
+            help='Also rebuild permit access masks from the permit M2M tables '
+                 '(with --dry-run: report how many have drifted)'
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        lots = ParkingLot.objects.annotate(
+            actual_total=Count('spots'),
+            actual_available=Count('spots', filter=Q(spots__availability=True))
+        ).order_by('parking_lot_id')
+
+        repaired = 0
+        for lot in lots:
+            expected = {
+                'total_spots': lot.actual_total,
+                'available_spots': lot.actual_available,
+                'occupancy': lot.actual_total - lot.actual_available,
+            }
+            drift = {
+                field: (getattr(lot, field), value)
+                for field, value in expected.items()
+                if getattr(lot, field) != value
+            }
+            if not drift:
+                continue
+
+            repaired += 1
+            details = ', '.join(f'{field} {old} -> {new}' for field, (old, new) in drift.items())
+            self.stdout.write(f'  {lot.parking_lot_name}: {details}')
+            if not dry_run:
+                ParkingLot.objects.filter(pk=lot.pk).update(**expected)
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f'Dry run: {repaired} lot(s) have drifted counters'))
+            if options['permit_masks']:
+                drift = mask_drift()
+                self.stdout.write(self.style.WARNING(
+                    f'Dry run: {drift[ParkingLot]} lot(s) and {drift[ParkingSpot]} spot(s) '
+                    f'have drifted permit masks'
+                ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Repaired counters on {repaired} lot(s)'))
+            if options['permit_masks']:
+                rebuild_permit_masks()
+                self.stdout.write(self.style.SUCCESS('Rebuilt permit access masks'))
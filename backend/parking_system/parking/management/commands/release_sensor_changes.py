@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from parking.broadcast import broadcaster
+from parking.ingest import apply_readings
+from parking.sensor_filter import sensor_filter
+
+
+class Command(BaseCommand):
+    help = ('Applies debounced sensor changes whose window has passed (sensors that only '
+            'report on change send nothing that would release them)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every',
+            type=float,
+            default=None,
+            help='Keep running and release every N seconds (default: run once)'
+        )
+
+    def handle(self, *args, **options):
+        every = options['every']
+
+        if every is None:
+            self.run_once()
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Releasing held sensor changes every {every}s...'))
+        self.stdout.write('Press Ctrl+C to stop\n')
+        try:
+            while True:
+                close_old_connections()
+                self.run_once()
+                time.sleep(every)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nRelease stopped.'))
+
+    def run_once(self):
+        with sensor_filter.filtered({}) as (accepted, counts):
+            summaries = apply_readings(accepted)
+        if summaries:
+            broadcaster.add_many(summaries)
+            broadcaster.flush()
+        self.stdout.write(
+            f"Released {counts['released']} held change(s), "
+            f"{sum(len(summary['spots']) for summary in summaries)} spot(s) changed"
+        )
@@ -0,0 +1,50 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from parking.history import rollup_all
+from parking.retention import apply_retention
+
+
+class Command(BaseCommand):
+    help = 'Aggregates occupancy samples into 1-minute, 15-minute and hourly rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every',
+            type=float,
+            default=None,
+            help='Keep running and roll up every N seconds (default: run once)'
+        )
+        parser.add_argument(
+            '--retention',
+            action='store_true',
+            help='Also expire history past its retention tier after each rollup'
+        )
+
+    def handle(self, *args, **options):
+        every = options['every']
+        self.retention = options['retention']
+
+        if every is None:
+            self.run_once()
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Rolling up occupancy every {every}s...'))
+        self.stdout.write('Press Ctrl+C to stop\n')
+        try:
+            while True:
+                close_old_connections()
+                self.run_once()
+                time.sleep(every)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nRollups stopped.'))
+
+    def run_once(self):
+        written = rollup_all()
+        details = ', '.join(f'{granularity}: {count}' for granularity, count in written.items())
+        self.stdout.write(f'Rollup rows written ({details})')
+        if self.retention:
+            report = apply_retention()
+            removed = sum(result['removed'] for result in report.values())
+            seconds = sum(result['seconds'] for result in report.values())
+            self.stdout.write(f'Retention removed {removed} row(s) in {seconds:.2f}s')
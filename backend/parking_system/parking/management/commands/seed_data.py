@@ -13,18 +13,19 @@ class Command(BaseCommand):
         visitor, _ = PermitType.objects.get_or_create(name='Visitor')
 
         self.stdout.write('Creating parking lots...')
+        # (name, spots, entrance latitude, longitude); spots are laid out in rows of 10
         lots_data = [
-            ('Perry Street Lot', 25),
-            ('The Cage', 40),
-            ('Duck Pond Lot', 30),
-            ('Drill Field Lot', 20),
-            ('North End Lot', 35),
+            ('Perry Street Lot', 25, 37.2326, -80.4262),
+            ('The Cage', 40, 37.2196, -80.4197),
+            ('Duck Pond Lot', 30, 37.2246, -80.4305),
+            ('Drill Field Lot', 20, 37.2284, -80.4234),
+            ('North End Lot', 35, 37.2347, -80.4223),
         ]
 
-        for lot_name, num_spots in lots_data:
+        for lot_name, num_spots, latitude, longitude in lots_data:
             lot, created = ParkingLot.objects.get_or_create(
                 parking_lot_name=lot_name,
-                defaults={'occupancy': 0}
+                defaults={'occupancy': 0, 'latitude': latitude, 'longitude': longitude}
             )
             lot.permit_types.add(student, faculty)
             
@@ -32,7 +33,9 @@ class Command(BaseCommand):
                 for i in range(num_spots):
                     spot = ParkingSpot.objects.create(
                         parking_lot=lot,
-                        availability=True
+                        availability=True,
+                        latitude=latitude + i // 10 * 0.00005,
+                        longitude=longitude + i % 10 * 0.00005,
                     )
                     spot.lot_permit_access.add(student, faculty)
                 self.stdout.write(f'  Created {lot_name} with {num_spots} spots')
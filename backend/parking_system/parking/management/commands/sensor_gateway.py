@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+import random
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from parking.gateway import (
+    BATCH_SIZE, BATCH_WINDOW, DEFAULT_TOPIC, LocalBroker, LocalTransport, MqttTransport, SensorGateway,
+)
+from parking.models import ParkingSpot
+from parking.sensor_filter import SUPPRESSED, sensor_filter
+
+
+class Command(BaseCommand):
+    help = ('Runs the asyncio sensor gateway: subscribes to sensor topics, applies readings '
+            'in batches and publishes lot updates')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--transport',
+            choices=['mqtt', 'local'],
+            default='mqtt',
+            help='mqtt subscribes to --url (needs aiomqtt); local uses an in-process broker, '
+                 'fed by --simulate (default: mqtt)'
+        )
+        parser.add_argument(
+            '--url',
+            default=os.getenv('MQTT_URL', 'mqtt://localhost:1883'),
+            help='MQTT broker URL (default: $MQTT_URL or mqtt://localhost:1883)'
+        )
+        parser.add_argument('--topic', default=DEFAULT_TOPIC,
+                            help=f'Topic filter to subscribe to (default: {DEFAULT_TOPIC})')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                            help=f'Apply as soon as this many spots are pending (default: {BATCH_SIZE})')
+        parser.add_argument('--batch-window', type=float, default=BATCH_WINDOW,
+                            help=f'Seconds to collect readings per batch (default: {BATCH_WINDOW})')
+        parser.add_argument('--require-signed', action='store_true',
+                            default=getattr(settings, 'PARKING_SENSOR_REQUIRE_SIGNATURE', False),
+                            help='Drop messages that are not signed batches '
+                                 '(default: PARKING_SENSOR_REQUIRE_SIGNATURE)')
+        parser.add_argument('--simulate', type=float, default=0.0,
+                            help='With --transport local: publish this many random readings per second')
+        parser.add_argument('--duration', type=float, default=None,
+                            help='Stop after this many seconds (default: run until Ctrl+C)')
+        parser.add_argument('--stats-interval', type=float, default=10.0,
+                            help='Seconds between counter reports (default: 10)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0 or options['batch_window'] <= 0:
+            raise CommandError('--batch-size and --batch-window must be positive')
+        if options['simulate'] and options['transport'] != 'local':
+            raise CommandError('--simulate needs --transport local')
+        if options['simulate'] and options['require_signed']:
+            raise CommandError('--simulate publishes unsigned readings; drop --require-signed')
+        if options['simulate'] and ('+' in options['topic'] or not options['topic'].endswith('/#')):
+            raise CommandError('--simulate needs a topic filter of the form prefix/#')
+
+        self.stdout.write(self.style.SUCCESS('Starting sensor gateway...'))
+        self.stdout.write(f"  Transport: {options['transport']}"
+                          + (f" ({options['url']})" if options['transport'] == 'mqtt' else ''))
+        self.stdout.write(f"  Topic: {options['topic']}")
+        self.stdout.write(f"  Batches: {options['batch_size']} spots / {options['batch_window']}s")
+        if options['require_signed']:
+            self.stdout.write('  Signed batches only')
+        self.stdout.write('Press Ctrl+C to stop\n')
+
+        try:
+            # Ctrl+C cancels run(), which still flushes the last batch
+            asyncio.run(self.run(options))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nGateway stopped.'))
+
+    async def run(self, options):
+        broker = None
+        if options['transport'] == 'local':
+            broker = LocalBroker()
+            transport = LocalTransport(broker)
+        else:
+            transport = MqttTransport(options['url'])
+        self.gateway = SensorGateway(
+            transport, options['topic'], options['batch_size'], options['batch_window'],
+            require_signed=options['require_signed'],
+        )
+
+        stop = asyncio.Event()
+        tasks = [asyncio.create_task(self.report(options['stats_interval']))]
+        if options['simulate']:
+            spot_ids = await sync_to_async(list)(ParkingSpot.objects.values_list('parking_spot_id', flat=True))
+            if not spot_ids:
+                raise CommandError('No parking spots found - run seed_data first')
+            tasks.append(asyncio.create_task(
+                self.simulate(broker, options['topic'], spot_ids, options['simulate'])
+            ))
+        if options['duration']:
+            asyncio.get_running_loop().call_later(options['duration'], stop.set)
+        try:
+            await self.gateway.run(stop)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.print_counters()
+
+    async def simulate(self, broker, topic, spot_ids, rate, tick=0.05):
+        """Publish random spot readings into the local broker at ``rate`` per second."""
+        prefix = topic[:-len('/#')]
+        started = time.monotonic()
+        sent = 0
+        while True:
+            due = int((time.monotonic() - started) * rate)
+            for _ in range(sent, due):
+                spot_id = random.choice(spot_ids)
+                broker.publish(f'{prefix}/{spot_id}', json.dumps({
+                    'available': random.random() < 0.5,
+                    'sensor_timestamp': time.time(),
+                }))
+            sent = max(sent, due)
+            await asyncio.sleep(tick)
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.print_counters()
+
+    def print_counters(self):
+        counters = self.gateway.counters
+        filtered = sensor_filter.counters
+        suppressed = sum(filtered[name] for name in SUPPRESSED)
+        self.stdout.write(
+            f"[{time.strftime('%H:%M:%S')}] messages: {counters['messages']} "
+            f"(invalid {counters['invalid']}), readings: {counters['readings']}, "
+            f"suppressed: {suppressed}, batches: {counters['batches']}, "
+            f"spots changed: {counters['changed']}"
+        )
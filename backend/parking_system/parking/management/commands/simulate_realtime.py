@@ -2,9 +2,10 @@ import random
 import time
 from datetime import datetime
 from django.core.management.base import BaseCommand
+from parking.broadcast import broadcaster
+from parking.ingest import apply_readings
 from parking.models import ParkingLot
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from parking.simulation import VectorizedSimulation
 
 
 # Daily occupancy schedule - target occupancy percentage by hour
@@ -62,6 +63,19 @@ class Command(BaseCommand):
             default=None,
             help='Specific lot ID to simulate (default: all lots)'
         )
+        parser.add_argument(
+            '--engine',
+            choices=['orm', 'vectorized'],
+            default='orm',
+            help='orm plans lot by lot from the database and writes each tick through the '
+                 'bulk ingest path; vectorized holds all lots in NumPy arrays (default: orm)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed for the vectorized engine'
+        )
 
     def handle(self, *args, **options):
         interval = options['interval']
@@ -69,8 +83,6 @@ class Command(BaseCommand):
         max_step_percent = options['max_step_percent']
         lot_filter = options['lot']
 
-        channel_layer = get_channel_layer()
-
         self.stdout.write(self.style.SUCCESS(
             'Starting real-time parking simulation...'
         ))
@@ -79,39 +91,94 @@ class Command(BaseCommand):
         self.stdout.write(f'  Max step: {max_step_percent * 100}%')
         if lot_filter:
             self.stdout.write(f'  Lot filter: {lot_filter}')
+        self.stdout.write(f"  Engine: {options['engine']}")
         self.stdout.write('Press Ctrl+C to stop\n')
 
+        if options['engine'] == 'vectorized':
+            return self.run_vectorized(
+                interval, gain, max_step_percent,
+                [lot_filter] if lot_filter else None, options['seed']
+            )
+
         try:
             while True:
-                now = datetime.now()
-                current_hour = now.hour
-                target = get_target_for_hour(current_hour)
+                self.tick(lot_filter, gain, max_step_percent, datetime.now())
+                time.sleep(interval)
 
-                # Get lots to simulate
-                if lot_filter:
-                    lots = ParkingLot.objects.filter(parking_lot_id=lot_filter)
-                else:
-                    lots = ParkingLot.objects.all()
+        except KeyboardInterrupt:
+            broadcaster.flush()
+            self.stdout.write(self.style.WARNING('\nSimulation stopped.'))
 
-                for lot in lots:
-                    self.simulate_lot(
-                        lot, target, gain, max_step_percent, channel_layer, now
-                    )
+    def tick(self, lot_filter, gain, max_step_percent, now):
+        """Plan every lot, then write the whole tick through the bulk ingest path."""
+        target = get_target_for_hour(now.hour)
 
-                time.sleep(interval)
+        # Get lots to simulate
+        if lot_filter:
+            lots = ParkingLot.objects.filter(parking_lot_id=lot_filter)
+        else:
+            lots = ParkingLot.objects.all()
+
+        readings = {}
+        for lot in lots:
+            readings.update(self.plan_lot(lot, target, gain, max_step_percent))
+
+        # One set-based write, one counter update per lot and one session batch per tick
+        summaries = apply_readings(readings)
+        time_str = now.strftime('%H:%M:%S')
+        target_pct = int(target * 100)
+        for summary in summaries:
+            summary['target_percent'] = target_pct
+            total = summary['total_spots']
+            actual_pct = int((summary['occupancy'] / total) * 100) if total > 0 else 0
+            self.stdout.write(
+                f"[{time_str}] {summary['lot_name']}: "
+                f"{summary['occupancy']}/{total} occupied ({actual_pct}%) "
+                f'[target: {target_pct}%] '
+                f"({len(summary['spots'])} changes)"
+            )
+
+        # Coalesced into one batch_update per lot by the broadcaster
+        broadcaster.add_many(summaries)
+        return summaries
+
+    def run_vectorized(self, interval, gain, max_step_percent, lot_ids, seed):
+        """Tick every lot at once from in-memory arrays."""
+        simulation = VectorizedSimulation(lot_ids, seed=seed)
+        self.stdout.write(f'  Loaded {len(simulation)} spots in {len(simulation.lot_ids)} lots\n')
+
+        try:
+            while True:
+                started = time.monotonic()
+                now = datetime.now()
+                target = get_target_for_hour(now.hour)
+                summaries = simulation.tick(target, gain, max_step_percent)
+                for summary in summaries:
+                    summary['target_percent'] = int(target * 100)
+                broadcaster.add_many(summaries)
+                elapsed = time.monotonic() - started
+
+                self.stdout.write(
+                    f"[{now.strftime('%H:%M:%S')}] "
+                    f"{sum(len(summary['spots']) for summary in summaries)} changes in "
+                    f'{len(summaries)} lots [target: {int(target * 100)}%] '
+                    f'({elapsed * 1000:.0f} ms)'
+                )
+                time.sleep(max(0.0, interval - elapsed))
 
         except KeyboardInterrupt:
+            broadcaster.flush()
             self.stdout.write(self.style.WARNING('\nSimulation stopped.'))
 
-    def simulate_lot(self, lot, target, gain, max_step_percent, channel_layer, now):
-        """Simulate occupancy changes for a single parking lot."""
-        spots = list(lot.spots.all())
+    def plan_lot(self, lot, target, gain, max_step_percent):
+        """Readings that move one lot towards the target, as {spot_id: (available, None)}."""
+        spots = list(lot.spots.values_list('parking_spot_id', 'availability'))
         if not spots:
-            return
+            return {}
 
         total = len(spots)
-        occupied_spots = [s for s in spots if not s.availability]
-        available_spots = [s for s in spots if s.availability]
+        occupied_spots = [spot_id for spot_id, available in spots if not available]
+        available_spots = [spot_id for spot_id, available in spots if available]
         current_occupied = len(occupied_spots)
 
         desired_occupied = round(total * target)
@@ -119,75 +186,15 @@ class Command(BaseCommand):
 
         # Skip if close enough to target
         if abs(diff) <= 1:
-            return
+            return {}
 
         # Calculate step size with gain and max limit
         step = round(abs(diff) * gain)
         max_step = max(1, round(total * max_step_percent))
         step = min(step, max_step)
 
-        if step == 0:
-            return
-
-        changes = []
-
         if diff > 0:
             # Need more cars (occupy spots)
-            spots_to_occupy = shuffle(available_spots)[:step]
-            for spot in spots_to_occupy:
-                spot.availability = False
-                spot.save()
-                changes.append({
-                    'spot_id': spot.parking_spot_id,
-                    'available': False,
-                    'action': 'PARKED'
-                })
-        else:
-            # Need fewer cars (free spots)
-            spots_to_free = shuffle(occupied_spots)[:step]
-            for spot in spots_to_free:
-                spot.availability = True
-                spot.save()
-                changes.append({
-                    'spot_id': spot.parking_spot_id,
-                    'available': True,
-                    'action': 'DEPARTED'
-                })
-
-        # Update lot occupancy count
-        new_occupancy = lot.spots.filter(availability=False).count()
-        lot.occupancy = new_occupancy
-        lot.save()
-
-        # Log changes
-        time_str = now.strftime('%H:%M:%S')
-        target_pct = int(target * 100)
-        actual_pct = int((new_occupancy / total) * 100) if total > 0 else 0
-
-        self.stdout.write(
-            f'[{time_str}] {lot.parking_lot_name}: '
-            f'{new_occupancy}/{total} occupied ({actual_pct}%) '
-            f'[target: {target_pct}%] '
-            f'({len(changes)} changes)'
-        )
-
-        # Broadcast each change via WebSocket
-        for change in changes:
-            async_to_sync(channel_layer.group_send)(
-                'parking_updates',
-                {
-                    'type': 'parking_update',
-                    'data': {
-                        'lot_id': lot.parking_lot_id,
-                        'lot_name': lot.parking_lot_name,
-                        'spot_id': change['spot_id'],
-                        'available': change['available'],
-                        'occupancy': new_occupancy,
-                        'total_spots': total,
-                        'available_spots': total - new_occupancy,
-                        'occupancy_percent': actual_pct,
-                        'target_percent': target_pct,
-                        'timestamp': now.isoformat(),
-                    }
-                }
-            )
+            return {spot_id: (False, None) for spot_id in shuffle(available_spots)[:step]}
+        # Need fewer cars (free spots)
+        return {spot_id: (True, None) for spot_id in shuffle(occupied_spots)[:step]}
@@ -1,9 +1,8 @@
 import random
 import time
 from django.core.management.base import BaseCommand
-from parking.models import ParkingSpot
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from parking.broadcast import broadcaster
+from parking.models import ParkingLot, ParkingSpot
 
 
 class Command(BaseCommand):
@@ -19,7 +18,6 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         interval = options['interval']
-        channel_layer = get_channel_layer()
         
         self.stdout.write(self.style.SUCCESS(f'Starting sensor simulation (every {interval}s)...'))
         self.stdout.write('Press Ctrl+C to stop\n')
@@ -31,37 +29,34 @@ class Command(BaseCommand):
                 if random.random() < 0.6:
                     spot.availability = not spot.availability
                     spot.save()
-                    
+
+                    # The save adjusted the lot counters atomically
                     lot = spot.parking_lot
-                    lot.occupancy = lot.spots.filter(availability=False).count()
-                    lot.save()
+                    lot.refresh_from_db(fields=ParkingLot.COUNTER_FIELDS)
+                    total = lot.total_spots
+                    available = lot.available_spots
 
                     action = "DEPARTED" if spot.availability else "PARKED"
                     self.stdout.write(
                         f'[{lot.parking_lot_name}] Spot {spot.parking_spot_id}: {action} '
-                        f'(Lot: {lot.occupancy}/{lot.spots.count()} occupied)'
+                        f'(Lot: {lot.occupancy}/{total} occupied)'
                     )
 
-                    # Broadcast to WebSocket
-                    total = lot.spots.count()
-                    available = total - lot.occupancy
-                    async_to_sync(channel_layer.group_send)(
-                        'parking_updates',
+                    # Coalesced into one batch_update per lot by the broadcaster
+                    broadcaster.add(
                         {
-                            'type': 'parking_update',
-                            'data': {
-                                'lot_id': lot.parking_lot_id,
-                                'lot_name': lot.parking_lot_name,
-                                'spot_id': spot.parking_spot_id,
-                                'available': spot.availability,
-                                'available_spots': available,
-                                'total_spots': total,
-                                'occupancy_percent': round(lot.occupancy / total * 100, 1) if total > 0 else 0
-                            }
-                        }
+                            'lot_id': lot.parking_lot_id,
+                            'lot_name': lot.parking_lot_name,
+                            'occupancy': lot.occupancy,
+                            'available_spots': available,
+                            'total_spots': total,
+                            'occupancy_percent': round(lot.occupancy / total * 100, 1) if total > 0 else 0
+                        },
+                        [{'spot_id': spot.parking_spot_id, 'available': spot.availability}]
                     )
-                
+
                 time.sleep(interval)
 
         except KeyboardInterrupt:
+            broadcaster.flush()
             self.stdout.write(self.style.WARNING('\nSimulation stopped.'))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:18
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counters(apps, schema_editor):
+    ParkingLot = apps.get_model('parking', 'ParkingLot')
+    lots = ParkingLot.objects.annotate(
+        total=Count('spots'),
+        available=Count('spots', filter=Q(spots__availability=True))
+    )
+    for lot in lots:
+        ParkingLot.objects.filter(pk=lot.pk).update(
+            total_spots=lot.total,
+            available_spots=lot.available,
+            occupancy=lot.total - lot.available,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0002_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parkinglot',
+            name='available_spots',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='parkinglot',
+            name='total_spots',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
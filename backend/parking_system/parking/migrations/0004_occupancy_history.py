@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0003_lot_availability_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyRollup',
+            fields=[
+                ('rollup_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('granularity', models.CharField(choices=[('1m', '1 minute'), ('15m', '15 minutes'), ('1h', '1 hour')], max_length=3)),
+                ('bucket_start', models.DateTimeField()),
+                ('samples', models.IntegerField()),
+                ('avg_occupancy', models.FloatField()),
+                ('min_occupancy', models.IntegerField()),
+                ('max_occupancy', models.IntegerField()),
+                ('total_spots', models.IntegerField()),
+                ('parking_lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy_rollups', to='parking.parkinglot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'bucket_start'], name='rollup_time_idx')],
+                'constraints': [models.UniqueConstraint(fields=('parking_lot', 'granularity', 'bucket_start'), name='rollup_lot_bucket_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OccupancySample',
+            fields=[
+                ('sample_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('recorded_at', models.DateTimeField()),
+                ('occupancy', models.IntegerField()),
+                ('total_spots', models.IntegerField()),
+                ('parking_lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy_samples', to='parking.parkinglot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['parking_lot', 'recorded_at'], name='sample_lot_time_idx'), models.Index(fields=['recorded_at'], name='sample_time_idx')],
+            },
+        ),
+    ]
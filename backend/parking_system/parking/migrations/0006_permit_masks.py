@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:00
+
+import parking.models
+from django.db import migrations, models
+from django.db.models import F
+
+
+def assign_bits_and_masks(apps, schema_editor):
+    PermitType = apps.get_model('parking', 'PermitType')
+    ParkingLot = apps.get_model('parking', 'ParkingLot')
+    ParkingSpot = apps.get_model('parking', 'ParkingSpot')
+
+    permits = list(PermitType.objects.order_by('permit_type_id'))
+    if len(permits) > 63:
+        raise RuntimeError('At most 63 permit types fit in a permit mask')
+    for bit, permit in enumerate(permits):
+        permit.bit = bit
+        permit.save(update_fields=['bit'])
+        mask = 1 << bit
+        ParkingLot.objects.filter(permit_types=permit).update(permit_mask=F('permit_mask').bitor(mask))
+        ParkingSpot.objects.filter(lot_permit_access=permit).update(permit_mask=F('permit_mask').bitor(mask))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0005_spot_locations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parkinglot',
+            name='permit_mask',
+            field=parking.models.PermitMaskField(default=0),
+        ),
+        migrations.AddField(
+            model_name='parkingspot',
+            name='permit_mask',
+            field=parking.models.PermitMaskField(default=0),
+        ),
+        migrations.AddField(
+            model_name='permittype',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True, unique=True),
+        ),
+        migrations.RunPython(assign_bits_and_masks, migrations.RunPython.noop),
+    ]
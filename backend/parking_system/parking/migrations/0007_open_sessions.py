@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def close_duplicate_open_sessions(apps, schema_editor):
+    """Keep only the newest open session per spot before the constraint."""
+    Session = apps.get_model('parking', 'Session')
+    newest = Session.objects.filter(end_time__isnull=True).values('parking_spot').annotate(
+        newest=Max('session_id')
+    ).values_list('newest', flat=True)
+    Session.objects.filter(end_time__isnull=True).exclude(session_id__in=list(newest)).update(
+        end_time=django.utils.timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0006_permit_masks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='start_time',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='session',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sessions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(close_duplicate_open_sessions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(condition=models.Q(('end_time__isnull', True)), fields=['user'], name='session_open_user_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='session',
+            constraint=models.UniqueConstraint(condition=models.Q(('end_time__isnull', True)), fields=('parking_spot',), name='session_open_spot_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0007_open_sessions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['parking_spot', 'end_time'], name='session_spot_end_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0008_session_spot_end_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parkingspot',
+            name='debounce_seconds',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
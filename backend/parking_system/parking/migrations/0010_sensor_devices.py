@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:18
+
+import parking.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0009_spot_debounce'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDevice',
+            fields=[
+                ('sensor_device_id', models.AutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('secret', models.CharField(default=parking.models.generate_device_secret, max_length=128)),
+                ('is_active', models.BooleanField(default=True)),
+                ('spots', models.ManyToManyField(blank=True, related_name='sensor_devices', to='parking.parkingspot')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0010_sensor_devices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='occupancyrollup',
+            name='last_occupancy',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
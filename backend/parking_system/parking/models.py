@@ -1,12 +1,50 @@
-from django.db import models
+import secrets
+
+from django.db import models, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 
+class HasBit(models.Lookup):
+    """``permit_mask__hasbit=n``: bit ``n`` of an integer mask is set."""
+    lookup_name = 'hasbit'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & (CAST(1 AS BIGINT) << {rhs})) <> 0', (*lhs_params, *rhs_params)
+
+
+class PermitMaskField(models.BigIntegerField):
+    """Denormalized permit access: bit ``PermitType.bit`` set per allowed permit."""
+
+
+PermitMaskField.register_lookup(HasBit)
+
+
 class PermitType(models.Model):
     """Permit classifications: Student, Faculty, Visitor, etc."""
     permit_type_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
-    
+    # Position of this permit in every permit_mask, assigned on first save
+    bit = models.PositiveSmallIntegerField(unique=True, null=True, editable=False)
+
+    # Bits 0-62 keep masks positive in a signed 64-bit column
+    MAX_PERMITS = 63
+
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            used = set(PermitType.objects.exclude(bit=None).values_list('bit', flat=True))
+            self.bit = next((bit for bit in range(self.MAX_PERMITS) if bit not in used), None)
+            if self.bit is None:
+                raise ValueError(f'At most {self.MAX_PERMITS} permit types are supported')
+        super().save(*args, **kwargs)
+
+    @property
+    def mask(self):
+        return 1 << self.bit
+
     def __str__(self):
         return self.name
 
@@ -75,11 +113,59 @@ class ParkingLot(models.Model):
     parking_lot_id = models.AutoField(primary_key=True)
     parking_lot_name = models.CharField(max_length=100)
     occupancy = models.IntegerField(default=0)
+    # Denormalized counters, kept in sync by ParkingSpot writes.
+    # Repair drift with `manage.py reconcile_lot_counters`.
+    total_spots = models.IntegerField(default=0)
+    available_spots = models.IntegerField(default=0)
+    # WGS84 position of the lot entrance; spots without their own use it
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     permit_types = models.ManyToManyField(
         PermitType,
         related_name='parking_lots',
         blank=True
     )
+    # Mirrors permit_types; maintained by the m2m_changed handlers
+    permit_mask = PermitMaskField(default=0)
+
+    COUNTER_FIELDS = ('occupancy', 'total_spots', 'available_spots')
+
+    def save(self, *args, **kwargs):
+        # Counters and the permit mask are only written with F() updates -
+        # never overwrite them from a possibly stale instance.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in (*self.COUNTER_FIELDS, 'permit_mask')
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def adjust_counters(cls, lot_id, total=0, available=0, occupied=0):
+        """Atomically shift a lot's counters by the given deltas."""
+        if not (total or available or occupied):
+            return
+        cls.objects.filter(parking_lot_id=lot_id).update(
+            total_spots=F('total_spots') + total,
+            available_spots=F('available_spots') + available,
+            occupancy=F('occupancy') + occupied,
+        )
+
+    @classmethod
+    def adjust_availability(cls, freed_by_lot):
+        """Shift many lots' counters with one UPDATE; maps lot_id -> spots freed."""
+        freed_by_lot = {lot_id: freed for lot_id, freed in freed_by_lot.items() if freed}
+        if not freed_by_lot:
+            return
+        freed = Case(
+            *(When(parking_lot_id=lot_id, then=Value(delta)) for lot_id, delta in freed_by_lot.items()),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        cls.objects.filter(parking_lot_id__in=freed_by_lot).update(
+            available_spots=F('available_spots') + freed,
+            occupancy=F('occupancy') - freed,
+        )
 
     def __str__(self):
         return self.parking_lot_name
@@ -94,11 +180,17 @@ class ParkingSpot(models.Model):
         related_name='spots'
     )
     availability = models.BooleanField(default=True, db_index=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Sensor debounce window for this spot; None uses PARKING_SENSOR_DEBOUNCE_SECONDS
+    debounce_seconds = models.FloatField(null=True, blank=True)
     lot_permit_access = models.ManyToManyField(
         PermitType,
         related_name='accessible_spots',
         blank=True
     )
+    # Mirrors lot_permit_access; maintained by the m2m_changed handlers
+    permit_mask = PermitMaskField(default=0)
 
     class Meta:
         indexes = [
@@ -106,6 +198,67 @@ class ParkingSpot(models.Model):
             models.Index(fields=['parking_lot', 'availability'], name='spot_lot_avail_idx'),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_state()
+
+    def _remember_state(self):
+        self._loaded_state = (self.__dict__.get('parking_lot_id'), self.__dict__.get('availability'))
+        self._loaded_location = (self.__dict__.get('latitude'), self.__dict__.get('longitude'))
+        self._loaded_debounce = self.__dict__.get('debounce_seconds')
+
+    def save(self, *args, **kwargs):
+        """Save and keep the owning lot's counters in step."""
+        previous = None if self._state.adding else getattr(self, '_loaded_state', None)
+        current = (self.parking_lot_id, self.availability)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # permit_mask is maintained with F() updates - don't write it back
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'permit_mask'
+            ]
+        update_fields = kwargs.get('update_fields')
+        writes_state = update_fields is None or not {
+            'parking_lot', 'parking_lot_id', 'availability'
+        }.isdisjoint(update_fields)
+        with transaction.atomic():
+            if previous is not None and writes_state:
+                # Counters (and the post_save handlers) follow the row, not this
+                # instance's copy from load time: two concurrent flips of the same
+                # spot must apply one delta, so lock the row and read it
+                row = ParkingSpot.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'parking_lot_id', 'availability'
+                ).first()
+                if row is not None:
+                    previous = self._loaded_state = row
+            super().save(*args, **kwargs)
+            if previous is None:
+                ParkingLot.adjust_counters(
+                    self.parking_lot_id, total=1,
+                    available=int(self.availability), occupied=int(not self.availability)
+                )
+            elif writes_state and None not in previous and previous != current:
+                old_lot, old_available = previous
+                if old_lot == self.parking_lot_id:
+                    delta = int(self.availability) - int(old_available)
+                    ParkingLot.adjust_counters(self.parking_lot_id, available=delta, occupied=-delta)
+                else:
+                    ParkingLot.adjust_counters(
+                        old_lot, total=-1,
+                        available=-int(old_available), occupied=-int(not old_available)
+                    )
+                    ParkingLot.adjust_counters(
+                        self.parking_lot_id, total=1,
+                        available=int(self.availability), occupied=int(not self.availability)
+                    )
+        self._remember_state()
+
     def __str__(self):
         return f"Spot {self.parking_spot_id} in {self.parking_lot}"
 
@@ -127,7 +280,11 @@ class Event(models.Model):
 
 
 class Session(models.Model):
-    """Active parking sessions - tracks when a car is in a spot."""
+    """Active parking sessions - tracks when a car is in a spot.
+
+    A session is open while ``end_time`` is null. Sessions opened by spot
+    transitions don't know the driver, so ``user`` is optional.
+    """
     session_id = models.AutoField(primary_key=True)
     parking_spot = models.ForeignKey(
         ParkingSpot,
@@ -137,6 +294,8 @@ class Session(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        null=True,
+        blank=True,
         related_name='sessions'
     )
     vehicle = models.ForeignKey(
@@ -145,8 +304,112 @@ class Session(models.Model):
         null=True,
         related_name='sessions'
     )
-    start_time = models.DateTimeField(auto_now_add=True)
+    start_time = models.DateTimeField(default=timezone.now, editable=False)
     end_time = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # One open session per spot; the partial index only holds open
+            # sessions, so spot lookups don't grow with history
+            models.UniqueConstraint(
+                fields=['parking_spot'], condition=Q(end_time__isnull=True),
+                name='session_open_spot_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user'], condition=Q(end_time__isnull=True),
+                name='session_open_user_idx',
+            ),
+            # Latest departures per spot, for late sensor readings
+            models.Index(fields=['parking_spot', 'end_time'], name='session_spot_end_idx'),
+        ]
+
     def __str__(self):
-        return f"Session {self.session_id} - {self.user} at {self.parking_spot}"
\ No newline at end of file
+        return f"Session {self.session_id} - {self.user} at {self.parking_spot}"
+
+class OccupancySample(models.Model):
+    """Append-only lot counters, one row per lot per producer batch."""
+    sample_id = models.BigAutoField(primary_key=True)
+    parking_lot = models.ForeignKey(
+        ParkingLot,
+        on_delete=models.CASCADE,
+        related_name='occupancy_samples'
+    )
+    recorded_at = models.DateTimeField()
+    occupancy = models.IntegerField()
+    total_spots = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['parking_lot', 'recorded_at'], name='sample_lot_time_idx'),
+            # Rollups and retention scan by time across all lots
+            models.Index(fields=['recorded_at'], name='sample_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.parking_lot} {self.occupancy}/{self.total_spots} at {self.recorded_at}"
+
+
+class OccupancyRollup(models.Model):
+    """Occupancy aggregated per lot over fixed time buckets."""
+    MINUTE = '1m'
+    QUARTER_HOUR = '15m'
+    HOUR = '1h'
+    GRANULARITY_CHOICES = [
+        (MINUTE, '1 minute'),
+        (QUARTER_HOUR, '15 minutes'),
+        (HOUR, '1 hour'),
+    ]
+
+    rollup_id = models.BigAutoField(primary_key=True)
+    parking_lot = models.ForeignKey(
+        ParkingLot,
+        on_delete=models.CASCADE,
+        related_name='occupancy_rollups'
+    )
+    granularity = models.CharField(max_length=3, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    samples = models.IntegerField()
+    avg_occupancy = models.FloatField()
+    min_occupancy = models.IntegerField()
+    max_occupancy = models.IntegerField()
+    total_spots = models.IntegerField()
+    # Occupancy at the end of the bucket - where the next bucket starts from
+    last_occupancy = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['parking_lot', 'granularity', 'bucket_start'],
+                name='rollup_lot_bucket_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket_start'], name='rollup_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.parking_lot} {self.granularity} at {self.bucket_start}"
+
+
+def generate_device_secret():
+    return secrets.token_hex(32)
+
+
+class SensorDevice(models.Model):
+    """A sensor gateway or device that signs its reading batches."""
+    sensor_device_id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+    # Shared HMAC-SHA256 key (hex); the device signs with it, ingest verifies
+    secret = models.CharField(max_length=128, default=generate_device_secret)
+    # Spots this device may report on
+    spots = models.ManyToManyField(
+        ParkingSpot,
+        related_name='sensor_devices',
+        blank=True
+    )
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,17 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PkCursorPagination(CursorPagination):
+    """Cursor pages keyed on the model's primary key.
+
+    Pages are ``WHERE pk > <cursor> ORDER BY pk LIMIT n`` - no OFFSET, so
+    deep pages cost the same as the first and rows inserted while a client
+    pages through never shift or repeat results. ``?page_size=`` is honoured
+    up to ``max_page_size``.
+    """
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        return (queryset.model._meta.pk.name,)
@@ -0,0 +1,140 @@
+"""Denormalized permit access masks.
+
+``ParkingLot.permit_mask`` and ``ParkingSpot.permit_mask`` hold one bit per
+``PermitType`` (``PermitType.bit``), mirroring ``ParkingLot.permit_types`` and
+``ParkingSpot.lot_permit_access``. Access checks become a single predicate on
+the row itself instead of a join through the M2M tables::
+
+    ParkingLot.objects.filter(permit_mask__hasbit=permit_bit(permit_id))
+
+The m2m_changed handlers in ``signals`` keep the masks in step with set-based
+``UPDATE``s. Writes that bypass signals (bulk inserts into the through
+tables) must call ``rebuild_permit_masks``.
+
+``permit_bits`` caches the permit -> bit map in the shared cache under a
+version that permit saves and deletes bump after commit, so every worker
+moves to the new map together.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Subquery
+
+from .counters import bump_counter, read_counter
+from .models import ParkingLot, ParkingSpot, PermitType
+
+VERSION_KEY = 'permit_bits:version'
+BITS_KEY = 'permit_bits:{}'
+# Maps of retired versions are never read again - let them expire
+BITS_TIMEOUT = 24 * 60 * 60
+
+# Model -> M2M field its permit_mask mirrors
+MASKED_RELATIONS = {
+    ParkingLot: 'permit_types',
+    ParkingSpot: 'lot_permit_access',
+}
+
+
+def permit_bit(permit_id):
+    """The permit's bit as a subquery, so callers stay at one query."""
+    return Subquery(PermitType.objects.filter(pk=permit_id).values('bit')[:1])
+
+
+def permit_bits():
+    """{permit_id: bit} for in-process checks, cached until permits change."""
+    key = BITS_KEY.format(read_counter(VERSION_KEY))
+    bits = cache.get(key)
+    if bits is None:
+        bits = dict(PermitType.objects.values_list('permit_type_id', 'bit'))
+        cache.set(key, bits, timeout=BITS_TIMEOUT)
+    return bits
+
+
+def forget_permit_bits():
+    transaction.on_commit(lambda: bump_counter(VERSION_KEY))
+
+
+def mask_of(permit_ids):
+    mask = 0
+    for bit in PermitType.objects.filter(pk__in=permit_ids).values_list('bit', flat=True):
+        mask |= 1 << bit
+    return mask
+
+
+def grant(model, ids, mask):
+    if mask and ids:
+        model.objects.filter(pk__in=ids).update(permit_mask=F('permit_mask').bitor(mask))
+
+
+def revoke(model, ids, mask):
+    """Clear ``mask`` on the given rows (every row when ``ids`` is None)."""
+    if not mask:
+        return
+    cleared = F('permit_mask').bitand(~mask)
+    rows = model.objects.all() if ids is None else model.objects.filter(pk__in=ids)
+    # Only rows that actually hold one of the bits
+    rows.exclude(permit_mask=cleared).update(permit_mask=cleared)
+
+
+def relation_changed(model, instance, action, pk_set):
+    """Apply one m2m_changed event on ``model``'s permit relation to the masks."""
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, model):
+        # Forward: lot.permit_types.add(...) - pk_set holds permit ids
+        if action == 'post_clear':
+            model.objects.filter(pk=instance.pk).update(permit_mask=0)
+            instance.permit_mask = 0
+            return
+        mask = mask_of(pk_set) if pk_set else 0
+        if action == 'post_add':
+            grant(model, [instance.pk], mask)
+            instance.permit_mask |= mask
+        elif action == 'post_remove':
+            revoke(model, [instance.pk], mask)
+            instance.permit_mask &= ~mask
+    elif action == 'post_add':
+        # Reverse: permit.parking_lots.add(...) - pk_set holds row ids
+        grant(model, pk_set, instance.mask)
+    elif action == 'post_remove':
+        revoke(model, pk_set, instance.mask)
+    elif action == 'post_clear':
+        revoke(model, None, instance.mask)
+
+
+def permit_deleted(permit):
+    """Cascade deletes of through rows send no m2m_changed - clear the bit."""
+    if permit.bit is not None:
+        for model in MASKED_RELATIONS:
+            revoke(model, None, permit.mask)
+    forget_permit_bits()
+
+
+def mask_drift():
+    """{model: rows whose permit_mask differs from the M2M tables}, without writing."""
+    drift = {}
+    for model, relation in MASKED_RELATIONS.items():
+        expected = defaultdict(int)
+        for pk, bit in model.objects.filter(**{f'{relation}__isnull': False}).values_list(
+            'pk', f'{relation}__bit'
+        ):
+            expected[pk] |= 1 << bit
+        drift[model] = sum(
+            1 for pk, mask in model.objects.values_list('pk', 'permit_mask').iterator()
+            if mask != expected[pk]
+        )
+    return drift
+
+
+def rebuild_permit_masks():
+    """Recompute every mask from the M2M tables; returns rows updated."""
+    updated = 0
+    bits = list(PermitType.objects.values_list('permit_type_id', 'bit'))
+    for model, relation in MASKED_RELATIONS.items():
+        model.objects.exclude(permit_mask=0).update(permit_mask=0)
+        for permit_id, bit in bits:
+            updated += model.objects.filter(**{relation: permit_id}).update(
+                permit_mask=F('permit_mask').bitor(1 << bit)
+            )
+    return updated
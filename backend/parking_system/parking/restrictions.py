@@ -0,0 +1,140 @@
+"""Which lots are closed by events, and when.
+
+``Event`` only records a date and start time, so a restriction window runs
+from ``PARKING_EVENT_LEAD_HOURS`` before the start until
+``PARKING_EVENT_DURATION_HOURS`` after it. Windows can cross midnight, so a
+day's map also looks at the events of the neighbouring days.
+
+``DayRestrictions`` precomputes, for every stretch between two window
+boundaries, the set of restricted lots; ``active(at)`` is a bisect over the
+boundaries and membership is then O(1) per lot. Maps are built with one
+query per day, shared through the cache, and memoized per process. Event
+saves, deletes and ``restricted_lots`` changes bump ``VERSION_KEY`` after
+commit, which retires every cached map.
+"""
+import threading
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import bump_counter, read_counter
+from .models import Event
+
+VERSION_KEY = 'restrictions:version'
+MAP_KEY = 'restrictions:{version}:{day}'
+MAP_TIMEOUT = 60 * 60 * 24
+
+
+def restriction_window(date, time_start):
+    """(start, end) of the restriction an event on ``date`` at ``time_start`` imposes."""
+    start = timezone.make_aware(datetime.combine(date, time_start), timezone.get_current_timezone())
+    lead = timedelta(hours=getattr(settings, 'PARKING_EVENT_LEAD_HOURS', 3))
+    duration = timedelta(hours=getattr(settings, 'PARKING_EVENT_DURATION_HOURS', 5))
+    return start - lead, start + duration
+
+
+class DayRestrictions:
+    """Restriction windows touching one local day, indexed by time."""
+
+    def __init__(self, day, windows):
+        self.day = day
+        # {lot_id: [(start, end, event_id, event_name)]}
+        self.windows = windows
+        self.boundaries = sorted({
+            moment for lot_windows in windows.values()
+            for start, end, _, _ in lot_windows for moment in (start, end)
+        })
+        # Restricted lots between boundaries[i - 1] and boundaries[i]
+        self.stretches = []
+        for i in range(len(self.boundaries) + 1):
+            # Any moment inside the stretch decides it; the boundary itself
+            # belongs to the stretch that starts there
+            probe = self.boundaries[i - 1] if i else None
+            self.stretches.append(frozenset(
+                lot_id for lot_id, lot_windows in windows.items()
+                if probe is not None and any(start <= probe < end for start, end, _, _ in lot_windows)
+            ))
+
+    @classmethod
+    def build(cls, day):
+        """One query over the restriction rows of the events around ``day``."""
+        windows = {}
+        rows = Event.restricted_lots.through.objects.filter(
+            event__date__range=(day - timedelta(days=1), day + timedelta(days=1))
+        ).values_list(
+            'parkinglot_id', 'event_id', 'event__event_name', 'event__date', 'event__time_start'
+        ).order_by('event_id', 'parkinglot_id')
+        tz = timezone.get_current_timezone()
+        day_start = timezone.make_aware(datetime.combine(day, datetime.min.time()), tz)
+        day_end = day_start + timedelta(days=1)
+        for lot_id, event_id, name, date, time_start in rows:
+            start, end = restriction_window(date, time_start)
+            if end <= day_start or start >= day_end:
+                continue
+            windows.setdefault(lot_id, []).append((start, end, event_id, name))
+        return cls(day, windows)
+
+    def stretch(self, at):
+        """Index of the stretch containing ``at`` (changes only at boundaries)."""
+        return bisect_right(self.boundaries, at)
+
+    def active(self, at):
+        """Frozen set of lot ids restricted at ``at``."""
+        return self.stretches[self.stretch(at)]
+
+    def windows_for(self, lot_id):
+        return self.windows.get(lot_id, [])
+
+
+class RestrictionResolver:
+    """Per-process memo of day maps, kept fresh via the cache version."""
+
+    def __init__(self):
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def version(self):
+        # Clock-seeded, so a flushed cache never revives an old map
+        return read_counter(VERSION_KEY)
+
+    def for_day(self, day, version=None):
+        if version is None:
+            version = self.version()
+        memo_key = (version, day)
+        restrictions = self._maps.get(memo_key)
+        if restrictions is None:
+            key = MAP_KEY.format(version=version, day=day.isoformat())
+            restrictions = cache.get(key)
+            if restrictions is None:
+                restrictions = DayRestrictions.build(day)
+                cache.set(key, restrictions, timeout=MAP_TIMEOUT)
+            with self._lock:
+                # Old versions and days are never asked for again
+                self._maps = {k: v for k, v in self._maps.items() if k[0] == version}
+                self._maps[memo_key] = restrictions
+        return restrictions
+
+    def at(self, moment=None):
+        """(restricted lot ids, state token) at ``moment`` (default now).
+
+        The token changes whenever the set can change - an event edit or a
+        window boundary passing - so it can go into ETags.
+        """
+        moment = moment or timezone.now()
+        version = self.version()
+        restrictions = self.for_day(timezone.localdate(moment), version)
+        stretch = restrictions.stretch(moment)
+        return restrictions.stretches[stretch], f'{version}.{restrictions.day:%Y%m%d}.{stretch}'
+
+    def restricted_lots(self, moment=None):
+        return self.at(moment)[0]
+
+    def invalidate(self):
+        transaction.on_commit(lambda: bump_counter(VERSION_KEY))
+
+
+resolver = RestrictionResolver()
@@ -0,0 +1,117 @@
+"""Retention for occupancy history.
+
+Each granularity keeps ``PARKING_HISTORY_RETENTION_HOURS[tier]`` hours of rows
+(None keeps them forever). Rows are only removed once the next coarser tier
+has rolled them up, so expiring raw samples never loses data that the 1-minute
+tier has not captured yet.
+
+Deletes run in chunks of primary keys, each its own short statement, so the
+history tables are never locked for long while producers keep appending.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .history import BUCKET_WIDTHS, RAW, bucket_floor, rollup_all
+from .models import OccupancyRollup, OccupancySample
+
+DELETE_CHUNK_SIZE = 5000
+
+# The tier that must have rolled a row up before it may be deleted
+NEXT_TIER = {
+    RAW: OccupancyRollup.MINUTE,
+    OccupancyRollup.MINUTE: OccupancyRollup.QUARTER_HOUR,
+    OccupancyRollup.QUARTER_HOUR: OccupancyRollup.HOUR,
+    OccupancyRollup.HOUR: None,
+}
+
+
+def _tier_rows(tier):
+    """(queryset, time field) holding a tier's rows."""
+    if tier == RAW:
+        return OccupancySample.objects.all(), 'recorded_at'
+    return OccupancyRollup.objects.filter(granularity=tier), 'bucket_start'
+
+
+def rolled_up_until(granularity):
+    """End of the newest bucket stored for a rollup tier (None if empty)."""
+    last = OccupancyRollup.objects.filter(granularity=granularity).aggregate(
+        last=Max('bucket_start')
+    )['last']
+    return last + BUCKET_WIDTHS[granularity] if last is not None else None
+
+
+def retention_cutoff(tier, now=None):
+    """Rows of ``tier`` older than this may be deleted (None = keep all)."""
+    hours = getattr(settings, 'PARKING_HISTORY_RETENTION_HOURS', {}).get(tier)
+    if hours is None:
+        return None
+    cutoff = (now or timezone.now()) - timedelta(hours=hours)
+    next_tier = NEXT_TIER[tier]
+    if next_tier is not None:
+        covered = rolled_up_until(next_tier)
+        if covered is None:
+            return None
+        # Whole buckets of the next tier only, so it is never rebuilt from a partial one
+        cutoff = bucket_floor(min(cutoff, covered), BUCKET_WIDTHS[next_tier])
+    return cutoff
+
+
+def delete_before(tier, cutoff, chunk_size=DELETE_CHUNK_SIZE, pause=0):
+    """Delete a tier's rows older than ``cutoff`` in chunks; returns rows removed."""
+    queryset, time_field = _tier_rows(tier)
+    expired = queryset.filter(**{f'{time_field}__lt': cutoff}).order_by(time_field)
+    model = queryset.model
+    removed = 0
+    while True:
+        ids = list(expired.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return removed
+        removed += model.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < chunk_size:
+            return removed
+        if pause:
+            time.sleep(pause)
+
+
+def count_before(tier, cutoff):
+    queryset, time_field = _tier_rows(tier)
+    return queryset.filter(**{f'{time_field}__lt': cutoff}).count()
+
+
+def apply_retention(now=None, chunk_size=DELETE_CHUNK_SIZE, pause=0, dry_run=False):
+    """Expire every tier; returns {tier: {'cutoff', 'removed', 'seconds'}}.
+
+    With ``dry_run`` nothing is deleted and ``removed`` is the number of rows
+    that would be.
+    """
+    now = now or timezone.now()
+    report = {}
+    for tier in NEXT_TIER:
+        started = time.monotonic()
+        cutoff = retention_cutoff(tier, now)
+        if cutoff is None:
+            removed = 0
+        elif dry_run:
+            removed = count_before(tier, cutoff)
+        else:
+            removed = delete_before(tier, cutoff, chunk_size, pause)
+        report[tier] = {
+            'cutoff': cutoff,
+            'removed': removed,
+            'seconds': time.monotonic() - started,
+        }
+    return report
+
+
+def run_history_maintenance(now=None):
+    """Scheduler hook: roll up complete buckets, then expire old rows.
+
+    Safe to call from cron, a worker's periodic task, or
+    ``manage.py rollup_occupancy --every 60 --retention``.
+    """
+    now = now or timezone.now()
+    return rollup_all(now), apply_retention(now)
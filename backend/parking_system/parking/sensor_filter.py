@@ -0,0 +1,221 @@
+"""Drop no-op and flickering sensor readings before they reach the database.
+
+``SensorFilter`` sits between ``parse_readings`` and ``apply_readings`` and
+keeps the last state it let through per spot, in process memory:
+
+- a reading that repeats that state is a *duplicate* and dropped - unless the
+  state was last passed on ``PARKING_SENSOR_REFRESH_SECONDS`` ago, so a spot
+  changed behind the sensor's back is corrected by its next report;
+- a reading older than the spot's last accepted change is *stale*;
+- a change within the spot's debounce window of the previous change is
+  *debounced*: it is held, and only released once the window has passed
+  with the spot still reporting it. Flipping back inside the window drops
+  the held change (*flicker*).
+
+The window is ``ParkingSpot.debounce_seconds`` when set, otherwise
+``PARKING_SENSOR_DEBOUNCE_SECONDS``. Times are sensor timestamps (epoch
+seconds) when the reading has one, arrival time otherwise.
+
+Held changes live in the shared cache (``PENDING_KEY``), so any worker - or
+the ``release_sensor_changes`` job, for sensors that only report on change -
+releases them once due, and a restart doesn't lose them. Two workers holding
+changes at the same moment can overwrite each other's map; the lost change
+is then corrected by the sensor's next report, as with a lost reading.
+
+Last-passed states are kept for at most ``PARKING_SENSOR_FILTER_SIZE``
+spots (least recently passed go first; their next reading just passes).
+``filtered()`` records a batch's outcome only once the block that writes it
+has finished, so a failed write doesn't leave its readings marked as passed.
+
+Counters are kept per process and added to shared cache totals
+(``sensor_filter:<name>``) once per batch; ``stats()`` reads the totals.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .counters import bump_counter, read_counter
+from .models import ParkingSpot
+
+COUNTER_KEY = 'sensor_filter:{}'
+COUNTERS = ('received', 'passed', 'released', 'duplicate', 'stale', 'debounced', 'flicker')
+# Readings that never reached the database
+SUPPRESSED = ('duplicate', 'stale', 'debounced', 'flicker')
+OVERRIDES_KEY = 'sensor_filter:overrides_version'
+PENDING_KEY = 'sensor_filter:pending'
+
+
+class SensorFilter:
+    """Per-process last-known spot states; held changes shared through the cache."""
+
+    def __init__(self, debounce=None, refresh=None, maxsize=None):
+        self._debounce = debounce
+        self._refresh = refresh
+        self._maxsize = maxsize
+        # {spot_id: (available, changed_at, passed_at)}, least recently passed first
+        self._last = OrderedDict()
+        # Copy of the shared {spot_id: (available, at, due)} as of the last batch
+        self._pending = {}
+        self._overrides = {}
+        self._overrides_version = None
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def debounce(self):
+        if self._debounce is not None:
+            return self._debounce
+        return getattr(settings, 'PARKING_SENSOR_DEBOUNCE_SECONDS', 3.0)
+
+    @property
+    def refresh(self):
+        if self._refresh is not None:
+            return self._refresh
+        return getattr(settings, 'PARKING_SENSOR_REFRESH_SECONDS', 300.0)
+
+    @property
+    def maxsize(self):
+        if self._maxsize is not None:
+            return self._maxsize
+        return getattr(settings, 'PARKING_SENSOR_FILTER_SIZE', 100_000)
+
+    @property
+    def has_pending(self):
+        return bool(self._pending)
+
+    def reset(self):
+        with self._lock:
+            self._last.clear()
+            self._pending = {}
+            self._overrides_version = None
+            self.counters.clear()
+        cache.delete(PENDING_KEY)
+
+    def overrides(self):
+        """{spot_id: debounce seconds} for spots with their own window."""
+        version = read_counter(OVERRIDES_KEY)
+        if version != self._overrides_version:
+            self._overrides = dict(
+                ParkingSpot.objects.filter(debounce_seconds__isnull=False)
+                .values_list('parking_spot_id', 'debounce_seconds')
+            )
+            self._overrides_version = version
+        return self._overrides
+
+    @staticmethod
+    def invalidate_overrides():
+        bump_counter(OVERRIDES_KEY)
+
+    def process(self, readings, now=None):
+        """Filter parsed ``{spot_id: (available, timestamp)}`` readings.
+
+        Returns ``(accepted, counts)``: the readings to apply - including
+        held changes whose window has passed - in the same shape, and this
+        batch's counters. The outcome is recorded straight away; writers
+        use ``filtered()`` instead.
+        """
+        accepted, counts, outcome = self._decide(readings, now)
+        self._record(outcome, counts)
+        return accepted, counts
+
+    @contextmanager
+    def filtered(self, readings, now=None):
+        """``with filtered(readings) as (accepted, counts):`` write ``accepted`` inside.
+
+        The batch is recorded when the block finishes; if it raises, the
+        readings are filtered again next time as if never seen.
+        """
+        accepted, counts, outcome = self._decide(readings, now)
+        yield accepted, counts
+        self._record(outcome, counts)
+
+    def release_due(self, now=None):
+        """Held changes whose window has passed, for callers on a timer."""
+        return self.process({}, now)[0]
+
+    def _decide(self, readings, now):
+        now = time.time() if now is None else now
+        overrides = self.overrides()
+        default = self.debounce
+        counts = Counter(received=len(readings))
+        accepted, passed = {}, {}
+        shared = cache.get(PENDING_KEY) or {}
+        pending = dict(shared)
+        with self._lock:
+            for spot_id, (available, timestamp) in readings.items():
+                at = now if timestamp is None else timestamp
+                last = self._last.get(spot_id)
+                if last is None:
+                    # First sight in this process: whatever another worker held is moot
+                    pending.pop(spot_id, None)
+                    self._pass(spot_id, available, timestamp, (available, at, at), passed, accepted, counts)
+                    continue
+                state, changed_at, passed_at = last
+                if available == state:
+                    if pending.pop(spot_id, None) is not None:
+                        counts['flicker'] += 1
+                    elif at - passed_at < self.refresh:
+                        counts['duplicate'] += 1
+                    else:
+                        self._pass(spot_id, available, timestamp, (available, changed_at, at),
+                                   passed, accepted, counts)
+                elif at < changed_at:
+                    counts['stale'] += 1
+                elif at - changed_at < overrides.get(spot_id, default):
+                    held = pending.get(spot_id)
+                    if held is None or held[0] != available:
+                        pending[spot_id] = (available, at, changed_at + overrides.get(spot_id, default))
+                    counts['debounced'] += 1
+                else:
+                    pending.pop(spot_id, None)
+                    self._pass(spot_id, available, timestamp, (available, at, at), passed, accepted, counts)
+        for spot_id, (available, at, due) in list(pending.items()):
+            if now >= due and spot_id not in accepted:
+                del pending[spot_id]
+                passed[spot_id] = (available, at, at)
+                accepted[spot_id] = (available, at)
+                counts['released'] += 1
+        return accepted, counts, (passed, pending, pending != shared)
+
+    def _record(self, outcome, counts):
+        passed, pending, pending_changed = outcome
+        with self._lock:
+            for spot_id, state in passed.items():
+                self._last[spot_id] = state
+                self._last.move_to_end(spot_id)
+            while len(self._last) > self.maxsize:
+                self._last.popitem(last=False)
+            self._pending = pending
+            self.counters.update(counts)
+        if pending_changed:
+            cache.set(PENDING_KEY, pending, timeout=None)
+        self._publish(counts)
+
+    @staticmethod
+    def _pass(spot_id, available, timestamp, state, passed, accepted, counts):
+        passed[spot_id] = state
+        accepted[spot_id] = (available, timestamp)
+        counts['passed'] += 1
+
+    @staticmethod
+    def _publish(counts):
+        for name, count in counts.items():
+            if count:
+                key = COUNTER_KEY.format(name)
+                cache.add(key, 0, timeout=None)
+                cache.incr(key, count)
+
+    @staticmethod
+    def stats():
+        """Totals across every process sharing the cache."""
+        found = cache.get_many([COUNTER_KEY.format(name) for name in COUNTERS])
+        totals = {name: found.get(COUNTER_KEY.format(name), 0) for name in COUNTERS}
+        totals['suppressed'] = sum(totals[name] for name in SUPPRESSED)
+        return totals
+
+
+sensor_filter = SensorFilter()
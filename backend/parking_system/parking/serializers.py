@@ -12,6 +12,8 @@ class ParkingSpotSerializer(serializers.ModelSerializer):
     class Meta:
         model = ParkingSpot
         fields = '__all__'
+        # Mirrors lot_permit_access, maintained by the M2M signal handlers
+        read_only_fields = ['permit_mask']
 
 
 class ParkingLotMinimalSerializer(serializers.ModelSerializer):
@@ -21,27 +23,67 @@ class ParkingLotMinimalSerializer(serializers.ModelSerializer):
         fields = ['parking_lot_id', 'parking_lot_name']
 
 
+def query_list(request, name):
+    """Comma-separated query parameter as a set ('' and missing -> empty)."""
+    if request is None:
+        return set()
+    return {item.strip() for item in request.query_params.get(name, '').split(',') if item.strip()}
+
+
 class ParkingLotSerializer(serializers.ModelSerializer):
-    spots = ParkingSpotSerializer(many=True, read_only=True)
-    available_spots = serializers.SerializerMethodField()
-    total_spots = serializers.SerializerMethodField()
+    """Lot counters and permits; spots only when asked for.
+
+    Query parameters (read from the request in the serializer context):
+
+    - ``?fields=parking_lot_id,available_spots`` returns only those fields
+    - ``?expand=spots`` (or ``spots`` in ``fields``) adds a compact ``spots``
+      block: ``spot_ids`` in id order and an ``availability`` string with one
+      character per spot, ``1`` free / ``0`` taken
+
+    Unknown names in either parameter are ignored.
+    """
+    EXPANDS = ('spots',)
+
+    spots = serializers.SerializerMethodField()
     permit_types = PermitTypeSerializer(many=True, read_only=True)
 
     class Meta:
         model = ParkingLot
-        fields = ['parking_lot_id', 'parking_lot_name', 'occupancy', 'total_spots', 'available_spots', 'spots', 'permit_types']
-
-    def get_available_spots(self, obj):
-        # Use annotated value if available, otherwise query
-        if hasattr(obj, '_available_spots'):
-            return obj._available_spots
-        return obj.spots.filter(availability=True).count()
-
-    def get_total_spots(self, obj):
-        # Use annotated value if available, otherwise query
-        if hasattr(obj, '_total_spots'):
-            return obj._total_spots
-        return obj.spots.count()
+        fields = [
+            'parking_lot_id', 'parking_lot_name', 'occupancy', 'total_spots', 'available_spots',
+            'latitude', 'longitude', 'spots', 'permit_types',
+        ]
+        # Maintained by spot writes, never set through the API
+        read_only_fields = ['occupancy', 'total_spots', 'available_spots']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if not self.expands_spots(request):
+            self.fields.pop('spots')
+        requested, _ = self.requested(request)
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @classmethod
+    def requested(cls, request):
+        """``(fields, expands)`` asked for, limited to the names this serializer knows."""
+        return (
+            query_list(request, 'fields') & set(cls.Meta.fields),
+            query_list(request, 'expand') & set(cls.EXPANDS),
+        )
+
+    @staticmethod
+    def expands_spots(request):
+        return 'spots' in query_list(request, 'expand') | query_list(request, 'fields')
+
+    def get_spots(self, lot):
+        spots = sorted(lot.spots.all(), key=lambda spot: spot.parking_spot_id)
+        return {
+            'spot_ids': [spot.parking_spot_id for spot in spots],
+            'availability': ''.join('1' if spot.availability else '0' for spot in spots),
+        }
 
 
 class EventSerializer(serializers.ModelSerializer):
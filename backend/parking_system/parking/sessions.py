@@ -0,0 +1,116 @@
+"""Parking sessions follow spot occupancy.
+
+A spot turning occupied opens a session; turning available closes it. The
+partial unique constraint ``session_open_spot_uniq`` allows one open session
+per spot, and together with ``session_open_user_idx`` it only indexes open
+sessions - "who is parked here" and "where is this user parked" are index
+probes whose cost doesn't grow with session history.
+
+``apply_transitions`` is the bulk engine every writer goes through (ingest,
+the simulators, single-spot saves): a batch becomes bulk ``INSERT``s of new
+sessions and one ``UPDATE`` of end times per chunk of spots, so the query
+count doesn't depend on how many spots changed.
+
+Applying a transition twice, or after a newer one, changes nothing:
+
+- opening a spot that already has an open session is an ignored conflict;
+- closing only touches open sessions that started at or before the reading;
+- an occupied reading older than the spot's last departure starts its
+  session at that departure, so sessions of one spot never overlap.
+"""
+from django.db.models import Case, DateTimeField, F, Max, Value, When
+from django.utils import timezone
+
+from .models import Session
+
+# Same bound-parameter budget as ingest; each spot costs four in the CASE of the
+# end-time UPDATE
+CHUNK_SIZE = 900
+CASE_CHUNK_SIZE = CHUNK_SIZE // 4
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def apply_transitions(transitions, now=None):
+    """Open and close sessions for ``(spot_id, available, at)`` transitions.
+
+    ``at`` is when the change was seen (None for now; future times are
+    clamped to now). When a spot appears more than once the newest
+    transition wins.
+    """
+    now = now or timezone.now()
+    latest = {}
+    for spot_id, available, at in transitions:
+        at = now if at is None else min(at, now)
+        if spot_id not in latest or at >= latest[spot_id][1]:
+            latest[spot_id] = (available, at)
+    close_sessions({spot_id: at for spot_id, (available, at) in latest.items() if available})
+    open_sessions({spot_id: at for spot_id, (available, at) in latest.items() if not available}, now)
+
+
+def open_sessions(starts, now=None):
+    """Open a session per ``{spot_id: start_time}`` unless one is already open."""
+    now = now or timezone.now()
+    sessions = []
+    for chunk in _chunks(sorted(starts)):
+        earliest = min(starts[spot_id] for spot_id in chunk)
+        last_end = {}
+        if earliest < now:
+            # Late readings: don't start before the spot's last departure
+            last_end = dict(
+                Session.objects.filter(parking_spot_id__in=chunk, end_time__gt=earliest)
+                .values('parking_spot_id').annotate(last=Max('end_time'))
+                .values_list('parking_spot_id', 'last')
+            )
+        sessions.extend(
+            Session(parking_spot_id=spot_id, start_time=max(starts[spot_id], last_end.get(spot_id, starts[spot_id])))
+            for spot_id in chunk
+        )
+    Session.objects.bulk_create(sessions, ignore_conflicts=True)
+
+
+def close_sessions(ends):
+    """End the open sessions of ``{spot_id: end_time}``; returns rows matched."""
+    closed = 0
+    for chunk in _chunks(sorted(ends)):
+        times = {ends[spot_id] for spot_id in chunk}
+        if len(times) == 1:
+            # The usual batch: every change seen at the same moment
+            (end,) = times
+            closed += Session.objects.filter(
+                parking_spot_id__in=chunk, end_time__isnull=True, start_time__lte=end
+            ).update(end_time=end)
+            continue
+        for part in _chunks(chunk, CASE_CHUNK_SIZE):
+            # A session started after its reading stays open (default keeps NULL)
+            end_time = Case(
+                *(When(parking_spot_id=spot_id, start_time__lte=ends[spot_id], then=Value(ends[spot_id]))
+                  for spot_id in part),
+                default=F('end_time'),
+                output_field=DateTimeField(),
+            )
+            closed += Session.objects.filter(
+                parking_spot_id__in=part, end_time__isnull=True,
+                start_time__lte=max(ends[spot_id] for spot_id in part),
+            ).update(end_time=end_time)
+    return closed
+
+
+def spot_changed(spot_id, available, at=None):
+    """Apply one spot's availability transition."""
+    apply_transitions([(spot_id, available, at)])
+
+
+def current_sessions(spot_id=None, lot_id=None, user_id=None):
+    """Open sessions, narrowed to a spot, lot and/or user."""
+    sessions = Session.objects.filter(end_time__isnull=True)
+    if spot_id is not None:
+        sessions = sessions.filter(parking_spot_id=spot_id)
+    if lot_id is not None:
+        sessions = sessions.filter(parking_spot__parking_lot_id=lot_id)
+    if user_id is not None:
+        sessions = sessions.filter(user_id=user_id)
+    return sessions
@@ -0,0 +1,152 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .availability_index import availability_index
+from . import permits, sessions
+from .etags import bump_catalog
+from .models import Event, ParkingLot, ParkingSpot, PermitType, SensorDevice
+from .restrictions import resolver as restrictions
+from .sensor_filter import sensor_filter
+from .signing import sensor_keys
+from .snapshot import mark_stale
+from .spatial_index import spatial_index
+
+
+@receiver(post_save, sender=ParkingSpot)
+def sync_availability_index(sender, instance, created, **kwargs):
+    """Mirror single-spot saves into the in-process availability bitmaps."""
+    # _loaded_state still holds the pre-save values while post_save runs
+    previous = getattr(instance, '_loaded_state', None)
+    if previous != (instance.parking_lot_id, instance.availability):
+        transaction.on_commit(mark_stale)
+    if created or previous is None:
+        availability_index.invalidate(instance.parking_lot_id)
+    elif previous[0] != instance.parking_lot_id:
+        availability_index.invalidate(previous[0], instance.parking_lot_id)
+    elif previous[1] != instance.availability:
+        availability_index.apply([
+            (instance.parking_lot_id, instance.parking_spot_id, instance.availability)
+        ])
+
+
+@receiver(post_save, sender=ParkingSpot)
+def track_sessions(sender, instance, created, **kwargs):
+    """Occupied opens a session, available closes it."""
+    previous = getattr(instance, '_loaded_state', None)
+    if created:
+        if not instance.availability:
+            sessions.spot_changed(instance.parking_spot_id, False)
+    elif previous is not None and previous[1] is not None and previous[1] != instance.availability:
+        sessions.spot_changed(instance.parking_spot_id, instance.availability)
+
+
+@receiver(post_save, sender=ParkingSpot)
+def sync_spatial_index(sender, instance, created, **kwargs):
+    """Only layout changes touch the spatial index, not availability flips."""
+    previous = getattr(instance, '_loaded_state', None)
+    location = getattr(instance, '_loaded_location', None)
+    if created or previous is None:
+        spatial_index.invalidate(instance.parking_lot_id)
+    elif previous[0] != instance.parking_lot_id:
+        spatial_index.invalidate(previous[0], instance.parking_lot_id)
+    elif location != (instance.latitude, instance.longitude):
+        spatial_index.invalidate(instance.parking_lot_id)
+
+
+@receiver(post_save, sender=ParkingSpot)
+def sync_debounce_overrides(sender, instance, created, **kwargs):
+    """Per-spot debounce windows are cached by the sensor filter."""
+    previous = None if created else getattr(instance, '_loaded_debounce', None)
+    # Deferred on partially loaded spots - then it wasn't changed either
+    if instance.__dict__.get('debounce_seconds', previous) != previous:
+        transaction.on_commit(sensor_filter.invalidate_overrides)
+
+
+@receiver(post_delete, sender=ParkingSpot)
+def release_spot_counters(sender, instance, **kwargs):
+    """Remove a deleted spot from its lot's counters (covers queryset deletes too)."""
+    ParkingLot.adjust_counters(
+        instance.parking_lot_id,
+        total=-1,
+        available=-int(instance.availability),
+        occupied=-int(not instance.availability),
+    )
+    availability_index.invalidate(instance.parking_lot_id)
+    spatial_index.invalidate(instance.parking_lot_id)
+    transaction.on_commit(mark_stale)
+
+
+@receiver(post_save, sender=ParkingLot)
+@receiver(post_delete, sender=ParkingLot)
+def lot_layout_changed(sender, instance, **kwargs):
+    """Lot positions (and names) live in the spatial index."""
+    spatial_index.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=ParkingLot)
+@receiver(post_delete, sender=ParkingLot)
+@receiver(post_save, sender=PermitType)
+@receiver(post_delete, sender=PermitType)
+def lot_changed(sender, instance, **kwargs):
+    """Lots (or the permits they list) added, renamed or removed change the
+    status snapshot and every lot's ETag."""
+    transaction.on_commit(mark_stale)
+    transaction.on_commit(bump_catalog)
+
+
+@receiver(m2m_changed, sender=ParkingLot.permit_types.through)
+@receiver(m2m_changed, sender=ParkingSpot.lot_permit_access.through)
+def permit_access_changed(sender, instance, action, pk_set=None, **kwargs):
+    """Keep permit masks in step; permit mappings are also part of
+    permit-scoped responses (lots_for_permit)."""
+    model = ParkingLot if sender is ParkingLot.permit_types.through else ParkingSpot
+    permits.relation_changed(model, instance, action, pk_set)
+    if action == 'pre_clear' and isinstance(instance, PermitType) and sender is ParkingLot.permit_types.through:
+        # post_clear doesn't say which lots lost the permit
+        spatial_index.invalidate(*instance.parking_lots.values_list('pk', flat=True))
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(mark_stale)
+        if sender is ParkingLot.permit_types.through:
+            transaction.on_commit(bump_catalog)
+            lot_ids = [instance.pk] if isinstance(instance, ParkingLot) else pk_set
+            if lot_ids:
+                spatial_index.invalidate(*lot_ids)
+
+
+@receiver(post_save, sender=PermitType)
+@receiver(post_delete, sender=PermitType)
+def permit_type_changed(sender, instance, **kwargs):
+    """New permits get a bit; deleted ones must leave every mask."""
+    if kwargs.get('created') is None:
+        lot_ids = list(ParkingLot.objects.filter(permit_mask__hasbit=instance.bit).values_list('pk', flat=True))
+        permits.permit_deleted(instance)
+        # The bit may be handed to the next new permit
+        spatial_index.invalidate(*lot_ids)
+    else:
+        permits.forget_permit_bits()
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed(sender, instance, **kwargs):
+    """Event times and dates decide the restriction maps."""
+    restrictions.invalidate()
+
+
+@receiver(m2m_changed, sender=Event.restricted_lots.through)
+def restricted_lots_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        restrictions.invalidate()
+
+
+@receiver(post_save, sender=SensorDevice)
+@receiver(post_delete, sender=SensorDevice)
+def sensor_device_changed(sender, instance, **kwargs):
+    """Secrets, activation and spot mappings live in the key caches."""
+    sensor_keys.invalidate()
+
+
+@receiver(m2m_changed, sender=SensorDevice.spots.through)
+def sensor_spots_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        sensor_keys.invalidate()
@@ -0,0 +1,224 @@
+"""Signed sensor batches, verified before ingest touches the database.
+
+A ``SensorDevice`` signs a whole batch once:
+
+    {"device": "lot-a-gw", "payload": "<JSON text>", "signature": "<hex>"}
+
+``payload`` is the JSON text of ``{"timestamp": <epoch seconds>, "readings":
+[...]}`` (readings in the ``/api/sensors/ingest/`` format) and ``signature``
+is its HMAC-SHA256 under the device secret. The MAC covers the payload text
+exactly as sent, so nothing has to agree on a canonical JSON form, and one
+MAC covers the batch however many readings it carries.
+
+A batch is rejected as a whole when its device is unknown or inactive, the
+signature doesn't match, its timestamp is more than
+``PARKING_SENSOR_SIGNATURE_MAX_AGE`` seconds off, or it reports a spot the
+device isn't mapped to.
+
+``SensorKeyCache`` keeps device keys (secret and mapped spot ids) per
+process in an LRU of ``PARKING_SENSOR_KEY_CACHE_SIZE`` entries. Unknown
+names go to a separate LRU of ``PARKING_SENSOR_UNKNOWN_CACHE_SIZE`` entries,
+so a device retrying with a bad name costs one lookup, but a stream of made-up
+names can never push real keys out.
+Device saves, deletes and spot mapping changes bump ``VERSION_KEY`` after
+commit, which empties every process's cache on its next ``refresh()``.
+"""
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .counters import bump_counter, read_counter
+from .ingest import InvalidReading, parse_readings
+from .models import SensorDevice
+
+VERSION_KEY = 'sensor_keys:version'
+ENVELOPE_FIELDS = ('device', 'payload', 'signature')
+
+# secret: bytes; spot_ids: frozenset of the spots the device may report on
+DeviceKey = namedtuple('DeviceKey', ['secret', 'spot_ids'])
+
+
+class InvalidSignature(InvalidReading):
+    """A signed batch failed verification (device, signature, age or spot mapping)."""
+
+
+def is_signed(data):
+    return isinstance(data, dict) and 'signature' in data
+
+
+def signature(secret, payload):
+    """Hex HMAC-SHA256 of ``payload`` (str) under ``secret`` (str or bytes)."""
+    if isinstance(secret, str):
+        secret = secret.encode()
+    return hmac.new(secret, payload.encode(), hashlib.sha256).hexdigest()
+
+
+def sign_batch(device, secret, readings, timestamp=None):
+    """The envelope a device sends for ``readings``."""
+    payload = json.dumps({
+        'timestamp': time.time() if timestamp is None else timestamp,
+        'readings': readings,
+    }, separators=(',', ':'))
+    return {'device': device, 'payload': payload, 'signature': signature(secret, payload)}
+
+
+def envelope_device(envelope):
+    """Device name of a signed batch, after checking the envelope's shape."""
+    if not isinstance(envelope, dict) or not all(
+        isinstance(envelope.get(field), str) for field in ENVELOPE_FIELDS
+    ):
+        raise InvalidSignature('A signed batch needs device, payload and signature strings')
+    return envelope['device']
+
+
+def verify_envelope(envelope, key, now=None):
+    """Parsed readings of a signed batch; raises ``InvalidSignature`` if it doesn't check out.
+
+    ``key`` is the device's ``DeviceKey`` (None for unknown devices). Runs no
+    queries, so it can sit in front of any writer.
+    """
+    device = envelope_device(envelope)
+    if key is None:
+        raise InvalidSignature(f'Unknown sensor device {device!r}')
+    payload = envelope['payload']
+    if not hmac.compare_digest(signature(key.secret, payload), envelope['signature']):
+        raise InvalidSignature(f'Bad signature from sensor device {device!r}')
+
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        raise InvalidReading('Signed payload is not JSON')
+    if not isinstance(data, dict):
+        raise InvalidReading('Signed payload must be an object')
+    timestamp = data.get('timestamp')
+    if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)):
+        raise InvalidSignature('Signed payload needs a numeric timestamp')
+    age = (time.time() if now is None else now) - timestamp
+    if abs(age) > getattr(settings, 'PARKING_SENSOR_SIGNATURE_MAX_AGE', 300.0):
+        # Bounds how long a captured batch can be replayed
+        raise InvalidSignature(f'Signed batch from {device!r} is {age:.0f}s off the clock')
+
+    readings = parse_readings(data.get('readings'))
+    unmapped = readings.keys() - key.spot_ids
+    if unmapped:
+        raise InvalidSignature(
+            f'Sensor device {device!r} is not mapped to spots {sorted(unmapped)[:10]}'
+        )
+    return readings
+
+
+class SensorKeyCache:
+    """Per-process LRU of device keys, kept fresh via the cache version."""
+
+    def __init__(self, maxsize=None, unknown_maxsize=None):
+        self._maxsize = maxsize
+        self._unknown_maxsize = unknown_maxsize
+        # {device name: DeviceKey}, least recently used first
+        self._keys = OrderedDict()
+        # {device name: None} for names with no active device
+        self._unknown = OrderedDict()
+        self._version = None
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        if self._maxsize is not None:
+            return self._maxsize
+        return getattr(settings, 'PARKING_SENSOR_KEY_CACHE_SIZE', 1024)
+
+    @property
+    def unknown_maxsize(self):
+        if self._unknown_maxsize is not None:
+            return self._unknown_maxsize
+        return getattr(settings, 'PARKING_SENSOR_UNKNOWN_CACHE_SIZE', 256)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def reset(self):
+        with self._lock:
+            self._keys.clear()
+            self._unknown.clear()
+            self._version = None
+            self.counters.clear()
+
+    def refresh(self):
+        """Drop every cached key if devices changed since the last call."""
+        version = read_counter(VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                self._keys.clear()
+                self._unknown.clear()
+                self._version = version
+
+    def cached(self, name):
+        """``(found, key)`` without touching the database."""
+        with self._lock:
+            for entries in (self._keys, self._unknown):
+                if name in entries:
+                    entries.move_to_end(name)
+                    self.counters['hits'] += 1
+                    return True, entries[name]
+            return False, None
+
+    def get(self, name):
+        """Key of device ``name`` (None if unknown or inactive), loading it on a miss."""
+        found, key = self.cached(name)
+        if found:
+            return key
+        version = self._version
+        key = self.load(name)
+        with self._lock:
+            self.counters['misses'] += 1
+            if version != self._version:
+                # Refreshed while loading - the key may already be stale
+                return key
+            if key is None:
+                self._unknown[name] = None
+                while len(self._unknown) > self.unknown_maxsize:
+                    self._unknown.popitem(last=False)
+                return key
+            self._keys[name] = key
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+                self.counters['evictions'] += 1
+        return key
+
+    @staticmethod
+    def load(name):
+        device = SensorDevice.objects.filter(name=name, is_active=True).values_list(
+            'sensor_device_id', 'secret'
+        ).first()
+        if device is None:
+            return None
+        spot_ids = SensorDevice.spots.through.objects.filter(
+            sensordevice_id=device[0]
+        ).values_list('parkingspot_id', flat=True)
+        return DeviceKey(device[1].encode(), frozenset(spot_ids))
+
+    def verify(self, envelope, now=None):
+        """Check a signed batch against the current keys; returns its readings."""
+        self.refresh()
+        return verify_envelope(envelope, self.get(envelope_device(envelope)), now)
+
+    def stats(self):
+        return {
+            'size': len(self._keys),
+            'maxsize': self.maxsize,
+            'unknown': len(self._unknown),
+            **{name: self.counters[name] for name in ('hits', 'misses', 'evictions')},
+        }
+
+    @staticmethod
+    def invalidate():
+        transaction.on_commit(lambda: bump_counter(VERSION_KEY))
+
+
+sensor_keys = SensorKeyCache()
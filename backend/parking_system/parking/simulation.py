@@ -0,0 +1,214 @@
+"""Vectorized occupancy simulation for many lots at once.
+
+``VectorizedSimulation`` keeps every simulated spot in flat NumPy arrays
+sorted by lot, so a tick is a handful of array operations no matter how many
+lots there are:
+
+1. per-lot occupied counts with ``np.add.reduceat``;
+2. per-lot step sizes towards the target (same gain / max-step rules as the
+   per-lot simulator);
+3. a random key per candidate spot, ranked within its lot with one
+   ``np.lexsort``, so each lot flips its ``step`` lowest-keyed candidates.
+
+Flips are written with chunked ``UPDATE ... WHERE id IN (...)`` statements
+filtered on the old state, all lot counters are shifted with a single
+CASE update, and sessions are opened and closed with one bulk INSERT and one
+UPDATE. If another writer touched a simulated spot in the meantime the
+row counts don't add up; the UPDATEs are then rolled back to a savepoint and
+redone for only the spots still in their old state (locked and read first),
+so the index and sessions only see transitions this tick made. The touched
+lots are recounted and the arrays reloaded from the database.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import sessions
+from .availability_index import availability_index
+from .ingest import CHUNK_SIZE
+from .models import ParkingLot, ParkingSpot
+
+
+class VectorizedSimulation:
+    """Array-backed simulator state for a set of lots."""
+
+    def __init__(self, lot_ids=None, seed=None):
+        self.lot_filter = lot_ids
+        self.rng = np.random.default_rng(seed)
+        self.load()
+
+    def load(self):
+        """(Re)load spot state for the simulated lots from the database."""
+        lots = ParkingLot.objects.order_by('parking_lot_id')
+        spots = ParkingSpot.objects.order_by('parking_lot_id', 'parking_spot_id')
+        if self.lot_filter is not None:
+            lots = lots.filter(parking_lot_id__in=self.lot_filter)
+            spots = spots.filter(parking_lot_id__in=self.lot_filter)
+        self.lot_names = dict(lots.values_list('parking_lot_id', 'parking_lot_name'))
+
+        rows = np.array(
+            list(spots.values_list('parking_spot_id', 'parking_lot_id', 'availability')),
+            dtype=np.int64,
+        ).reshape(-1, 3)
+        self.spot_ids = rows[:, 0]
+        spot_lots = rows[:, 1]
+        self.occupied = rows[:, 2] == 0
+
+        # Spots are sorted by lot, so each lot is one contiguous slice
+        self.lot_ids, self.lot_starts, self.totals = np.unique(
+            spot_lots, return_index=True, return_counts=True
+        )
+        self.spot_lot = np.repeat(np.arange(len(self.lot_ids)), self.totals)
+
+    def __len__(self):
+        return len(self.spot_ids)
+
+    def occupied_counts(self):
+        if not len(self.spot_ids):
+            return np.zeros(0, dtype=np.int64)
+        return np.add.reduceat(self.occupied.astype(np.int64), self.lot_starts)
+
+    def plan(self, target, gain, max_step_percent):
+        """Indices of the spots to flip this tick."""
+        if not len(self.spot_ids):
+            return np.zeros(0, dtype=np.int64)
+        occupied = self.occupied_counts()
+        diff = np.rint(self.totals * target).astype(np.int64) - occupied
+        step = np.minimum(
+            np.rint(np.abs(diff) * gain).astype(np.int64),
+            np.maximum(1, np.rint(self.totals * max_step_percent).astype(np.int64)),
+        )
+        # Close enough to target - leave the lot alone
+        step[np.abs(diff) <= 1] = 0
+
+        # Lots below target occupy free spots, lots above it free occupied ones
+        wants_occupied = diff > 0
+        candidates = np.flatnonzero(
+            (step[self.spot_lot] > 0) & (self.occupied != wants_occupied[self.spot_lot])
+        )
+        if not len(candidates):
+            return candidates
+
+        lots = self.spot_lot[candidates]
+        order = np.lexsort((self.rng.random(len(candidates)), lots))
+        candidates, lots = candidates[order], lots[order]
+        # Rank of each candidate within its lot's shuffled run
+        run_starts = np.flatnonzero(np.r_[True, lots[1:] != lots[:-1]])
+        run_lengths = np.diff(np.r_[run_starts, len(lots)])
+        rank = np.arange(len(lots)) - np.repeat(run_starts, run_lengths)
+        return candidates[rank < step[lots]]
+
+    def tick(self, target, gain, max_step_percent):
+        """Advance one tick; returns one summary per lot that changed."""
+        flips = self.plan(target, gain, max_step_percent)
+        if not len(flips):
+            return []
+
+        occupy = flips[~self.occupied[flips]]
+        free = flips[self.occupied[flips]]
+        changed_lots = np.unique(self.spot_lot[flips])
+        changed_lot_ids = self.lot_ids[changed_lots].tolist()
+
+        with transaction.atomic():
+            as_planned = self._write_planned(occupy, free)
+            if as_planned:
+                # Spots freed per lot (negative when taken)
+                freed = (
+                    np.bincount(self.spot_lot[free], minlength=len(self.lot_ids))
+                    - np.bincount(self.spot_lot[occupy], minlength=len(self.lot_ids))
+                )
+                ParkingLot.adjust_availability(
+                    dict(zip(changed_lot_ids, freed[changed_lots].tolist()))
+                )
+            else:
+                # Someone else changed simulated spots - flip only the ones still as we knew
+                # them, and trust the database for the counters
+                occupy = self._write_matching(occupy, available=False)
+                free = self._write_matching(free, available=True)
+                self._recount(changed_lot_ids)
+            changes = [
+                (lot_id, spot_id, available)
+                for indices, available in ((occupy, False), (free, True))
+                for lot_id, spot_id in zip(
+                    self.lot_ids[self.spot_lot[indices]].tolist(), self.spot_ids[indices].tolist()
+                )
+            ]
+            availability_index.apply(changes)
+            sessions.apply_transitions((spot_id, available, None) for _, spot_id, available in changes)
+
+        if as_planned:
+            self.occupied[flips] = ~self.occupied[flips]
+        else:
+            self.load()
+        return self._summaries(changed_lot_ids, changes)
+
+    def _write_planned(self, occupy, free):
+        """Flip every planned spot; writes nothing and returns False if any had changed."""
+        with transaction.atomic():
+            updated = (
+                self._write(self.spot_ids[occupy].tolist(), available=False)
+                + self._write(self.spot_ids[free].tolist(), available=True)
+            )
+            if updated == len(occupy) + len(free):
+                return True
+            # Which rows matched is unknown - undo them all
+            transaction.set_rollback(True)
+        return False
+
+    @staticmethod
+    def _write(spot_ids, available):
+        updated = 0
+        for i in range(0, len(spot_ids), CHUNK_SIZE):
+            # Filtering on the old state makes concurrent writers detectable
+            updated += ParkingSpot.objects.filter(
+                parking_spot_id__in=spot_ids[i:i + CHUNK_SIZE], availability=not available
+            ).update(availability=available)
+        return updated
+
+    def _write_matching(self, indices, available):
+        """Flip the spots at ``indices`` still in the old state; returns the indices flipped."""
+        spot_ids = self.spot_ids[indices].tolist()
+        flipped = []
+        for i in range(0, len(spot_ids), CHUNK_SIZE):
+            matched = list(ParkingSpot.objects.select_for_update().filter(
+                parking_spot_id__in=spot_ids[i:i + CHUNK_SIZE], availability=not available
+            ).values_list('parking_spot_id', flat=True))
+            ParkingSpot.objects.filter(parking_spot_id__in=matched).update(availability=available)
+            flipped += matched
+        return indices[np.isin(self.spot_ids[indices], flipped)]
+
+    @staticmethod
+    def _recount(lot_ids):
+        for lot_id, total, available in ParkingLot.objects.filter(
+            parking_lot_id__in=lot_ids
+        ).annotate(
+            actual_total=Count('spots'),
+            actual_available=Count('spots', filter=Q(spots__availability=True)),
+        ).values_list('parking_lot_id', 'actual_total', 'actual_available'):
+            ParkingLot.objects.filter(parking_lot_id=lot_id).update(
+                total_spots=total, available_spots=available, occupancy=total - available
+            )
+
+    def _summaries(self, lot_ids, changes):
+        spots = {lot_id: [] for lot_id in lot_ids}
+        for lot_id, spot_id, available in changes:
+            spots[lot_id].append({'spot_id': spot_id, 'available': available})
+
+        counters = ParkingLot.objects.filter(parking_lot_id__in=lot_ids).values_list(
+            'parking_lot_id', 'total_spots', 'available_spots'
+        )
+        timestamp = timezone.now().isoformat()
+        return [
+            {
+                'lot_id': lot_id,
+                'lot_name': self.lot_names.get(lot_id, ''),
+                'occupancy': total - available,
+                'total_spots': total,
+                'available_spots': available,
+                'occupancy_percent': round((total - available) / total * 100, 1) if total > 0 else 0,
+                'spots': spots[lot_id],
+                'timestamp': timestamp,
+            }
+            for lot_id, total, available in counters.order_by('parking_lot_id')
+        ]
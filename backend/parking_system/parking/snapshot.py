@@ -0,0 +1,106 @@
+"""Shared, pre-serialized lot status for WebSocket connects and get_status.
+
+The status of every lot is serialized to JSON once and kept in the cache
+together with the generation it was built for. State changes bump the
+generation (``mark_stale``); producers also rebuild right away
+(``refresh_status_snapshot``) so connects rarely pay for it. The same query
+refreshes the dashboard rows.
+
+Both are stale-while-revalidate entries (see ``swr``): one worker rebuilds
+under a short lock while the others keep serving the previous value, or wait
+briefly when there is none yet.
+"""
+import json
+
+from .counters import bump_counter, read_counter
+from .models import ParkingLot
+from .restrictions import resolver as restrictions
+from .swr import StaleWhileRevalidate
+
+GENERATION_KEY = 'parking_status:generation'
+
+# Versioned by generation only - producers refresh it on every change
+status_cache = StaleWhileRevalidate('parking_status:snapshot')
+# Also re-read every couple of seconds, in case counters moved without a bump
+dashboard_cache = StaleWhileRevalidate('dashboard_summary', soft_ttl=2, hard_ttl=60)
+
+LOCK_KEY = status_cache.lock_key()
+
+
+def build_status():
+    """Current status of all parking lots (one query over the lot counters)."""
+    lots = ParkingLot.objects.values_list(
+        'parking_lot_id', 'parking_lot_name', 'total_spots', 'available_spots'
+    ).order_by('parking_lot_id')
+    return [
+        {
+            'lot_id': lot_id,
+            'lot_name': name,
+            'total_spots': total,
+            'available_spots': available,
+            'occupancy': total - available,
+            'occupancy_percent': round((total - available) / total * 100, 1) if total > 0 else 0
+        }
+        for lot_id, name, total, available in lots
+    ]
+
+
+def dashboard_rows(status):
+    """Dashboard representation of ``build_status()`` rows."""
+    return [
+        {
+            'id': lot['lot_id'],
+            'name': lot['lot_name'],
+            'total_spots': lot['total_spots'],
+            'available_spots': lot['available_spots'],
+            'occupancy_percent': lot['occupancy_percent'],
+        }
+        for lot in status
+    ]
+
+
+def mark_stale():
+    """Record that lot state changed; the next reader or producer rebuilds."""
+    return bump_counter(GENERATION_KEY)
+
+
+def current_generation():
+    return read_counter(GENERATION_KEY)
+
+
+def _rebuild(generation):
+    status = build_status()
+    dashboard_cache.put(dashboard_rows(status), generation)
+    return json.dumps(status)
+
+
+def refresh_status_snapshot():
+    """Called by producers after applying changes: push fresh values to readers."""
+    generation = mark_stale()
+    return status_cache.refresh(lambda: _rebuild(generation), generation)
+
+
+def get_status_snapshot():
+    """Return (generation, data_json) for the current status."""
+    generation = current_generation()
+    return status_cache.get(lambda: _rebuild(generation), generation)
+
+
+def get_dashboard(generation=None):
+    """Return (generation, rows) for the dashboard."""
+    if generation is None:
+        generation = current_generation()
+    return dashboard_cache.get(lambda: dashboard_rows(build_status()), generation)
+
+
+def status_frame(message_type):
+    """Complete WebSocket frame text, without re-serializing the lot data.
+
+    ``restricted`` lists the lots closed by an event right now.
+    """
+    generation, data = get_status_snapshot()
+    restricted = json.dumps(sorted(restrictions.restricted_lots()))
+    return (
+        f'{{"type": "{message_type}", "version": {generation}, '
+        f'"restricted": {restricted}, "data": {data}}}'
+    )
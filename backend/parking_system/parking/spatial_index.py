@@ -0,0 +1,238 @@
+"""In-process grid index of spot locations for nearest-spot queries.
+
+Every spot with a position (its own, or its lot's when it has none) sits in a
+square grid cell of ``CELL_DEGREES``. A query walks rings of cells outward
+from the target, keeps the best ``k`` matches in a heap, and stops as soon as
+the next ring cannot hold anything closer. Availability comes from the
+availability bitmaps, so a query never touches the spot table.
+
+Updates are incremental per lot. The shared cache holds a generation
+(``spatial_index:generation``) and a version per lot
+(``spatial_index:version:<lot_id>``); layout changes bump both after commit.
+A reader that sees a new generation compares lot versions and reloads only
+the lots that changed. Missing keys are seeded from the clock, so a cache
+flush can't make an old version current again. As with the availability
+index, several workers need a shared cache to see each other's changes.
+"""
+import heapq
+import math
+import threading
+from itertools import groupby
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .availability_index import availability_index
+from .counters import bump_counter, read_counter, seed_counter
+from .models import ParkingLot, ParkingSpot
+from .permits import permit_bits
+
+GENERATION_KEY = 'spatial_index:generation'
+VERSION_KEY = 'spatial_index:version:{}'
+
+# ~110 m north-south; a campus fits in a few hundred cells
+CELL_DEGREES = 0.001
+METERS_PER_DEGREE = 111_320
+
+
+def distance_m(lat1, lon1, lat2, lon2):
+    """Equirectangular distance in meters (accurate at campus scale)."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * 6_371_000
+
+
+def cell_of(lat, lon):
+    return math.floor(lat / CELL_DEGREES), math.floor(lon / CELL_DEGREES)
+
+
+def ring_cells(origin, ring):
+    """Cells at Chebyshev distance ``ring`` from ``origin``."""
+    row, col = origin
+    if ring == 0:
+        yield origin
+        return
+    for dc in range(-ring, ring + 1):
+        yield row - ring, col + dc
+        yield row + ring, col + dc
+    for dr in range(-ring + 1, ring):
+        yield row + dr, col - ring
+        yield row + dr, col + ring
+
+
+class LotLocations:
+    """Positioned spots and query metadata of one lot."""
+    __slots__ = ('lot_id', 'name', 'permit_mask', 'points', 'version')
+
+    def __init__(self, lot_id, name, permit_mask, points, version):
+        self.lot_id = lot_id
+        self.name = name
+        self.permit_mask = permit_mask
+        # [(spot_id, lat, lon, cell)]
+        self.points = points
+        self.version = version
+
+
+class SpatialIndex:
+    """Per-process grid over every positioned spot, refreshed per lot."""
+
+    def __init__(self):
+        self._lots = {}
+        self._cells = {}
+        self._generation = None
+        self._lock = threading.RLock()
+
+    def reset(self):
+        with self._lock:
+            self._lots.clear()
+            self._cells.clear()
+            self._generation = None
+
+    def invalidate(self, *lot_ids):
+        """Spots moved, or a lot's position or permits changed."""
+        def publish():
+            for key in [GENERATION_KEY, *(VERSION_KEY.format(lot_id) for lot_id in lot_ids)]:
+                bump_counter(key)
+        transaction.on_commit(publish)
+
+    def refresh(self):
+        """Reload the lots whose version moved since this process last looked."""
+        generation = read_counter(GENERATION_KEY)
+        if generation == self._generation:
+            return
+        lot_ids = list(ParkingLot.objects.values_list('parking_lot_id', flat=True))
+        keys = {VERSION_KEY.format(lot_id): lot_id for lot_id in lot_ids}
+        found = cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            # First sight of these lots (or a flushed cache): give them a version
+            for key in missing:
+                seed_counter(key)
+            found.update(cache.get_many(missing))
+        versions = {keys[key]: value for key, value in found.items()}
+        with self._lock:
+            stale = [
+                lot_id for lot_id in lot_ids
+                if lot_id not in self._lots or self._lots[lot_id].version != versions.get(lot_id)
+            ]
+            for lot_id in set(self._lots) - set(lot_ids):
+                self._remove(lot_id)
+        if stale:
+            self._load(stale, versions)
+        self._generation = generation
+
+    def _load(self, lot_ids, versions):
+        lots = {
+            lot.parking_lot_id: lot
+            for lot in ParkingLot.objects.filter(parking_lot_id__in=lot_ids).only(
+                'parking_lot_id', 'parking_lot_name', 'latitude', 'longitude', 'permit_mask'
+            )
+        }
+        points = {lot_id: [] for lot_id in lots}
+        spots = ParkingSpot.objects.filter(parking_lot_id__in=lot_ids).order_by(
+            'parking_spot_id'
+        ).values_list('parking_spot_id', 'parking_lot_id', 'latitude', 'longitude')
+        for spot_id, lot_id, lat, lon in spots.iterator(chunk_size=5000):
+            lot = lots.get(lot_id)
+            if lat is None or lon is None:
+                if lot is None or lot.latitude is None or lot.longitude is None:
+                    continue
+                lat, lon = lot.latitude, lot.longitude
+            points[lot_id].append((spot_id, lat, lon, cell_of(lat, lon)))
+
+        with self._lock:
+            for lot_id in lot_ids:
+                self._remove(lot_id)
+            for lot_id, lot in lots.items():
+                entry = LotLocations(
+                    lot_id, lot.parking_lot_name, lot.permit_mask,
+                    points[lot_id], versions.get(lot_id),
+                )
+                self._lots[lot_id] = entry
+                for spot_id, lat, lon, cell in entry.points:
+                    self._cells.setdefault(cell, []).append((spot_id, lot_id, lat, lon))
+
+    def _remove(self, lot_id):
+        entry = self._lots.pop(lot_id, None)
+        if entry is None:
+            return
+        for cell in {point[3] for point in entry.points}:
+            remaining = [point for point in self._cells[cell] if point[1] != lot_id]
+            if remaining:
+                self._cells[cell] = remaining
+            else:
+                del self._cells[cell]
+
+    def _rings(self, origin):
+        """(ring, occupied cells) in increasing ring order."""
+        ring = 0
+        seen = 0
+        while seen < len(self._cells):
+            if 8 * ring > len(self._cells):
+                # Sparse surroundings - rank the occupied cells directly
+                remaining = sorted(
+                    (max(abs(cell[0] - origin[0]), abs(cell[1] - origin[1])), cell)
+                    for cell in self._cells
+                )
+                for far, group in groupby(remaining, key=lambda item: item[0]):
+                    if far >= ring:
+                        yield far, [cell for _, cell in group]
+                return
+            cells = [cell for cell in ring_cells(origin, ring) if cell in self._cells]
+            seen += len(cells)
+            yield ring, cells
+            ring += 1
+
+    def nearest_available(self, lat, lon, k=5, permit_id=None, max_distance=None, exclude_lots=()):
+        """Up to ``k`` closest free spots as (distance_m, spot_id, lot_id, lat, lon).
+
+        ``permit_id`` limits results to lots that list that permit; lots in
+        ``exclude_lots`` (e.g. closed by an event) are skipped.
+        """
+        self.refresh()
+        permit_mask = None
+        if permit_id is not None:
+            bit = permit_bits().get(permit_id)
+            permit_mask = 0 if bit is None else 1 << bit
+        origin = cell_of(lat, lon)
+        # Smallest cell edge in meters, for the ring lower bound
+        cell_m = CELL_DEGREES * METERS_PER_DEGREE * min(1.0, math.cos(math.radians(lat)))
+        best = []  # max-heap of (-distance, spot_id, lot_id, lat, lon)
+        bitmaps = {}
+        with self._lock:
+            for ring, cells in self._rings(origin):
+                # Anything in this ring or beyond is at least this far away
+                bound = max(0, ring - 1) * cell_m
+                if max_distance is not None and bound > max_distance:
+                    break
+                if len(best) == k and bound >= -best[0][0]:
+                    break
+                for cell in cells:
+                    for spot_id, lot_id, spot_lat, spot_lon in self._cells[cell]:
+                        if lot_id in exclude_lots:
+                            continue
+                        entry = self._lots[lot_id]
+                        if permit_mask is not None and not entry.permit_mask & permit_mask:
+                            continue
+                        distance = distance_m(lat, lon, spot_lat, spot_lon)
+                        if max_distance is not None and distance > max_distance:
+                            continue
+                        if len(best) == k and distance >= -best[0][0]:
+                            continue
+                        if lot_id not in bitmaps:
+                            bitmaps[lot_id] = availability_index.get(lot_id)
+                        if not bitmaps[lot_id].is_available(spot_id):
+                            continue
+                        item = (-distance, spot_id, lot_id, spot_lat, spot_lon)
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        else:
+                            heapq.heapreplace(best, item)
+        return sorted((-distance, *rest) for distance, *rest in best)
+
+    def lot_name(self, lot_id):
+        entry = self._lots.get(lot_id)
+        return entry.name if entry is not None else ''
+
+
+spatial_index = SpatialIndex()
@@ -0,0 +1,82 @@
+"""Stale-while-revalidate cache entries with single-flight recomputes.
+
+An entry is stored as ``(version, built_at, value)``. Readers pass the
+version they expect (usually the status generation):
+
+- built for that version and younger than ``soft_ttl``: served as is;
+- otherwise stale: the first reader takes a short cache lock and recomputes,
+  while every other reader keeps serving the stale value;
+- entries are dropped by the cache after ``hard_ttl``. A cold reader that is
+  locked out waits briefly for the recompute, then computes itself.
+
+Producers that already hold the fresh value ``put`` it, so readers never pay
+for the recompute at all. Callers get back the version the value was built
+for, which is what ETags and frame versions should carry.
+"""
+import time
+
+from django.core.cache import cache
+
+LOCK_TIMEOUT = 5
+WAIT_TIMEOUT = 1.0
+WAIT_INTERVAL = 0.02
+
+
+class StaleWhileRevalidate:
+    """One cached value (or one per ``variant``) with soft and hard TTLs."""
+
+    def __init__(self, name, soft_ttl=None, hard_ttl=None, lock_timeout=LOCK_TIMEOUT,
+                 wait_timeout=WAIT_TIMEOUT):
+        self.name = name
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+
+    def key(self, variant=''):
+        return f'{self.name}:{variant}' if variant else self.name
+
+    def lock_key(self, variant=''):
+        return f'{self.key(variant)}:lock'
+
+    def put(self, value, version=None, variant=''):
+        """Store a fresh value; returns (version, value)."""
+        cache.set(self.key(variant), (version, time.time(), value), timeout=self.hard_ttl)
+        return version, value
+
+    def is_fresh(self, entry, version):
+        if entry[0] != version:
+            return False
+        return self.soft_ttl is None or time.time() - entry[1] < self.soft_ttl
+
+    def refresh(self, compute, version=None, variant=''):
+        """Recompute unless another worker already is; returns (version, value) or None."""
+        lock = self.lock_key(variant)
+        if not cache.add(lock, 1, timeout=self.lock_timeout):
+            return None
+        try:
+            return self.put(compute(), version, variant)
+        finally:
+            cache.delete(lock)
+
+    def get(self, compute, version=None, variant=''):
+        """Return (version, value), recomputing at most once across workers."""
+        entry = cache.get(self.key(variant))
+        if entry is not None and self.is_fresh(entry, version):
+            return entry[0], entry[2]
+
+        refreshed = self.refresh(compute, version, variant)
+        if refreshed is not None:
+            return refreshed
+        if entry is not None:
+            # Another worker is recomputing - the stale value is good enough
+            return entry[0], entry[2]
+
+        # Cold cache and someone else holds the lock: wait for their result
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = cache.get(self.key(variant))
+            if entry is not None:
+                return entry[0], entry[2]
+        return self.put(compute(), version, variant)
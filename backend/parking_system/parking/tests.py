@@ -1,9 +1,39 @@
-from django.test import TestCase
+import asyncio
+import json
+import sys
+import time as time_module
+from types import SimpleNamespace
+from unittest.mock import patch
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.core.management import CommandError, call_command
+from io import StringIO
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
 from rest_framework.test import APITestCase
 from rest_framework import status
-from datetime import date, time, timedelta
-from parking.models import User, PermitType, ParkingLot, ParkingSpot, Vehicle, Event, Session
+from datetime import UTC, date, datetime, time, timedelta
+from parking.models import (
+    User, PermitType, ParkingLot, ParkingSpot, Vehicle, Event, Session,
+    OccupancySample, OccupancyRollup, SensorDevice,
+)
+from parking.availability_index import LotBitmap, availability_index, VERSION_KEY
+from parking.broadcast import SUMMARY_GROUP, CoalescingBroadcaster, apublish_lot_updates, lot_group
+from parking.consumers import ParkingConsumer
+from parking.gateway import LocalBroker, LocalTransport, MqttTransport, SensorGateway, topic_matches
+from parking import changelog, history, permits, retention, sessions, snapshot
+from parking.restrictions import resolver as restrictions
+from parking.sensor_filter import SensorFilter, sensor_filter
+from parking.signing import SensorKeyCache, sensor_keys, sign_batch
+from parking.ingest import apply_readings
+from parking.simulation import VectorizedSimulation
+from parking.management.commands.simulate_realtime import Command as SimulateRealtimeCommand
+from parking.spatial_index import spatial_index
+from parking.swr import StaleWhileRevalidate
 
 
 # =============================================================================
@@ -156,6 +186,491 @@ class ParkingSpotModelTest(TestCase):
         self.assertEqual(lot.spots.count(), 2)
 
 
+class LotCounterTest(TestCase):
+    """Test the denormalized lot availability counters"""
+
+    def setUp(self):
+        self.lot = ParkingLot.objects.create(parking_lot_name='Counter Lot')
+        self.spots = [ParkingSpot.objects.create(parking_lot=self.lot) for _ in range(3)]
+
+    def assertCounters(self, total, available):
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.total_spots, total)
+        self.assertEqual(self.lot.available_spots, available)
+        self.assertEqual(self.lot.occupancy, total - available)
+
+    def test_spot_create_increments_counters(self):
+        """Test creating spots updates total and available counts"""
+        ParkingSpot.objects.create(parking_lot=self.lot, availability=False)
+        self.assertCounters(total=4, available=3)
+
+    def test_availability_transition_updates_counters(self):
+        """Test flipping a spot adjusts available count once"""
+        spot = ParkingSpot.objects.get(pk=self.spots[0].pk)
+        spot.availability = False
+        spot.save()
+        spot.save()  # Saving again without a transition changes nothing
+        self.assertCounters(total=3, available=2)
+
+    def test_stale_spot_copies_flip_once(self):
+        """Test two copies loaded before either flip (concurrent PATCHes) apply one delta"""
+        first = ParkingSpot.objects.get(pk=self.spots[0].pk)
+        second = ParkingSpot.objects.get(pk=self.spots[0].pk)
+        for spot in (first, second):
+            spot.availability = False
+            spot.save()
+        self.assertCounters(total=3, available=2)
+        self.assertEqual(Session.objects.filter(parking_spot=self.spots[0]).count(), 1)
+        second.availability = True
+        second.save()
+        self.assertCounters(total=3, available=3)
+
+    def test_spot_delete_decrements_counters(self):
+        """Test deleting spots (including queryset deletes) updates counts"""
+        self.spots[0].delete()
+        ParkingSpot.objects.filter(pk=self.spots[1].pk).delete()
+        self.assertCounters(total=1, available=1)
+
+    def test_spot_moved_between_lots(self):
+        """Test moving a spot shifts counts between lots"""
+        other = ParkingLot.objects.create(parking_lot_name='Other Lot')
+        spot = ParkingSpot.objects.get(pk=self.spots[0].pk)
+        spot.parking_lot = other
+        spot.save()
+        self.assertCounters(total=2, available=2)
+        other.refresh_from_db()
+        self.assertEqual(other.total_spots, 1)
+
+    def test_stale_lot_save_keeps_counters(self):
+        """Test saving a stale lot instance doesn't overwrite counters"""
+        stale = ParkingLot.objects.get(pk=self.lot.pk)
+        ParkingSpot.objects.create(parking_lot=self.lot)
+        stale.parking_lot_name = 'Renamed Lot'
+        stale.save()
+        self.assertCounters(total=4, available=4)
+        self.assertEqual(self.lot.parking_lot_name, 'Renamed Lot')
+
+    def test_reconcile_command_repairs_drift(self):
+        """Test reconcile_lot_counters fixes counters that drifted"""
+        ParkingSpot.objects.filter(pk=self.spots[0].pk).update(availability=False)
+        ParkingLot.objects.filter(pk=self.lot.pk).update(total_spots=10)
+
+        call_command('reconcile_lot_counters', '--dry-run', stdout=StringIO())
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.total_spots, 10)
+
+        out = StringIO()
+        call_command('reconcile_lot_counters', stdout=out)
+        self.assertIn('Repaired counters on 1 lot(s)', out.getvalue())
+        self.assertCounters(total=3, available=2)
+
+
+class PermitMaskTest(TestCase):
+    """Test the denormalized permit access masks"""
+
+    def setUp(self):
+        self.student = PermitType.objects.create(name='Student')
+        self.faculty = PermitType.objects.create(name='Faculty')
+        self.lot = ParkingLot.objects.create(parking_lot_name='Mask Lot')
+        self.spot = ParkingSpot.objects.create(parking_lot=self.lot)
+
+    def mask(self, obj):
+        return type(obj).objects.values_list('permit_mask', flat=True).get(pk=obj.pk)
+
+    def test_permits_get_distinct_bits(self):
+        """Test each permit type gets its own bit"""
+        self.assertNotEqual(self.student.bit, self.faculty.bit)
+        self.assertEqual(self.student.mask, 1 << self.student.bit)
+
+    def test_forward_changes_update_mask(self):
+        """Test add/remove/clear from the lot side"""
+        self.lot.permit_types.add(self.student, self.faculty)
+        self.assertEqual(self.mask(self.lot), self.student.mask | self.faculty.mask)
+        self.lot.permit_types.remove(self.student)
+        self.assertEqual(self.mask(self.lot), self.faculty.mask)
+        self.lot.permit_types.clear()
+        self.assertEqual(self.mask(self.lot), 0)
+
+    def test_reverse_changes_update_mask(self):
+        """Test add/remove/clear from the permit side, for lots and spots"""
+        self.faculty.parking_lots.add(self.lot)
+        self.faculty.accessible_spots.add(self.spot)
+        self.assertEqual(self.mask(self.lot), self.faculty.mask)
+        self.assertEqual(self.mask(self.spot), self.faculty.mask)
+        self.faculty.parking_lots.remove(self.lot)
+        self.faculty.accessible_spots.clear()
+        self.assertEqual(self.mask(self.lot), 0)
+        self.assertEqual(self.mask(self.spot), 0)
+
+    def test_stale_instance_save_keeps_mask(self):
+        """Test saving an instance loaded before a permit change keeps the mask"""
+        stale_lot = ParkingLot.objects.get(pk=self.lot.pk)
+        stale_spot = ParkingSpot.objects.get(pk=self.spot.pk)
+        self.lot.permit_types.add(self.student)
+        self.spot.lot_permit_access.add(self.student)
+        stale_lot.parking_lot_name = 'Renamed'
+        stale_lot.save()
+        stale_spot.availability = False
+        stale_spot.save()
+        self.assertEqual(self.mask(self.lot), self.student.mask)
+        self.assertEqual(self.mask(self.spot), self.student.mask)
+
+    def test_deleted_permit_leaves_masks(self):
+        """Test a deleted permit's bit is cleared before it can be reused"""
+        self.lot.permit_types.add(self.student)
+        bit = self.student.bit
+        self.student.delete()
+        self.assertEqual(self.mask(self.lot), 0)
+        self.assertEqual(PermitType.objects.create(name='Visitor').bit, bit)
+
+    def test_rebuild_from_bulk_inserts(self):
+        """Test rebuild_permit_masks repairs through rows written without signals"""
+        through = ParkingLot.permit_types.through
+        through.objects.create(parkinglot_id=self.lot.pk, permittype_id=self.faculty.pk)
+        self.assertEqual(self.mask(self.lot), 0)
+        permits.rebuild_permit_masks()
+        self.assertEqual(self.mask(self.lot), self.faculty.mask)
+
+    def test_dry_run_reports_mask_drift(self):
+        """Test reconcile_lot_counters --dry-run --permit-masks reports drift without fixing it"""
+        through = ParkingLot.permit_types.through
+        through.objects.create(parkinglot_id=self.lot.pk, permittype_id=self.faculty.pk)
+        out = StringIO()
+        call_command('reconcile_lot_counters', '--dry-run', '--permit-masks', stdout=out)
+        self.assertIn('1 lot(s) and 0 spot(s) have drifted permit masks', out.getvalue())
+        self.assertEqual(self.mask(self.lot), 0)
+
+    def test_permit_bits_follow_committed_changes(self):
+        """Test the cached permit bits are replaced for every worker once a permit commits"""
+        cache.clear()
+        self.assertEqual(permits.permit_bits()[self.faculty.pk], self.faculty.bit)
+        with self.captureOnCommitCallbacks(execute=True):
+            visitor = PermitType.objects.create(name='Visitor')
+        self.assertEqual(permits.permit_bits()[visitor.pk], visitor.bit)
+        with self.captureOnCommitCallbacks(execute=True):
+            visitor.delete()
+        self.assertNotIn(visitor.pk, permits.permit_bits())
+
+    def test_hasbit_lookup(self):
+        """Test lots can be filtered by permit with a single predicate"""
+        self.lot.permit_types.add(self.faculty)
+        ParkingLot.objects.create(parking_lot_name='Other')
+        lots = ParkingLot.objects.filter(permit_mask__hasbit=permits.permit_bit(self.faculty.pk))
+        self.assertEqual(list(lots), [self.lot])
+        self.assertNotIn('JOIN', str(lots.query).upper())
+
+
+class AvailabilityIndexTest(TestCase):
+    """Test the in-process availability bitmap index"""
+
+    def setUp(self):
+        cache.clear()
+        availability_index.reset()
+        self.lot = ParkingLot.objects.create(parking_lot_name='Bitmap Lot')
+        self.spots = [ParkingSpot.objects.create(parking_lot=self.lot) for _ in range(10)]
+
+    def test_bitmap_lookup_contiguous_and_sparse_ids(self):
+        """Test bit lookups work for contiguous and gapped spot ids"""
+        for rows in ([(5, True), (6, False), (7, True)], [(5, True), (9, False), (40, True)]):
+            bitmap = LotBitmap.from_rows(rows)
+            self.assertTrue(bitmap.is_available(rows[0][0]))
+            self.assertFalse(bitmap.is_available(rows[1][0]))
+            self.assertIsNone(bitmap.is_available(1000))
+            self.assertEqual(bitmap.available_count(), 2)
+            self.assertEqual(bitmap.first_available(1), [rows[0][0]])
+
+    def test_index_tracks_spot_saves(self):
+        """Test single-spot saves update the bitmap"""
+        spot = ParkingSpot.objects.get(pk=self.spots[0].pk)
+        spot.availability = False
+        spot.save()
+        bitmap = availability_index.get(self.lot.parking_lot_id)
+        self.assertFalse(bitmap.is_available(spot.parking_spot_id))
+        self.assertEqual(bitmap.available_count(), 9)
+
+    def test_rolled_back_write_leaves_bitmap(self):
+        """Test the bitmap only changes once the write commits"""
+        bitmap = availability_index.get(self.lot.parking_lot_id)
+        spot_id = self.spots[0].parking_spot_id
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    availability_index.apply([(self.lot.parking_lot_id, spot_id, False)])
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertTrue(bitmap.is_available(spot_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            ParkingSpot.objects.filter(pk=spot_id).update(availability=False)
+            availability_index.apply([(self.lot.parking_lot_id, spot_id, False)])
+            self.assertTrue(bitmap.is_available(spot_id))
+        self.assertFalse(availability_index.get(self.lot.parking_lot_id).is_available(spot_id))
+
+    def test_first_available_skips_occupied(self):
+        """Test first-N query returns free spots in id order"""
+        for spot in self.spots[:3]:
+            spot.availability = False
+            spot.save()
+        free = availability_index.available_spot_ids(self.lot.parking_lot_id, limit=2)
+        self.assertEqual(free, [self.spots[3].parking_spot_id, self.spots[4].parking_spot_id])
+
+    def test_new_spot_invalidates_lot(self):
+        """Test adding a spot rebuilds the lot's bitmap"""
+        availability_index.get(self.lot.parking_lot_id)
+        spot = ParkingSpot.objects.create(parking_lot=self.lot, availability=False)
+        bitmap = availability_index.get(self.lot.parking_lot_id)
+        self.assertEqual(len(bitmap), 11)
+        self.assertFalse(bitmap.is_available(spot.parking_spot_id))
+
+    def test_version_bump_from_other_worker_triggers_reload(self):
+        """Test a newer shared version makes this worker reload from the DB"""
+        availability_index.get(self.lot.parking_lot_id)
+        # Another worker writes directly and bumps the shared version
+        ParkingSpot.objects.filter(pk=self.spots[0].pk).update(availability=False)
+        key = VERSION_KEY.format(self.lot.parking_lot_id)
+        cache.add(key, 0)
+        cache.incr(key)
+        bitmap = availability_index.get(self.lot.parking_lot_id)
+        self.assertFalse(bitmap.is_available(self.spots[0].parking_spot_id))
+
+
+class OccupancyHistoryTest(TestCase):
+    """Test occupancy samples and tiered rollups"""
+
+    def setUp(self):
+        self.lot = ParkingLot.objects.create(parking_lot_name='History Lot')
+        self.start = datetime(2026, 1, 5, 8, 0, tzinfo=UTC)
+
+    def sample(self, minutes, occupancy, total=10):
+        history.record_samples(
+            [{'lot_id': self.lot.parking_lot_id, 'occupancy': occupancy, 'total_spots': total}],
+            recorded_at=self.start + timedelta(minutes=minutes)
+        )
+
+    def test_record_samples_is_one_insert(self):
+        """Test a flush of many lots writes all samples in one query"""
+        other = ParkingLot.objects.create(parking_lot_name='Other Lot')
+        summaries = [
+            {'lot_id': self.lot.parking_lot_id, 'occupancy': 3, 'total_spots': 10},
+            {'lot_id': other.parking_lot_id, 'occupancy': 1, 'total_spots': 5},
+        ]
+        with self.assertNumQueries(1):
+            self.assertEqual(history.record_samples(summaries), 2)
+        self.assertEqual(OccupancySample.objects.count(), 2)
+
+    def test_minute_rollup_aggregates_samples(self):
+        """Test raw samples collapse into per-minute avg/min/max"""
+        self.sample(0, 2)
+        self.sample(0.5, 4)
+        self.sample(1.2, 6)
+        written = history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=5))
+        self.assertEqual(written, 4)
+        first = OccupancyRollup.objects.get(granularity=OccupancyRollup.MINUTE, bucket_start=self.start)
+        self.assertEqual((first.samples, first.avg_occupancy), (2, 3.0))
+        self.assertEqual((first.min_occupancy, first.max_occupancy, first.last_occupancy), (2, 4, 4))
+
+    def test_minute_rollup_weights_by_time_held(self):
+        """Test a burst of changes counts for as long as each value held"""
+        self.sample(0, 0)
+        for second in range(1, 11):
+            self.sample(second / 60, 10 if second % 2 else 0)
+        self.sample(0.5, 5)
+        history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=2))
+        first = OccupancyRollup.objects.get(granularity=OccupancyRollup.MINUTE, bucket_start=self.start)
+        self.assertEqual(first.samples, 12)
+        self.assertAlmostEqual(first.avg_occupancy, (5 * 10 + 20 * 0 + 30 * 5) / 60)
+
+    def test_quiet_lots_still_get_buckets(self):
+        """Test a steady lot carries its value into every minute"""
+        quiet = ParkingLot.objects.create(parking_lot_name='Quiet Lot')
+        self.sample(0.5, 6)
+        history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=3))
+        self.sample(10, 2)
+        history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=6))
+        rows = OccupancyRollup.objects.filter(parking_lot=self.lot).order_by('bucket_start')
+        self.assertEqual(
+            [(row.samples, row.avg_occupancy) for row in rows],
+            [(1, 6.0)] + [(0, 6.0)] * 4,
+        )
+        self.assertEqual(OccupancyRollup.objects.filter(parking_lot=quiet).count(), 5)
+
+    def test_late_samples_wait_for_grace(self):
+        """Test a bucket is only closed once samples committed late can't still arrive"""
+        self.sample(0.9, 4)
+        history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=1, seconds=10))
+        self.assertFalse(OccupancyRollup.objects.exists())
+        self.sample(0.95, 8)
+        history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=1, seconds=30))
+        self.assertEqual(OccupancyRollup.objects.get(parking_lot=self.lot).max_occupancy, 8)
+
+    def test_incomplete_bucket_waits(self):
+        """Test the current bucket is not rolled up until it is complete"""
+        self.sample(0, 2)
+        self.assertEqual(history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(seconds=30)), 0)
+        self.assertEqual(history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=1)), 0)
+        self.assertEqual(history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=1, seconds=30)), 1)
+        # Already rolled up - a second run has nothing to do
+        self.assertEqual(history.rollup(OccupancyRollup.MINUTE, now=self.start + timedelta(minutes=1, seconds=30)), 0)
+
+    def test_tiers_weight_by_time(self):
+        """Test coarser tiers average over time, not over samples"""
+        self.sample(0, 0)
+        self.sample(1, 8)
+        self.sample(1.5, 8)
+        self.sample(1.7, 8)
+        history.rollup_all(now=self.start + timedelta(hours=2))
+        hourly = OccupancyRollup.objects.get(granularity=OccupancyRollup.HOUR)
+        self.assertEqual(hourly.samples, 4)
+        self.assertAlmostEqual(hourly.avg_occupancy, 59 * 8 / 60)
+        self.assertEqual((hourly.min_occupancy, hourly.max_occupancy, hourly.last_occupancy), (0, 8, 8))
+
+    def test_choose_granularity(self):
+        """Test the finest tier within the point budget is chosen"""
+        self.assertEqual(history.choose_granularity(self.start, self.start + timedelta(hours=1)), '1m')
+        self.assertEqual(history.choose_granularity(self.start, self.start + timedelta(days=1)), '15m')
+        self.assertEqual(history.choose_granularity(self.start, self.start + timedelta(days=7)), '1h')
+
+    def test_rollup_command(self):
+        """Test rollup_occupancy reports rows written per tier"""
+        history.record_samples(
+            [{'lot_id': self.lot.parking_lot_id, 'occupancy': 2, 'total_spots': 10}],
+            recorded_at=timezone.now() - timedelta(minutes=3)
+        )
+        out = StringIO()
+        call_command('rollup_occupancy', stdout=out)
+        minutes = OccupancyRollup.objects.filter(granularity=OccupancyRollup.MINUTE).count()
+        self.assertGreaterEqual(minutes, 2)
+        self.assertIn(f'1m: {minutes}', out.getvalue())
+
+
+class HistoryRetentionTest(TestCase):
+    """Test tiered expiry of occupancy history"""
+
+    def setUp(self):
+        self.lot = ParkingLot.objects.create(parking_lot_name='Retention Lot')
+        self.now = datetime(2026, 3, 1, 12, 0, tzinfo=UTC)
+        history.record_samples(
+            [{'lot_id': self.lot.parking_lot_id, 'occupancy': 1, 'total_spots': 10}],
+            recorded_at=self.now - timedelta(hours=72)
+        )
+        history.record_samples(
+            [{'lot_id': self.lot.parking_lot_id, 'occupancy': 2, 'total_spots': 10}],
+            recorded_at=self.now - timedelta(hours=1)
+        )
+
+    def test_unrolled_samples_are_kept(self):
+        """Test raw samples are not expired before the minute tier has them"""
+        report = retention.apply_retention(now=self.now)
+        self.assertIsNone(report['raw']['cutoff'])
+        self.assertEqual(OccupancySample.objects.count(), 2)
+
+    def test_expires_only_past_retention(self):
+        """Test old raw samples go once rolled up; hourly rows are kept forever"""
+        history.rollup_all(now=self.now)
+        report = retention.apply_retention(now=self.now, chunk_size=1)
+        self.assertEqual(report['raw']['removed'], 1)
+        self.assertEqual(report['1h']['removed'], 0)
+        self.assertEqual(
+            list(OccupancySample.objects.values_list('occupancy', flat=True)), [2]
+        )
+        # Every complete hour since the first sample, the quiet ones carried over
+        self.assertEqual(OccupancyRollup.objects.filter(granularity='1h').count(), 71)
+
+    def test_dry_run_deletes_nothing(self):
+        """Test --dry-run reports counts without deleting"""
+        history.rollup_all(now=self.now)
+        out = StringIO()
+        call_command('apply_retention', '--dry-run', stdout=out)
+        self.assertIn('would remove', out.getvalue())
+        self.assertEqual(OccupancySample.objects.count(), 2)
+
+    def test_retention_tiers_are_configurable(self):
+        """Test a tier set to None is never expired"""
+        history.rollup_all(now=self.now)
+        with self.settings(PARKING_HISTORY_RETENTION_HOURS={'raw': None}):
+            report = retention.apply_retention(now=self.now)
+        self.assertEqual(sum(result['removed'] for result in report.values()), 0)
+
+
+class VectorizedSimulationTest(TestCase):
+    """Test the array-backed multi-lot simulator"""
+
+    def setUp(self):
+        self.lots = [ParkingLot.objects.create(parking_lot_name=f'Sim Lot {i}') for i in range(3)]
+        for lot in self.lots:
+            ParkingSpot.objects.bulk_create([ParkingSpot(parking_lot=lot) for _ in range(40)])
+        call_command('reconcile_lot_counters', stdout=StringIO())
+
+    def test_tick_moves_every_lot_towards_target(self):
+        """Test one tick occupies spots in all lots and persists them"""
+        simulation = VectorizedSimulation(seed=1)
+        summaries = simulation.tick(target=0.5, gain=0.5, max_step_percent=1.0)
+        self.assertEqual(len(summaries), 3)
+        for lot, summary in zip(self.lots, summaries):
+            self.assertEqual(summary['lot_id'], lot.parking_lot_id)
+            self.assertEqual(len(summary['spots']), 10)
+            lot.refresh_from_db()
+            self.assertEqual((lot.occupancy, lot.available_spots), (10, 30))
+            self.assertEqual(lot.spots.filter(availability=False).count(), 10)
+
+    def test_step_is_capped_and_converges(self):
+        """Test max_step_percent limits flips and repeated ticks reach the target"""
+        simulation = VectorizedSimulation(seed=2)
+        summaries = simulation.tick(target=0.9, gain=1.0, max_step_percent=0.1)
+        self.assertTrue(all(len(summary['spots']) == 4 for summary in summaries))
+        for _ in range(20):
+            simulation.tick(target=0.9, gain=1.0, max_step_percent=0.1)
+        self.assertEqual(simulation.occupied_counts().tolist(), [36, 36, 36])
+        self.assertEqual(simulation.tick(target=0.9, gain=1.0, max_step_percent=0.1), [])
+
+    def test_writes_are_bulk(self):
+        """Test query count does not grow with the number of flipped spots"""
+        simulation = VectorizedSimulation(seed=3)
+        # Savepoints (tick, planned writes), spot UPDATE, counter UPDATE, session INSERT,
+        # releases, counter read-back
+        with self.assertNumQueries(8):
+            simulation.tick(target=1.0, gain=1.0, max_step_percent=1.0)
+
+    def test_external_change_triggers_recount(self):
+        """Test a spot changed behind the simulator's back keeps counters exact"""
+        simulation = VectorizedSimulation(lot_ids=[self.lots[0].parking_lot_id], seed=4)
+        # Bypasses the counters, like a writer that doesn't know about them
+        ParkingSpot.objects.filter(parking_lot=self.lots[0]).update(availability=False)
+        simulation.tick(target=0.5, gain=1.0, max_step_percent=0.25)
+        lot = ParkingLot.objects.get(pk=self.lots[0].pk)
+        occupied = lot.spots.filter(availability=False).count()
+        self.assertEqual(lot.occupancy, occupied)
+        self.assertEqual(simulation.occupied_counts().tolist(), [occupied])
+
+    def test_orm_engine_writes_each_tick_in_bulk(self):
+        """Test simulate_realtime's default engine writes a tick without per-spot saves"""
+        command = SimulateRealtimeCommand(stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            summaries = command.tick(None, gain=1.0, max_step_percent=1.0, now=datetime(2026, 1, 5, 12, 0))
+        # Midday target is 90%: 36 of 40 spots per lot
+        self.assertEqual([len(summary['spots']) for summary in summaries], [36, 36, 36])
+        self.assertEqual(Session.objects.filter(end_time__isnull=True).count(), 108)
+        self.assertEqual(
+            [lot.occupancy for lot in ParkingLot.objects.order_by('parking_lot_id')], [36, 36, 36]
+        )
+        self.assertLess(len(queries), 20)
+
+    def test_only_matched_flips_are_transitions(self):
+        """Test spots someone else already flipped get no sessions or broadcast from the tick"""
+        lot = self.lots[0]
+        simulation = VectorizedSimulation(lot_ids=[lot.parking_lot_id], seed=5)
+        taken = list(lot.spots.order_by('parking_spot_id').values_list('parking_spot_id', flat=True)[:20])
+        ParkingSpot.objects.filter(parking_spot_id__in=taken).update(availability=False)
+        summaries = simulation.tick(target=1.0, gain=1.0, max_step_percent=1.0)
+        flipped = {spot['spot_id'] for spot in summaries[0]['spots']}
+        self.assertEqual(len(flipped), 20)
+        self.assertFalse(flipped & set(taken))
+        self.assertEqual(
+            set(Session.objects.values_list('parking_spot_id', flat=True)), flipped
+        )
+        self.assertEqual(ParkingLot.objects.get(pk=lot.pk).occupancy, 40)
+
+
 class VehicleModelTest(TestCase):
     """Test Vehicle model"""
 
@@ -238,6 +753,93 @@ class EventModelTest(TestCase):
         self.assertEqual(event.restricted_lots.count(), 2)
 
 
+@override_settings(PARKING_EVENT_LEAD_HOURS=3, PARKING_EVENT_DURATION_HOURS=5)
+class EventRestrictionTest(APITestCase):
+    """Test the per-day event restriction resolver and where it applies"""
+
+    def setUp(self):
+        cache.clear()
+        self.lot = ParkingLot.objects.create(parking_lot_name='Stadium Lot')
+        self.other = ParkingLot.objects.create(parking_lot_name='Far Lot')
+        self.day = date(2026, 9, 5)
+
+    def at(self, day, hour, minute=0):
+        return datetime(day.year, day.month, day.day, hour, minute, tzinfo=UTC)
+
+    def game(self, day, hour, lots):
+        event = Event.objects.create(event_name='Game', date=day, time_start=time(hour, 0))
+        event.restricted_lots.set(lots)
+        return event
+
+    def test_window_around_start_time(self):
+        """Test lots are restricted from lead hours before to duration hours after the start"""
+        self.game(self.day, 14, [self.lot])
+        self.assertEqual(restrictions.restricted_lots(self.at(self.day, 10, 59)), frozenset())
+        self.assertEqual(restrictions.restricted_lots(self.at(self.day, 11)), {self.lot.pk})
+        self.assertEqual(restrictions.restricted_lots(self.at(self.day, 18, 59)), {self.lot.pk})
+        self.assertEqual(restrictions.restricted_lots(self.at(self.day, 19)), frozenset())
+
+    def test_window_crossing_midnight(self):
+        """Test a late event still restricts its lots after midnight"""
+        self.game(self.day, 22, [self.lot])
+        next_day = self.day + timedelta(days=1)
+        self.assertEqual(restrictions.restricted_lots(self.at(next_day, 2)), {self.lot.pk})
+        self.assertEqual(restrictions.restricted_lots(self.at(next_day, 3)), frozenset())
+
+    def test_map_cached_until_event_changes(self):
+        """Test lookups reuse the day map; saving an event rebuilds it"""
+        event = self.game(self.day, 14, [self.lot])
+        restrictions.restricted_lots(self.at(self.day, 12))
+        with self.assertNumQueries(0):
+            restrictions.restricted_lots(self.at(self.day, 13))
+        with self.captureOnCommitCallbacks(execute=True):
+            event.time_start = time(20, 0)
+            event.save()
+        self.assertEqual(restrictions.restricted_lots(self.at(self.day, 12)), frozenset())
+        with self.captureOnCommitCallbacks(execute=True):
+            event.restricted_lots.add(self.other)
+        self.assertEqual(restrictions.restricted_lots(self.at(self.day, 18)), {self.lot.pk, self.other.pk})
+
+    def test_state_token_changes_at_boundaries(self):
+        """Test the ETag token only moves when the restricted set can change"""
+        self.game(self.day, 14, [self.lot])
+        token = restrictions.at(self.at(self.day, 12))[1]
+        self.assertEqual(restrictions.at(self.at(self.day, 13))[1], token)
+        self.assertNotEqual(restrictions.at(self.at(self.day, 20))[1], token)
+
+    def restrict_now(self):
+        now = timezone.localtime()
+        self.game(now.date(), now.hour, [self.lot])
+
+    def test_dashboard_flags_restricted_lots(self):
+        """Test dashboard rows carry the restricted flag"""
+        self.restrict_now()
+        flags = {row['id']: row['restricted'] for row in self.client.get('/api/dashboard/').data}
+        self.assertEqual(flags, {self.lot.pk: True, self.other.pk: False})
+
+    def test_lots_for_permit_excludes_restricted_lots(self):
+        """Test restricted lots aren't offered to drivers"""
+        self.restrict_now()
+        response = self.client.get('/api/lots/for-my-permit/')
+        self.assertEqual([lot['parking_lot_id'] for lot in response.data], [self.other.pk])
+
+    def test_status_frame_lists_restricted_lots(self):
+        """Test WebSocket status frames name the restricted lots"""
+        self.restrict_now()
+        frame = json.loads(snapshot.status_frame('initial_state'))
+        self.assertEqual(frame['restricted'], [self.lot.pk])
+
+    def test_nearest_available_skips_restricted_lots(self):
+        """Test the nearest spot search never suggests a restricted lot"""
+        for lot in (self.lot, self.other):
+            lot.latitude, lot.longitude = 37.23, -80.42
+            lot.save()
+            ParkingSpot.objects.create(parking_lot=lot)
+        self.restrict_now()
+        response = self.client.get('/api/spots/nearest-available/?lat=37.23&lon=-80.42&k=5')
+        self.assertEqual({result['lot_id'] for result in response.data['results']}, {self.other.pk})
+
+
 class SessionModelTest(TestCase):
     """Test Session model"""
 
@@ -290,6 +892,87 @@ class SessionModelTest(TestCase):
         self.assertEqual(self.user.sessions.count(), 1)
 
 
+class SessionTrackingTest(APITestCase):
+    """Test sessions opened and closed by spot transitions"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='driver', password='pass123')
+        self.lot = ParkingLot.objects.create(parking_lot_name='Session Lot')
+        self.other_lot = ParkingLot.objects.create(parking_lot_name='Other Lot')
+        self.spot = ParkingSpot.objects.create(parking_lot=self.lot)
+        self.other = ParkingSpot.objects.create(parking_lot=self.other_lot)
+
+    def set_available(self, spot, available):
+        spot.availability = available
+        spot.save()
+
+    def test_occupied_opens_and_available_closes(self):
+        """Test one session spans an occupied stretch"""
+        self.set_available(self.spot, False)
+        session = Session.objects.get(parking_spot=self.spot)
+        self.assertIsNone(session.end_time)
+        self.assertIsNone(session.user)
+        self.set_available(self.spot, True)
+        session.refresh_from_db()
+        self.assertIsNotNone(session.end_time)
+
+    def test_one_open_session_per_spot(self):
+        """Test the partial unique constraint allows a single open session"""
+        self.set_available(self.spot, False)
+        sessions.open_sessions({self.spot.pk: timezone.now()})
+        self.assertEqual(Session.objects.filter(parking_spot=self.spot).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Session.objects.create(parking_spot=self.spot)
+        # Closed sessions don't count
+        self.set_available(self.spot, True)
+        self.set_available(self.spot, False)
+        self.assertEqual(Session.objects.filter(parking_spot=self.spot).count(), 2)
+
+    def test_spot_created_occupied_opens_session(self):
+        """Test a spot created occupied starts with an open session"""
+        spot = ParkingSpot.objects.create(parking_lot=self.lot, availability=False)
+        self.assertTrue(sessions.current_sessions(spot_id=spot.pk).exists())
+
+    def test_current_by_spot_lot_and_user(self):
+        """Test current sessions per spot, lot and user"""
+        self.set_available(self.spot, False)
+        self.set_available(self.other, False)
+        Session.objects.filter(parking_spot=self.other).update(user=self.user)
+        Session.objects.create(parking_spot=self.spot, user=self.user, end_time=timezone.now())
+
+        def spots(query):
+            response = self.client.get(f'/api/sessions/current/?{query}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [session['parking_spot'] for session in response.data['results']]
+
+        self.assertEqual(spots(f'spot={self.spot.pk}'), [self.spot.pk])
+        self.assertEqual(spots(f'parking_lot={self.lot.pk}'), [self.spot.pk])
+        self.assertEqual(spots(f'user={self.user.pk}'), [self.other.pk])
+
+    def test_current_defaults_to_caller(self):
+        """Test current sessions without filters are the caller's own"""
+        self.assertEqual(self.client.get('/api/sessions/current/').status_code, status.HTTP_400_BAD_REQUEST)
+        self.set_available(self.spot, False)
+        Session.objects.filter(parking_spot=self.spot).update(user=self.user)
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/sessions/current/')
+        self.assertEqual([s['parking_spot'] for s in response.data['results']], [self.spot.pk])
+
+    def test_current_rejects_bad_ids(self):
+        """Test non-integer filters are rejected"""
+        response = self.client.get('/api/sessions/current/?parking_lot=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_active_filter(self):
+        """Test ?active=true lists only open sessions"""
+        self.set_available(self.spot, False)
+        self.set_available(self.spot, True)
+        self.set_available(self.spot, False)
+        response = self.client.get('/api/sessions/?active=true')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['results'][0]['end_time'])
+
+
 # =============================================================================
 # API TESTS
 # =============================================================================
@@ -348,6 +1031,99 @@ class DashboardAPITest(APITestCase):
         self.assertEqual(len(response.data), 2)
 
 
+class ConditionalGetTest(APITestCase):
+    """Test ETag / If-None-Match on the dashboard and lot endpoints"""
+
+    def setUp(self):
+        """Set up two lots with spots"""
+        cache.clear()
+        self.lot = ParkingLot.objects.create(parking_lot_name='Lot A')
+        self.other = ParkingLot.objects.create(parking_lot_name='Lot B')
+        self.spot = ParkingSpot.objects.create(parking_lot=self.lot)
+        ParkingSpot.objects.create(parking_lot=self.other)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_state_returns_304(self):
+        """Test each endpoint answers a matching If-None-Match with 304"""
+        for url in ('/api/dashboard/', '/api/lots/', f'/api/lots/{self.lot.pk}/', '/api/lots/for-my-permit/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+            with self.assertNumQueries(0):
+                revalidated = self.revalidate(url, etag)
+            self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED, url)
+            self.assertEqual(revalidated['ETag'], etag)
+            self.assertEqual(revalidated.content, b'')
+
+    def test_availability_change_changes_tags(self):
+        """Test a spot change invalidates list tags and only that lot's tag"""
+        tags = {
+            url: self.client.get(url)['ETag']
+            for url in ('/api/dashboard/', '/api/lots/', f'/api/lots/{self.lot.pk}/', f'/api/lots/{self.other.pk}/')
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/spots/{self.spot.pk}/', {'availability': False}, format='json')
+
+        self.assertEqual(self.revalidate(f'/api/lots/{self.other.pk}/', tags.pop(f'/api/lots/{self.other.pk}/')).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        for url, etag in tags.items():
+            response = self.revalidate(url, etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+            self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get('/api/dashboard/').data[0]['available_spots'], 0)
+
+    def test_lot_rename_changes_lot_tag(self):
+        """Test metadata changes invalidate single-lot tags"""
+        url = f'/api/lots/{self.lot.pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lot.parking_lot_name = 'Renamed'
+            self.lot.save()
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['parking_lot_name'], 'Renamed')
+
+    def test_representation_is_part_of_tag(self):
+        """Test different ?fields= / ?expand= responses get different tags"""
+        plain = self.client.get('/api/lots/')['ETag']
+        expanded = self.client.get('/api/lots/?expand=spots')
+        self.assertNotEqual(plain, expanded['ETag'])
+        self.assertEqual(self.revalidate('/api/lots/?expand=spots', plain).status_code, status.HTTP_200_OK)
+
+    def test_unknown_names_are_not_part_of_tag(self):
+        """Test made-up ?fields= / ?expand= names neither change the tag nor the cache key"""
+        plain = self.client.get('/api/lots/for-my-permit/')
+        junk = self.client.get('/api/lots/for-my-permit/?fields=nope,x1&expand=everything')
+        self.assertEqual(junk['ETag'], plain['ETag'])
+        self.assertEqual(junk.data, plain.data)
+
+    def test_flushed_cache_never_revives_old_tags(self):
+        """Test versions are reseeded rather than restarted after a cache flush"""
+        etag = self.client.get('/api/dashboard/')['ETag']
+        cache.clear()
+        self.assertNotEqual(self.client.get('/api/dashboard/')['ETag'], etag)
+
+    def test_flushed_cache_bumps_never_reach_old_tags(self):
+        """Test counters first created by a write are clock-seeded too"""
+        urls = ('/api/dashboard/', f'/api/lots/{self.lot.pk}/')
+
+        def bump():
+            snapshot.mark_stale()
+            availability_index._publish([self.lot.pk], snapshot=False)
+
+        cache.clear()
+        bump()
+        bump()
+        tags = {url: self.client.get(url)['ETag'] for url in urls}
+        cache.clear()
+        bump()
+        bump()
+        for url, etag in tags.items():
+            self.assertEqual(self.revalidate(url, etag).status_code, status.HTTP_200_OK, url)
+
+
 class RegisterAPITest(APITestCase):
     """Test User Registration API"""
 
@@ -561,6 +1337,43 @@ class LotsForPermitAPITest(APITestCase):
         self.assertIn('Shared Lot', lot_names)
         self.assertNotIn('Faculty Lot', lot_names)
 
+    def test_query_count_does_not_grow_with_spots(self):
+        """Test lots, spots and permits are fetched in a constant number of queries"""
+        for lot in (self.student_lot, self.shared_lot):
+            for _ in range(5):
+                spot = ParkingSpot.objects.create(parking_lot=lot)
+                spot.lot_permit_access.add(self.student_permit)
+        cache.clear()
+        # Lots, permits, spots and today's (cold) restriction map
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/lots/for-my-permit/?expand=spots')
+        self.assertEqual(response.data[0]['spots']['availability'], '11111')
+
+    def test_response_cached_per_permit(self):
+        """Test users sharing a permit share a cached response until state changes"""
+        cache.clear()
+        self.client.get('/api/lots/for-my-permit/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/lots/for-my-permit/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.faculty_lot.permit_types.remove(self.faculty_permit)
+        response = self.client.get('/api/lots/for-my-permit/')
+        faculty = next(lot for lot in response.data if lot['parking_lot_name'] == 'Faculty Lot')
+        self.assertEqual(faculty['permit_types'], [])
+
+    def test_availability_change_invalidates_cache(self):
+        """Test a spot changing state is visible on the next request"""
+        spot = ParkingSpot.objects.create(parking_lot=self.student_lot)
+        cache.clear()
+        self.client.get('/api/lots/for-my-permit/')
+        with self.captureOnCommitCallbacks(execute=True):
+            spot.availability = False
+            spot.save()
+        response = self.client.get('/api/lots/for-my-permit/')
+        student = next(lot for lot in response.data if lot['parking_lot_name'] == 'Student Lot')
+        self.assertEqual(student['available_spots'], 0)
+
 
 class ParkingLotViewSetAPITest(APITestCase):
     """Test ParkingLot ViewSet API"""
@@ -591,6 +1404,78 @@ class ParkingLotViewSetAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(ParkingLot.objects.filter(parking_lot_name='New Lot').exists())
 
+    def test_spots_only_when_expanded(self):
+        """Test the default list omits spots and ?expand=spots adds a compact block"""
+        spots = [ParkingSpot.objects.create(parking_lot=self.lot) for _ in range(3)]
+        spots[1].availability = False
+        spots[1].save()
+
+        response = self.client.get('/api/lots/')
+        self.assertNotIn('spots', response.data[0])
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/lots/?expand=spots')
+        self.assertEqual(response.data[0]['spots'], {
+            'spot_ids': [spot.parking_spot_id for spot in spots],
+            'availability': '101',
+        })
+
+    def test_fields_selects_output(self):
+        """Test ?fields= returns only the requested fields"""
+        response = self.client.get(f'/api/lots/{self.lot.parking_lot_id}/?fields=parking_lot_id,available_spots')
+        self.assertEqual(set(response.data), {'parking_lot_id', 'available_spots'})
+        response = self.client.get('/api/lots/?fields=parking_lot_name,spots')
+        self.assertEqual(set(response.data[0]), {'parking_lot_name', 'spots'})
+
+    def test_counters_are_read_only(self):
+        """Test PATCHing a counter is ignored rather than echoed back"""
+        response = self.client.patch(f'/api/lots/{self.lot.parking_lot_id}/', {'occupancy': 40}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.lot.refresh_from_db()
+        self.assertEqual(response.data['occupancy'], self.lot.occupancy)
+        self.assertEqual(self.lot.occupancy, 5)
+
+
+class LotHistoryAPITest(APITestCase):
+    """Test GET /api/lots/{id}/history/"""
+
+    def setUp(self):
+        self.lot = ParkingLot.objects.create(parking_lot_name='History Lot')
+        self.url = f'/api/lots/{self.lot.parking_lot_id}/history/'
+        start = datetime(2026, 1, 5, tzinfo=UTC)
+        OccupancyRollup.objects.bulk_create([
+            OccupancyRollup(
+                parking_lot=self.lot, granularity=OccupancyRollup.HOUR,
+                bucket_start=start + timedelta(hours=hour), samples=60,
+                avg_occupancy=5, min_occupancy=2, max_occupancy=8, total_spots=10
+            )
+            for hour in range(24 * 7)
+        ])
+
+    def test_week_reads_hourly_rollups(self):
+        """Test a week-long range is served from the hourly tier"""
+        response = self.client.get(self.url, {'start': '2026-01-05T00:00:00Z', 'end': '2026-01-12T00:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['granularity'], '1h')
+        self.assertEqual(len(response.data['points']), 168)
+        self.assertEqual(response.data['points'][0]['occupancy_percent'], 50.0)
+
+    def test_invalid_range_rejected(self):
+        """Test bad dates and over-long raw ranges return 400"""
+        self.assertEqual(self.client.get(self.url, {'start': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'granularity': '5m'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'granularity': 'raw'}).status_code, 400)
+
+    def test_ingest_records_samples(self):
+        """Test sensor batches append one sample per changed lot"""
+        sensor_filter.reset()
+        spots = [ParkingSpot.objects.create(parking_lot=self.lot) for _ in range(3)]
+        self.client.post('/api/sensors/ingest/', {
+            'readings': [[spot.parking_spot_id, False, 1700000000] for spot in spots]
+        }, format='json')
+        sample = OccupancySample.objects.get(parking_lot=self.lot)
+        self.assertEqual((sample.occupancy, sample.total_spots), (3, 3))
+
 
 class ParkingSpotViewSetAPITest(APITestCase):
     """Test ParkingSpot ViewSet API"""
@@ -607,7 +1492,7 @@ class ParkingSpotViewSetAPITest(APITestCase):
         """Test listing all parking spots"""
         response = self.client.get('/api/spots/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_filter_spots_by_lot(self):
         """Test filtering spots by parking lot"""
@@ -616,7 +1501,7 @@ class ParkingSpotViewSetAPITest(APITestCase):
 
         response = self.client.get(f'/api/spots/?parking_lot={self.lot.parking_lot_id}')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_update_spot_availability(self):
         """Test updating a spot's availability"""
@@ -628,6 +1513,725 @@ class ParkingSpotViewSetAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.spot.refresh_from_db()
         self.assertFalse(self.spot.availability)
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.available_spots, 0)
+        self.assertEqual(self.lot.occupancy, 1)
+
+    def test_update_spot_broadcasts_sequenced_batch(self):
+        """Test API availability changes are fanned out with a sequence number"""
+        cache.clear()
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(lot_group(self.lot.parking_lot_id), channel)
+        self.client.patch(f'/api/spots/{self.spot.parking_spot_id}/', {'availability': False}, format='json')
+        message = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(message['data']['sequence'], changelog.current_sequence(self.lot.parking_lot_id))
+        self.assertEqual(message['data']['spots'], [{'spot_id': self.spot.parking_spot_id, 'available': False}])
+
+    def test_filter_spots_by_availability(self):
+        """Test available filter within a lot uses the bitmap index"""
+        availability_index.reset()
+        ParkingSpot.objects.create(parking_lot=self.lot, availability=False)
+        response = self.client.get(f'/api/spots/?parking_lot={self.lot.parking_lot_id}&available=false')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertFalse(response.data['results'][0]['availability'])
+
+    def test_cursor_pages_through_filtered_spots(self):
+        """Test spot lists are cursor-paginated by pk and filters apply on every page"""
+        other_lot = ParkingLot.objects.create(parking_lot_name='Other Lot')
+        ParkingSpot.objects.bulk_create(
+            [ParkingSpot(parking_lot=self.lot) for _ in range(4)]
+            + [ParkingSpot(parking_lot=other_lot) for _ in range(3)]
+        )
+        seen = []
+        url = f'/api/spots/?parking_lot={self.lot.parking_lot_id}&page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [spot['parking_spot_id'] for spot in response.data['results']]
+            url = response.data['next']
+        expected = list(self.lot.spots.order_by('parking_spot_id').values_list('parking_spot_id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_size_is_capped(self):
+        """Test page_size above the maximum falls back to the cap"""
+        ParkingSpot.objects.bulk_create([ParkingSpot(parking_lot=self.lot) for _ in range(1005)])
+        response = self.client.get('/api/spots/?page_size=5000')
+        self.assertEqual(len(response.data['results']), 1000)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_filter_by_permit(self):
+        """Test ?permit= returns only spots open to that permit"""
+        permit = PermitType.objects.create(name='Student')
+        self.spot.lot_permit_access.add(permit)
+        ParkingSpot.objects.create(parking_lot=self.lot)
+        response = self.client.get(f'/api/spots/?permit={permit.pk}')
+        self.assertEqual(
+            [spot['parking_spot_id'] for spot in response.data['results']], [self.spot.parking_spot_id]
+        )
+
+    def test_free_spots_endpoint(self):
+        """Test first free spots come back without listing the lot"""
+        availability_index.reset()
+        response = self.client.get(f'/api/spots/free/?parking_lot={self.lot.parking_lot_id}&limit=5')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['spot_ids'], [self.spot.parking_spot_id])
+        self.assertEqual(response.data['available_spots'], 1)
+
+    def test_free_spots_requires_lot(self):
+        """Test free spots endpoint validates its parameters"""
+        response = self.client.get('/api/spots/free/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NearestAvailableAPITest(APITestCase):
+    """Test nearest free spot search over the spatial index"""
+
+    def setUp(self):
+        """Two lots on a north-south line, spots every ~11 m"""
+        cache.clear()
+        availability_index.reset()
+        self.student = PermitType.objects.create(name='Student')
+        self.faculty = PermitType.objects.create(name='Faculty')
+        self.north = ParkingLot.objects.create(parking_lot_name='North', latitude=37.2300, longitude=-80.4200)
+        self.north.permit_types.add(self.student)
+        self.south = ParkingLot.objects.create(parking_lot_name='South', latitude=37.2200, longitude=-80.4200)
+        self.south.permit_types.add(self.faculty)
+        self.north_spots = [
+            ParkingSpot.objects.create(parking_lot=self.north, latitude=37.2300 + i * 0.0001, longitude=-80.4200)
+            for i in range(5)
+        ]
+        self.south_spots = [
+            ParkingSpot.objects.create(parking_lot=self.south, latitude=37.2200 - i * 0.0001, longitude=-80.4200)
+            for i in range(5)
+        ]
+
+    def nearest(self, lat, lon, **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client.get(f'/api/spots/nearest-available/?lat={lat}&lon={lon}&{query}')
+
+    def test_closest_free_spots_in_distance_order(self):
+        """Test results are the k closest free spots, nearest first"""
+        self.north_spots[0].availability = False
+        self.north_spots[0].save()
+        response = self.nearest(37.2299, -80.4200, k=3)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [result['spot_id'] for result in response.data['results']]
+        self.assertEqual(ids, [spot.parking_spot_id for spot in self.north_spots[1:4]])
+        distances = [result['distance_m'] for result in response.data['results']]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(response.data['results'][0]['lot_name'], 'North')
+
+    def test_permit_limits_lots(self):
+        """Test users only get spots in lots open to their permit"""
+        user = User.objects.create_user(
+            username='faculty', password='pass123', first_name='F', last_name='U', permit_type=self.faculty
+        )
+        self.client.force_authenticate(user=user)
+        response = self.nearest(37.2300, -80.4200, k=2)
+        self.assertEqual(
+            {result['lot_id'] for result in response.data['results']}, {self.south.parking_lot_id}
+        )
+
+    def test_max_distance_bounds_search(self):
+        """Test spots beyond max_distance are never returned"""
+        response = self.nearest(37.2300, -80.4200, k=50, max_distance=100)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_far_away_target_still_finds_spots(self):
+        """Test a sparse neighbourhood falls back to ranking occupied cells"""
+        response = self.nearest(38.0, -81.0, k=1)
+        self.assertEqual(response.data['results'][0]['spot_id'], self.north_spots[-1].parking_spot_id)
+
+    def test_spot_without_position_uses_lot(self):
+        """Test spots without coordinates sit at their lot's position"""
+        lot = ParkingLot.objects.create(parking_lot_name='East', latitude=37.2250, longitude=-80.4100)
+        spot = ParkingSpot.objects.create(parking_lot=lot)
+        ParkingSpot.objects.create(parking_lot=ParkingLot.objects.create(parking_lot_name='Nowhere'))
+        response = self.nearest(37.2250, -80.4100, k=1)
+        self.assertEqual(response.data['results'][0]['spot_id'], spot.parking_spot_id)
+
+    def test_moved_spot_reloads_only_its_lot(self):
+        """Test layout changes are picked up incrementally"""
+        self.nearest(37.2250, -80.4200, k=1)
+        moved = self.south_spots[4]
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.latitude = 37.2250
+            moved.save()
+        # Lot ids, the changed lot, its spots
+        with self.assertNumQueries(3):
+            response = self.nearest(37.2250, -80.4200, k=1)
+        self.assertEqual(response.data['results'][0]['spot_id'], moved.parking_spot_id)
+
+    def test_warm_search_does_not_query(self):
+        """Test warm searches are answered without touching the database"""
+        self.nearest(37.2250, -80.4200, k=5)
+        with self.assertNumQueries(0):
+            spatial_index.nearest_available(37.2250, -80.4200, k=5)
+
+    def test_invalid_parameters(self):
+        """Test missing or out-of-range parameters are rejected"""
+        for url in (
+            '/api/spots/nearest-available/',
+            '/api/spots/nearest-available/?lat=abc&lon=1',
+            '/api/spots/nearest-available/?lat=91&lon=0',
+            '/api/spots/nearest-available/?lat=0&lon=0&k=0',
+        ):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST, url)
+
+
+class SensorIngestAPITest(APITestCase):
+    """Test bulk sensor ingest API"""
+
+    def setUp(self):
+        """Set up two lots and listen on the broadcast group"""
+        sensor_filter.reset()
+        self.lot_a = ParkingLot.objects.create(parking_lot_name='Lot A')
+        self.lot_b = ParkingLot.objects.create(parking_lot_name='Lot B')
+        self.spots_a = [ParkingSpot.objects.create(parking_lot=self.lot_a) for _ in range(4)]
+        self.spots_b = [ParkingSpot.objects.create(parking_lot=self.lot_b) for _ in range(2)]
+
+        self.channel_layer = get_channel_layer()
+        async_to_sync(self.channel_layer.flush)()
+        self.lot_channel = async_to_sync(self.channel_layer.new_channel)()
+        self.summary_channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(lot_group(self.lot_a.parking_lot_id), self.lot_channel)
+        async_to_sync(self.channel_layer.group_add)(SUMMARY_GROUP, self.summary_channel)
+
+    def test_ingest_applies_readings_and_recomputes_occupancy(self):
+        """Test readings update spots and each lot's occupancy"""
+        readings = [
+            [self.spots_a[0].parking_spot_id, False, 1700000000],
+            [self.spots_a[1].parking_spot_id, False, 1700000000],
+            [self.spots_b[0].parking_spot_id, False, 1700000000],
+        ]
+        response = self.client.post('/api/sensors/ingest/', {'readings': readings}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['changed'], 3)
+        self.assertEqual(response.data['lots_updated'], 2)
+
+        self.lot_a.refresh_from_db()
+        self.lot_b.refresh_from_db()
+        self.assertEqual(self.lot_a.occupancy, 2)
+        self.assertEqual(self.lot_a.available_spots, 2)
+        self.assertEqual(self.lot_b.occupancy, 1)
+        self.assertFalse(ParkingSpot.objects.get(pk=self.spots_a[0].pk).availability)
+
+    def test_states_are_read_under_the_write_lock(self):
+        """Test current states are read inside the write transaction, rows locked"""
+        with CaptureQueriesContext(connection) as queries:
+            apply_readings({self.spots_a[0].parking_spot_id: (False, None)})
+        sql = [query['sql'] for query in queries.captured_queries]
+        read = next(
+            i for i, statement in enumerate(sql)
+            if statement.startswith('SELECT') and 'parking_parkingspot' in statement
+        )
+        self.assertTrue(any(statement.startswith('SAVEPOINT') for statement in sql[:read]))
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', sql[read])
+
+    def test_ingest_sends_one_batch_update_per_lot(self):
+        """Test one batch_update goes to the lot group and one summary to everyone"""
+        readings = [[spot.parking_spot_id, False] for spot in self.spots_a]
+        readings.append([self.spots_b[0].parking_spot_id, False])
+        self.client.post('/api/sensors/ingest/', {'readings': readings}, format='json')
+
+        message = async_to_sync(self.channel_layer.receive)(self.lot_channel)
+        self.assertEqual(message['type'], 'batch_update')
+        self.assertEqual(message['data']['lot_id'], self.lot_a.parking_lot_id)
+        self.assertEqual(message['data']['available_spots'], 0)
+        self.assertEqual(len(message['data']['spots']), 4)
+
+        summary = async_to_sync(self.channel_layer.receive)(self.summary_channel)
+        self.assertEqual(summary['type'], 'lots_summary')
+        self.assertEqual([lot['lot_id'] for lot in summary['data']],
+                         [self.lot_a.parking_lot_id, self.lot_b.parking_lot_id])
+        self.assertNotIn('spots', summary['data'][0])
+
+    def test_newest_reading_wins_within_batch(self):
+        """Test out-of-order readings for the same spot keep the newest"""
+        spot_id = self.spots_a[0].parking_spot_id
+        readings = [
+            [spot_id, True, '2026-01-01T10:00:05+00:00'],
+            [spot_id, False, '2026-01-01T10:00:00+00:00'],
+        ]
+        response = self.client.post('/api/sensors/ingest/', {'readings': readings}, format='json')
+        self.assertEqual(response.data['changed'], 0)
+        self.assertTrue(ParkingSpot.objects.get(pk=spot_id).availability)
+
+    def test_replayed_batch_is_noop(self):
+        """Test re-sending the same batch changes nothing"""
+        readings = [[self.spots_a[0].parking_spot_id, False]]
+        self.client.post('/api/sensors/ingest/', {'readings': readings}, format='json')
+        response = self.client.post('/api/sensors/ingest/', {'readings': readings}, format='json')
+        self.assertEqual(response.data['changed'], 0)
+
+    def test_invalid_reading_rejected(self):
+        """Test malformed readings return 400 without writing"""
+        readings = [
+            [self.spots_a[0].parking_spot_id, False],
+            ['not-a-spot', False],
+        ]
+        response = self.client.post('/api/sensors/ingest/', {'readings': readings}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertTrue(ParkingSpot.objects.get(pk=self.spots_a[0].pk).availability)
+
+
+class SessionLifecycleTest(APITestCase):
+    """Test the bulk session engine behind ingest and the simulators"""
+
+    def setUp(self):
+        self.lot = ParkingLot.objects.create(parking_lot_name='Game Lot')
+        ParkingSpot.objects.bulk_create([ParkingSpot(parking_lot=self.lot) for _ in range(150)])
+        call_command('reconcile_lot_counters', stdout=StringIO())
+        self.spot_ids = list(self.lot.spots.order_by('pk').values_list('pk', flat=True))
+        self.t0 = datetime(2026, 9, 5, 12, 0, tzinfo=UTC)
+        sensor_filter.reset()
+
+    def ingest(self, readings):
+        return self.client.post('/api/sensors/ingest/', {'readings': readings}, format='json')
+
+    def test_ingest_opens_and_closes_at_sensor_time(self):
+        """Test ingest opens sessions at arrival and closes them at departure"""
+        spot_id = self.spot_ids[0]
+        self.ingest([[spot_id, False, self.t0.timestamp()]])
+        self.ingest([[spot_id, True, (self.t0 + timedelta(hours=2)).timestamp()]])
+        session = Session.objects.get(parking_spot_id=spot_id)
+        self.assertEqual((session.start_time, session.end_time), (self.t0, self.t0 + timedelta(hours=2)))
+
+    def test_whole_lot_in_constant_queries(self):
+        """Test a lot filling and emptying costs the same few session queries"""
+        arrive = [(spot_id, False, self.t0) for spot_id in self.spot_ids]
+        with self.assertNumQueries(2):
+            # Latest departures, then one INSERT
+            sessions.apply_transitions(arrive)
+        self.assertEqual(sessions.current_sessions(lot_id=self.lot.pk).count(), 150)
+        leave = [(spot_id, True, self.t0 + timedelta(minutes=i % 7)) for i, spot_id in enumerate(self.spot_ids)]
+        with self.assertNumQueries(1):
+            # One CASE UPDATE, even with a different time per spot
+            sessions.apply_transitions(leave)
+        self.assertFalse(sessions.current_sessions(lot_id=self.lot.pk).exists())
+        self.assertEqual(
+            Session.objects.get(parking_spot_id=self.spot_ids[8]).end_time, self.t0 + timedelta(minutes=1)
+        )
+
+    def test_duplicate_transitions_are_idempotent(self):
+        """Test replayed arrivals and departures change nothing"""
+        spot_id = self.spot_ids[0]
+        for _ in range(2):
+            sessions.apply_transitions([(spot_id, False, self.t0)])
+        for minutes in (30, 45):
+            sessions.apply_transitions([(spot_id, True, self.t0 + timedelta(minutes=minutes))])
+        session = Session.objects.get(parking_spot_id=spot_id)
+        self.assertEqual(session.end_time, self.t0 + timedelta(minutes=30))
+
+    def test_departure_older_than_arrival_is_ignored(self):
+        """Test a late departure reading doesn't close a newer session"""
+        spot_id = self.spot_ids[0]
+        sessions.apply_transitions([(spot_id, False, self.t0)])
+        sessions.apply_transitions([(spot_id, True, self.t0 - timedelta(minutes=5))])
+        self.assertIsNone(Session.objects.get(parking_spot_id=spot_id).end_time)
+
+    def test_late_arrival_starts_at_last_departure(self):
+        """Test sessions of one spot never overlap"""
+        spot_id = self.spot_ids[0]
+        sessions.apply_transitions([(spot_id, False, self.t0)])
+        sessions.apply_transitions([(spot_id, True, self.t0 + timedelta(hours=1))])
+        sessions.apply_transitions([(spot_id, False, self.t0 + timedelta(minutes=30))])
+        latest = Session.objects.filter(parking_spot_id=spot_id).latest('session_id')
+        self.assertEqual(latest.start_time, self.t0 + timedelta(hours=1))
+
+    def test_newest_transition_per_spot_wins(self):
+        """Test out-of-order transitions in one batch keep the newest"""
+        spot_id = self.spot_ids[0]
+        sessions.apply_transitions([
+            (spot_id, True, self.t0 + timedelta(minutes=5)),
+            (spot_id, False, self.t0),
+        ])
+        self.assertFalse(Session.objects.filter(parking_spot_id=spot_id).exists())
+
+    def test_simulation_tracks_sessions(self):
+        """Test vectorized simulator flips open and close sessions"""
+        simulation = VectorizedSimulation(seed=5)
+        simulation.tick(target=0.5, gain=1.0, max_step_percent=1.0)
+        self.assertEqual(sessions.current_sessions(lot_id=self.lot.pk).count(), 75)
+        simulation.tick(target=0.0, gain=1.0, max_step_percent=1.0)
+        self.assertFalse(sessions.current_sessions().exists())
+
+
+@override_settings(PARKING_SENSOR_DEBOUNCE_SECONDS=5, PARKING_SENSOR_REFRESH_SECONDS=60)
+class SensorFilterTest(APITestCase):
+    """Test duplicate and debounce filtering of sensor readings"""
+
+    def setUp(self):
+        cache.clear()
+        sensor_filter.reset()
+        self.filter = SensorFilter()
+        self.lot = ParkingLot.objects.create(parking_lot_name='Filter Lot')
+        self.spot = ParkingSpot.objects.create(parking_lot=self.lot)
+        self.spot_id = self.spot.pk
+
+    def feed(self, available, at, now=None):
+        accepted, counts = self.filter.process({self.spot_id: (available, at)}, now=at if now is None else now)
+        return accepted, counts
+
+    def test_duplicates_dropped_until_refresh(self):
+        """Test repeated states are dropped, then passed again as a heartbeat"""
+        self.assertEqual(self.feed(False, 1000)[0], {self.spot_id: (False, 1000)})
+        accepted, counts = self.feed(False, 1010)
+        self.assertEqual((accepted, counts['duplicate']), ({}, 1))
+        self.assertEqual(self.feed(False, 1061)[0], {self.spot_id: (False, 1061)})
+
+    def test_change_after_window_passes_immediately(self):
+        """Test a change outside the debounce window goes straight through"""
+        self.feed(False, 1000)
+        self.assertEqual(self.feed(True, 1005)[0], {self.spot_id: (True, 1005)})
+
+    def test_flicker_inside_window_is_dropped(self):
+        """Test flipping back inside the window writes nothing"""
+        self.feed(False, 1000)
+        accepted, counts = self.feed(True, 1001)
+        self.assertEqual((accepted, counts['debounced']), ({}, 1))
+        accepted, counts = self.feed(False, 1002)
+        self.assertEqual((accepted, counts['flicker']), ({}, 1))
+        self.assertEqual(self.filter.release_due(now=1010), {})
+
+    def test_held_change_released_after_window(self):
+        """Test a change that persists is applied once the window passes"""
+        self.feed(False, 1000)
+        self.feed(True, 1001)
+        self.assertEqual(self.filter.release_due(now=1003), {})
+        self.assertEqual(self.filter.release_due(now=1005), {self.spot_id: (True, 1001)})
+        self.assertEqual(self.filter.counters['released'], 1)
+
+    def test_held_change_survives_in_shared_cache(self):
+        """Test another process (or a restarted one) releases a held change"""
+        self.feed(False, 1000)
+        self.feed(True, 1001)
+        self.assertEqual(SensorFilter().release_due(now=1005), {self.spot_id: (True, 1001)})
+        self.assertEqual(self.filter.release_due(now=1006), {})
+
+    def test_release_command_applies_due_changes(self):
+        """Test release_sensor_changes writes held changes nobody else released"""
+        started = time_module.time()
+        ParkingSpot.objects.filter(pk=self.spot_id).update(availability=False)
+        with self.settings(PARKING_SENSOR_DEBOUNCE_SECONDS=0.1):
+            sensor_filter.process({self.spot_id: (False, started)}, now=started)
+            _, counts = sensor_filter.process({self.spot_id: (True, started + 0.01)}, now=started + 0.01)
+            self.assertEqual(counts['debounced'], 1)
+            time_module.sleep(0.15)
+            out = StringIO()
+            call_command('release_sensor_changes', stdout=out)
+        self.assertIn('Released 1 held change(s), 1 spot(s) changed', out.getvalue())
+        self.spot.refresh_from_db()
+        self.assertTrue(self.spot.availability)
+
+    def test_failed_write_records_nothing(self):
+        """Test readings whose write raised are not remembered as passed"""
+        with (
+            self.assertRaises(RuntimeError),
+            self.filter.filtered({self.spot_id: (False, 1000)}, now=1000) as (accepted, _),
+        ):
+            self.assertEqual(accepted, {self.spot_id: (False, 1000)})
+            raise RuntimeError('write failed')
+        self.assertEqual(self.feed(False, 1001)[0], {self.spot_id: (False, 1001)})
+
+    def test_remembered_spots_are_bounded(self):
+        """Test arbitrary spot ids can't grow the filter without bound"""
+        bounded = SensorFilter(maxsize=2)
+        bounded.process({spot_id: (False, 1000) for spot_id in range(10**6, 10**6 + 5)}, now=1000)
+        self.assertEqual(list(bounded._last), [10**6 + 3, 10**6 + 4])
+
+    def test_stale_reading_dropped(self):
+        """Test readings older than the last accepted change are ignored"""
+        self.feed(False, 1000)
+        self.feed(True, 1010)
+        accepted, counts = self.feed(False, 1004, now=1011)
+        self.assertEqual((accepted, counts['stale']), ({}, 1))
+
+    def test_per_spot_window(self):
+        """Test ParkingSpot.debounce_seconds overrides the default window"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.spot.debounce_seconds = 0.5
+            self.spot.save()
+        self.feed(False, 1000)
+        self.assertEqual(self.feed(True, 1001)[0], {self.spot_id: (True, 1001)})
+
+    def test_ingest_reports_and_exports_suppressed(self):
+        """Test ingest skips the database for duplicates and exports counters"""
+        readings = {'readings': [[self.spot_id, False]]}
+        self.client.post('/api/sensors/ingest/', readings, format='json')
+        with self.assertNumQueries(0):
+            response = self.client.post('/api/sensors/ingest/', readings, format='json')
+        self.assertEqual((response.data['suppressed'], response.data['changed']), (1, 0))
+        stats = self.client.get('/api/sensors/stats/').data
+        self.assertEqual((stats['received'], stats['passed'], stats['duplicate'], stats['suppressed']), (2, 1, 1, 1))
+
+
+class SensorGatewayTest(TestCase):
+    """Test the asyncio sensor gateway over the in-process broker"""
+
+    def setUp(self):
+        sensor_filter.reset()
+        self.lot = ParkingLot.objects.create(parking_lot_name='Gateway Lot')
+        self.spots = [ParkingSpot.objects.create(parking_lot=self.lot) for _ in range(3)]
+        self.broker = LocalBroker()
+        self.channel_layer = get_channel_layer()
+        async_to_sync(self.channel_layer.flush)()
+        self.lot_channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(lot_group(self.lot.pk), self.lot_channel)
+
+    def run_gateway(self, messages, **kwargs):
+        """Publish ``messages`` once the gateway is subscribed, then stop it."""
+        gateway = SensorGateway(LocalTransport(self.broker), batch_window=0.01, **kwargs)
+
+        async def scenario():
+            stop = asyncio.Event()
+            running = asyncio.create_task(gateway.run(stop))
+            while not self.broker._subscriptions:
+                await asyncio.sleep(0)
+            for topic, payload in messages:
+                self.broker.publish(topic, payload)
+            await asyncio.sleep(0.05)
+            stop.set()
+            await running
+
+        async_to_sync(scenario)()
+        return gateway
+
+    def test_mqtt_transport_reconnects(self):
+        """Test a dropped broker connection is retried instead of ending the stream"""
+        class MqttError(Exception):
+            pass
+
+        connections = []
+
+        class Client:
+            def __init__(self, **kwargs):
+                connections.append(kwargs)
+
+            async def __aenter__(self):
+                if len(connections) == 2:
+                    raise MqttError('connection refused')
+                return self
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+            async def subscribe(self, pattern, qos):
+                pass
+
+            @property
+            async def messages(self):
+                yield SimpleNamespace(topic=f'parking/sensors/{len(connections)}', payload=b'true')
+                raise MqttError('disconnected')
+
+        transport = MqttTransport('mqtt://broker:1883', reconnect_delay=0.001)
+
+        async def first_two():
+            received = []
+            stream = transport.messages('parking/sensors/#')
+            async for topic, payload in stream:
+                received.append(topic)
+                if len(received) == 2:
+                    break
+            await stream.aclose()
+            return received
+
+        fake = SimpleNamespace(Client=Client, MqttError=MqttError)
+        with self.assertLogs('parking.gateway', 'WARNING'), patch.dict(sys.modules, aiomqtt=fake):
+            received = async_to_sync(first_two)()
+        self.assertEqual(received, ['parking/sensors/1', 'parking/sensors/3'])
+        self.assertEqual(transport.reconnects, 2)
+
+    def test_topic_wildcards(self):
+        """Test + matches one level and # any remaining levels"""
+        self.assertTrue(topic_matches('parking/sensors/#', 'parking/sensors/12'))
+        self.assertTrue(topic_matches('parking/sensors/#', 'parking/sensors'))
+        self.assertTrue(topic_matches('parking/+/12', 'parking/sensors/12'))
+        self.assertFalse(topic_matches('parking/+', 'parking/sensors/12'))
+        self.assertFalse(topic_matches('parking/sensors/12', 'parking/sensors/13'))
+
+    def test_spot_and_batch_messages_applied(self):
+        """Test single-spot and batch payloads reach the database and the lot group"""
+        gateway = self.run_gateway([
+            (f'parking/sensors/{self.spots[0].pk}', {'available': False}),
+            (f'parking/sensors/{self.spots[1].pk}', 'false'),
+            ('parking/sensors/batch', {'readings': [[self.spots[2].pk, False]]}),
+        ])
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.occupancy, 3)
+        self.assertEqual(gateway.counters['batches'], 1)
+        message = async_to_sync(self.channel_layer.receive)(self.lot_channel)
+        self.assertEqual(message['type'], 'batch_update')
+        self.assertEqual(len(message['data']['spots']), 3)
+        self.assertIn('sequence', message['data'])
+
+    def test_invalid_messages_dropped(self):
+        """Test undecodable or unaddressed messages are counted, not applied"""
+        with self.assertLogs('parking.gateway', 'WARNING'):
+            gateway = self.run_gateway([
+                ('parking/sensors/abc', 'false'),
+                (f'parking/sensors/{self.spots[0].pk}', b'\xff'),
+                (f'parking/sensors/{self.spots[1].pk}', 'false'),
+                ('elsewhere/1', 'false'),
+            ])
+        self.assertEqual((gateway.counters['messages'], gateway.counters['invalid']), (3, 2))
+        self.assertEqual(ParkingSpot.objects.filter(availability=False).count(), 1)
+
+    def test_batches_split_at_batch_size(self):
+        """Test a full batch is applied without waiting for the window"""
+        gateway = self.run_gateway(
+            [(f'parking/sensors/{spot.pk}', 'false') for spot in self.spots], batch_size=2
+        )
+        self.assertEqual(gateway.counters['changed'], 3)
+        self.assertEqual(gateway.counters['batches'], 2)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        """Test publishing never blocks on a slow subscriber"""
+        broker = LocalBroker(queue_size=1)
+
+        async def scenario():
+            broker.subscribe('parking/#')
+            broker.publish('parking/sensors/1', 'true')
+            broker.publish('parking/sensors/2', 'true')
+
+        async_to_sync(scenario)()
+        self.assertEqual(broker.dropped, 1)
+
+
+class SensorSigningTest(APITestCase):
+    """Test signed sensor batches and the device key cache"""
+
+    def setUp(self):
+        sensor_filter.reset()
+        sensor_keys.reset()
+        self.lot = ParkingLot.objects.create(parking_lot_name='Signed Lot')
+        self.spots = [ParkingSpot.objects.create(parking_lot=self.lot) for _ in range(3)]
+        self.other = ParkingSpot.objects.create(parking_lot=self.lot)
+        self.device = SensorDevice.objects.create(name='lot-gw')
+        self.device.spots.set(self.spots)
+
+    def ingest(self, envelope):
+        return self.client.post('/api/sensors/ingest/', envelope, format='json')
+
+    def signed(self, readings, **kwargs):
+        return sign_batch(self.device.name, self.device.secret, readings, **kwargs)
+
+    def test_signed_batch_applied(self):
+        """Test a batch signed with the device secret is applied"""
+        response = self.ingest(self.signed([[spot.pk, False] for spot in self.spots]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['changed'], 3)
+        self.lot.refresh_from_db()
+        self.assertEqual(self.lot.occupancy, 3)
+
+    def test_rejected_batches_never_query(self):
+        """Test bad signatures, stale batches and unmapped spots are refused before any write"""
+        tampered = self.signed([[self.spots[0].pk, False]])
+        tampered['payload'] = tampered['payload'].replace('false', 'true')
+        cases = [
+            tampered,
+            self.signed([[self.spots[0].pk, False]], timestamp=time_module.time() - 3600),
+            self.signed([[self.spots[0].pk, False], [self.other.pk, False]]),
+            sign_batch(self.device.name, 'not-the-secret', [[self.spots[0].pk, False]]),
+        ]
+        sensor_keys.refresh()
+        sensor_keys.get(self.device.name)
+        for envelope in cases:
+            with self.assertNumQueries(0):
+                response = self.ingest(envelope)
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(ParkingSpot.objects.filter(availability=False).exists())
+
+    def test_unknown_and_inactive_devices(self):
+        """Test unknown and deactivated devices are refused"""
+        response = self.ingest(sign_batch('ghost', 'x', [[self.spots[0].pk, False]]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.is_active = False
+            self.device.save()
+        response = self.ingest(self.signed([[self.spots[0].pk, False]]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_malformed_envelope_is_bad_request(self):
+        """Test a correctly signed but unparseable batch is a 400, a malformed envelope a 403"""
+        response = self.ingest(self.signed([['x', False]]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.ingest({'device': 'lot-gw', 'signature': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_keys_cached_until_devices_change(self):
+        """Test keys are looked up once, and mapping changes retire them"""
+        self.ingest(self.signed([[self.spots[0].pk, False]]))
+        with self.assertNumQueries(0):
+            sensor_keys.verify(self.signed([[self.spots[1].pk, False]]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.device.spots.add(self.other)
+        response = self.ingest(self.signed([[self.other.pk, False]]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sensor_keys.stats()['misses'], 2)
+
+    def test_lru_evicts_least_recently_used(self):
+        """Test the key cache keeps the most recently used devices"""
+        SensorDevice.objects.create(name='other-gw').spots.add(self.spots[0])
+        SensorDevice.objects.create(name='third-gw').spots.add(self.spots[0])
+        keys = SensorKeyCache(maxsize=2)
+        keys.refresh()
+        keys.get('lot-gw')
+        keys.get('other-gw')
+        keys.get('lot-gw')
+        keys.get('third-gw')
+        self.assertEqual(keys.cached('other-gw'), (False, None))
+        self.assertTrue(keys.cached('lot-gw')[0])
+        self.assertEqual(
+            keys.stats(),
+            {'size': 2, 'maxsize': 2, 'unknown': 0, 'hits': 2, 'misses': 3, 'evictions': 1},
+        )
+
+    def test_unknown_names_never_evict_keys(self):
+        """Test made-up device names are remembered apart from real keys, in a bounded LRU"""
+        keys = SensorKeyCache(maxsize=1, unknown_maxsize=2)
+        keys.refresh()
+        keys.get('lot-gw')
+        for name in ('ghost', 'phantom', 'spectre'):
+            self.assertIsNone(keys.get(name))
+        self.assertTrue(keys.cached('lot-gw')[0])
+        self.assertEqual(keys.cached('spectre'), (True, None))
+        self.assertEqual(keys.cached('ghost'), (False, None))
+        self.assertEqual(keys.stats()['unknown'], 2)
+
+    @override_settings(PARKING_SENSOR_REQUIRE_SIGNATURE=True)
+    def test_unsigned_batches_refused_when_required(self):
+        """Test PARKING_SENSOR_REQUIRE_SIGNATURE refuses plain batches"""
+        response = self.ingest({'readings': [[self.spots[0].pk, False]]})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_gateway_verifies_signed_messages(self):
+        """Test the gateway loads keys off the loop and drops unsigned messages when required"""
+        broker = LocalBroker()
+        gateway = SensorGateway(LocalTransport(broker), batch_window=0.01, require_signed=True)
+
+        async def scenario():
+            stop = asyncio.Event()
+            running = asyncio.create_task(gateway.run(stop))
+            while not broker._subscriptions:
+                await asyncio.sleep(0)
+            broker.publish('parking/sensors/batch', self.signed([[self.spots[0].pk, False]]))
+            broker.publish('parking/sensors/batch', self.signed([[self.spots[1].pk, False]]))
+            broker.publish(f'parking/sensors/{self.spots[2].pk}', 'false')
+            await asyncio.sleep(0.05)
+            stop.set()
+            await running
+
+        with self.assertLogs('parking.gateway', 'WARNING'):
+            async_to_sync(scenario)()
+        self.assertEqual((gateway.counters['messages'], gateway.counters['invalid']), (3, 1))
+        self.assertEqual(
+            set(ParkingSpot.objects.filter(availability=False).values_list('pk', flat=True)),
+            {self.spots[0].pk, self.spots[1].pk},
+        )
 
 
 class VehicleViewSetAPITest(APITestCase):
@@ -681,3 +2285,398 @@ class VehicleViewSetAPITest(APITestCase):
         response = self.client.delete(f'/api/vehicles/{vehicle.vehicle_id}/')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Vehicle.objects.filter(vehicle_id=vehicle.vehicle_id).exists())
+
+
+# =============================================================================
+# WEBSOCKET TESTS
+# =============================================================================
+
+class ChangeLogTest(TestCase):
+    """Test per-lot sequences and delta resume from the change log"""
+
+    def setUp(self):
+        cache.clear()
+
+    def publish(self, lot_id, spots):
+        sequence = changelog.next_sequence(lot_id)
+        changelog.record(lot_id, sequence, [{'spot_id': s, 'available': a} for s, a in spots])
+        return sequence
+
+    def test_sequences_increase_per_lot(self):
+        """Test each lot has its own monotonic sequence"""
+        first = self.publish(1, [])
+        self.assertEqual(self.publish(1, []), first + 1)
+        self.assertEqual(changelog.current_sequence(1), first + 1)
+        self.assertEqual(changelog.current_sequence(2), 0)
+        self.publish(2, [])
+        self.assertEqual(changelog.current_sequence(1), first + 1)
+
+    def test_flushed_cache_never_reuses_sequences(self):
+        """Test a sequence recreated after a flush starts above every earlier one"""
+        for _ in range(3):
+            last = self.publish(1, [(10, False)])
+        cache.clear()
+        self.assertGreater(self.publish(1, [(10, True)]), last)
+        self.assertIsNone(changelog.changes_since(1, last)[1])
+
+    def test_changes_since_merges_missed_deltas(self):
+        """Test latest state per spot is returned for the missed range"""
+        first = self.publish(1, [(10, False)])
+        self.publish(1, [(10, True), (11, False)])
+        last = self.publish(1, [(12, False)])
+        sequence, changes = changelog.changes_since(1, first)
+        self.assertEqual(sequence, last)
+        self.assertEqual(changes, {10: True, 11: False, 12: False})
+        self.assertEqual(changelog.changes_since(1, last), (last, {}))
+
+    def test_too_far_behind_needs_snapshot(self):
+        """Test truncated logs and unknown sequences return None"""
+        with self.settings(PARKING_CHANGE_LOG_SIZE=2):
+            first = self.publish(1, [(0, False)])
+            for spot_id in range(1, 5):
+                self.publish(1, [(spot_id, False)])
+        self.assertIsNone(changelog.changes_since(1, first)[1])
+        self.assertIsNotNone(changelog.changes_since(1, first + 2)[1])
+        self.assertIsNone(changelog.changes_since(1, first + 99)[1])
+
+    def test_gap_in_log_needs_snapshot(self):
+        """Test a lost append is detected instead of sending a wrong delta"""
+        first = self.publish(1, [(10, False)])
+        changelog.next_sequence(1)  # Published but never recorded
+        self.publish(1, [(11, False)])
+        self.assertIsNone(changelog.changes_since(1, first)[1])
+
+
+class StatusSnapshotTest(TestCase):
+    """Test the shared pre-serialized status snapshot"""
+
+    def setUp(self):
+        cache.clear()
+        self.lot = ParkingLot.objects.create(parking_lot_name='Snapshot Lot')
+        self.spot = ParkingSpot.objects.create(parking_lot=self.lot)
+
+    def test_snapshot_built_once_then_served_from_cache(self):
+        """Test repeated reads don't query the database"""
+        snapshot.get_status_snapshot()
+        with self.assertNumQueries(0):
+            generation, data = snapshot.get_status_snapshot()
+        self.assertEqual(generation, snapshot.current_generation())
+        self.assertEqual(json.loads(data)[0]['total_spots'], 1)
+
+    def test_spot_change_marks_snapshot_stale(self):
+        """Test committed spot transitions trigger a rebuild"""
+        before, _ = snapshot.get_status_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.spot.availability = False
+            self.spot.save()
+        generation, data = snapshot.get_status_snapshot()
+        self.assertGreater(generation, before)
+        self.assertEqual(json.loads(data)[0]['available_spots'], 0)
+
+    def test_flushed_cache_never_reuses_generations(self):
+        """Test a missing generation is seeded from the clock, not restarted at 0"""
+        generation = snapshot.mark_stale()
+        cache.clear()
+        self.assertGreater(snapshot.current_generation(), generation)
+
+    def test_stale_snapshot_served_while_another_worker_rebuilds(self):
+        """Test single-flight: locked-out readers keep the previous snapshot"""
+        first = snapshot.get_status_snapshot()
+        snapshot.mark_stale()
+        cache.add(snapshot.LOCK_KEY, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(snapshot.get_status_snapshot(), first)
+
+    def test_status_frame_is_valid_json(self):
+        """Test the assembled frame parses and carries the version"""
+        frame = json.loads(snapshot.status_frame('initial_state'))
+        self.assertEqual(frame['type'], 'initial_state')
+        self.assertIn('version', frame)
+        self.assertEqual(frame['data'][0]['lot_name'], 'Snapshot Lot')
+
+
+class StaleWhileRevalidateTest(TestCase):
+    """Test the stale-while-revalidate cache wrapper"""
+
+    def setUp(self):
+        cache.clear()
+        self.entry = StaleWhileRevalidate('swr_test', soft_ttl=30, wait_timeout=0.05)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_fresh_value_served_without_recompute(self):
+        """Test a value built for the current version is reused"""
+        self.assertEqual(self.entry.get(self.compute, 1), (1, 1))
+        self.assertEqual(self.entry.get(self.compute, 1), (1, 1))
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_another_worker_recomputes(self):
+        """Test locked-out readers get the stale value and its version"""
+        self.entry.put('old', 1)
+        cache.add(self.entry.lock_key(), 1)
+        self.assertEqual(self.entry.get(self.compute, 2), (1, 'old'))
+        self.assertEqual(self.calls, 0)
+
+    def test_new_version_recomputed_once(self):
+        """Test the first reader after a version change recomputes"""
+        self.entry.put('old', 1)
+        self.assertEqual(self.entry.get(self.compute, 2), (2, 1))
+        self.assertEqual(self.entry.get(self.compute, 2), (2, 1))
+
+    def test_soft_ttl_expiry_recomputes(self):
+        """Test entries older than the soft TTL are rebuilt"""
+        cache.set(self.entry.key(), (1, 0, 'old'))  # built at the epoch
+        self.assertEqual(self.entry.get(self.compute, 1), (1, 1))
+
+    def test_cold_locked_reader_computes_after_waiting(self):
+        """Test a reader never waits past wait_timeout for a missing value"""
+        cache.add(self.entry.lock_key(), 1)
+        self.assertEqual(self.entry.get(self.compute, 1), (1, 1))
+
+    def test_variants_are_independent(self):
+        """Test each variant has its own entry"""
+        self.entry.get(lambda: 'a', 1, variant='a')
+        self.assertEqual(self.entry.get(lambda: 'b', 1, variant='b'), (1, 'b'))
+
+    def test_producer_refresh_pushes_dashboard(self):
+        """Test refresh_status_snapshot leaves the dashboard warm for readers"""
+        lot = ParkingLot.objects.create(parking_lot_name='Pushed Lot')
+        ParkingSpot.objects.create(parking_lot=lot)
+        generation, _ = snapshot.refresh_status_snapshot()
+        with self.assertNumQueries(0):
+            version, rows = snapshot.get_dashboard(generation)
+        self.assertEqual(version, generation)
+        self.assertEqual(rows[0]['total_spots'], 1)
+
+
+class CoalescingBroadcasterTest(TestCase):
+    """Test buffering of lot updates into timed batch frames"""
+
+    def setUp(self):
+        self.channel_layer = get_channel_layer()
+        async_to_sync(self.channel_layer.flush)()
+        self.lot_channel = async_to_sync(self.channel_layer.new_channel)()
+        self.summary_channel = async_to_sync(self.channel_layer.new_channel)()
+        async_to_sync(self.channel_layer.group_add)(lot_group(1), self.lot_channel)
+        async_to_sync(self.channel_layer.group_add)(SUMMARY_GROUP, self.summary_channel)
+        # Long window so nothing flushes until the test asks
+        self.broadcaster = CoalescingBroadcaster(window=60)
+
+    def receive(self, channel):
+        return async_to_sync(self.channel_layer.receive)(channel)
+
+    def test_burst_becomes_one_frame_with_latest_state(self):
+        """Test many updates in a window collapse to one batch per lot"""
+        self.broadcaster.add({'lot_id': 1, 'available_spots': 9}, [{'spot_id': 10, 'available': False}])
+        self.broadcaster.add({'lot_id': 1, 'available_spots': 8}, [{'spot_id': 11, 'available': False}])
+        self.broadcaster.add({'lot_id': 1, 'available_spots': 9}, [{'spot_id': 10, 'available': True}])
+        self.broadcaster.add({'lot_id': 2, 'available_spots': 3}, [{'spot_id': 20, 'available': True}])
+        self.broadcaster.flush()
+
+        message = self.receive(self.lot_channel)
+        self.assertEqual(message['type'], 'batch_update')
+        self.assertEqual(message['data']['available_spots'], 9)
+        self.assertEqual(
+            sorted((s['spot_id'], s['available']) for s in message['data']['spots']),
+            [(10, True), (11, False)]
+        )
+
+        summary = self.receive(self.summary_channel)
+        self.assertEqual([lot['lot_id'] for lot in summary['data']], [1, 2])
+
+    def test_flush_with_nothing_pending_sends_nothing(self):
+        """Test an empty flush is a no-op"""
+        self.broadcaster.flush()
+        self.assertNotIn(self.summary_channel, self.channel_layer.channels)
+
+    def test_timer_flushes_after_window(self):
+        """Test the window timer publishes without an explicit flush"""
+        broadcaster = CoalescingBroadcaster(window=0.2)
+        broadcaster.add({'lot_id': 1, 'available_spots': 5}, [{'spot_id': 10, 'available': True}])
+        broadcaster._timer.join()
+        message = self.receive(self.lot_channel)
+        self.assertEqual(message['data']['spots'], [{'spot_id': 10, 'available': True}])
+
+
+class ParkingConsumerTest(TransactionTestCase):
+    """Test ParkingConsumer subscriptions (TransactionTestCase so the consumer's
+    DB thread can see the test data)"""
+
+    def setUp(self):
+        cache.clear()
+        availability_index.reset()
+        async_to_sync(get_channel_layer().flush)()
+        self.lot = ParkingLot.objects.create(parking_lot_name='Socket Lot')
+        self.other_lot = ParkingLot.objects.create(parking_lot_name='Other Lot')
+        ParkingSpot.objects.create(parking_lot=self.lot)
+
+    def summary(self, lot):
+        return {
+            'lot_id': lot.parking_lot_id, 'lot_name': lot.parking_lot_name, 'occupancy': 0,
+            'total_spots': 1, 'available_spots': 1, 'occupancy_percent': 0,
+            'spots': [{'spot_id': 1, 'available': True}],
+        }
+
+    async def connect(self, path='/ws/parking/'):
+        communicator = WebsocketCommunicator(ParkingConsumer.as_asgi(), path)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        initial = await communicator.receive_json_from()
+        self.assertEqual(initial['type'], 'initial_state')
+        return communicator, initial
+
+    def test_initial_state_uses_lot_counters(self):
+        """Test connect sends counters for every lot"""
+        async def run():
+            communicator, initial = await self.connect()
+            self.assertEqual(len(initial['data']), 2)
+            self.assertEqual(initial['data'][0]['total_spots'], 1)
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_unsubscribed_client_only_gets_summaries(self):
+        """Test spot-level frames only reach subscribers of that lot"""
+        async def run():
+            communicator, _ = await self.connect()
+            await communicator.send_json_to({'type': 'subscribe', 'lot_ids': [self.other_lot.parking_lot_id]})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['lot_ids'], [self.other_lot.parking_lot_id])
+
+            await apublish_lot_updates([self.summary(self.lot)])
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['type'], 'lots_summary')
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_subscribed_client_gets_lot_batches(self):
+        """Test subscribing to a lot delivers its batch_update frames"""
+        async def run():
+            communicator, _ = await self.connect()
+            await communicator.send_json_to({'type': 'subscribe', 'lot_ids': [self.lot.parking_lot_id]})
+            await communicator.receive_json_from()
+
+            await apublish_lot_updates([self.summary(self.lot)])
+            types = {(await communicator.receive_json_from())['type'] for _ in range(2)}
+            self.assertEqual(types, {'batch_update', 'lots_summary'})
+
+            await communicator.send_json_to({'type': 'unsubscribe', 'lot_ids': [self.lot.parking_lot_id]})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['lot_ids'], [])
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_summary_mode_rejects_subscriptions(self):
+        """Test summary-only mode chosen at connect time"""
+        async def run():
+            communicator, _ = await self.connect('/ws/parking/?mode=summary')
+            await communicator.send_json_to({'type': 'subscribe', 'lot_ids': [self.lot.parking_lot_id]})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['type'], 'error')
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_resume_sends_delta_or_snapshot(self):
+        """Test resume returns missed deltas, or a snapshot when too far behind"""
+        lot_id = self.lot.parking_lot_id
+        sequences = []
+        for available in (False, True, False):
+            sequences.append(changelog.next_sequence(lot_id))
+            changelog.record(lot_id, sequences[-1], [{'spot_id': 7, 'available': available}])
+
+        async def run():
+            communicator, _ = await self.connect()
+            await communicator.send_json_to({'type': 'resume', 'sequences': {str(lot_id): sequences[0]}})
+            delta = await communicator.receive_json_from()
+            self.assertEqual(delta['type'], 'lot_delta')
+            self.assertEqual(delta['sequence'], sequences[-1])
+            self.assertEqual(delta['spots'], [{'spot_id': 7, 'available': False}])
+
+            await communicator.send_json_to({'type': 'resume', 'sequences': {str(lot_id): 50}})
+            full = await communicator.receive_json_from()
+            self.assertEqual(full['type'], 'lot_snapshot')
+            self.assertEqual(len(full['spots']), 1)
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_subscribe_by_permit(self):
+        """Test subscribing to every lot open to a permit"""
+        permit = PermitType.objects.create(name='Faculty')
+        self.other_lot.permit_types.add(permit)
+
+        async def run():
+            communicator, _ = await self.connect()
+            await communicator.send_json_to({'type': 'subscribe', 'permit': permit.pk})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['lot_ids'], [self.other_lot.parking_lot_id])
+            await communicator.send_json_to({'type': 'subscribe', 'permit': 'x'})
+            self.assertEqual((await communicator.receive_json_from())['type'], 'error')
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+    def test_get_lot_spots_reads_index(self):
+        """Test get_lot_spots returns spot availability"""
+        async def run():
+            communicator, _ = await self.connect()
+            await communicator.send_json_to({'type': 'get_lot_spots', 'lot_id': self.lot.parking_lot_id})
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply['type'], 'lot_spots')
+            self.assertEqual(len(reply['data']), 1)
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+
+
+class LoadgenCommandTest(TransactionTestCase):
+    """Test the loadgen command end to end (in-memory channel layer)"""
+
+    def setUp(self):
+        cache.clear()
+        lot = ParkingLot.objects.create(parking_lot_name='Load Lot')
+        ParkingSpot.objects.bulk_create([ParkingSpot(parking_lot=lot) for _ in range(20)])
+        call_command('reconcile_lot_counters', stdout=StringIO())
+
+    def test_reports_latency_percentiles(self):
+        """Test events reach subscribed clients and latencies are reported"""
+        out = StringIO()
+        call_command(
+            'loadgen', '--rate', '100', '--duration', '0.5', '--clients', '3',
+            '--seed', '7', '--json', '--i-know', stdout=out
+        )
+        results = json.loads(out.getvalue())
+        self.assertEqual(results['events'], 50)
+        self.assertEqual(results['clients'], 3)
+        self.assertGreater(results['deliveries'], 0)
+        self.assertIsNotNone(results['latency_ms']['p99'])
+        self.assertEqual(
+            ParkingLot.objects.get().available_spots,
+            ParkingSpot.objects.filter(availability=True).count()
+        )
+
+    def test_restores_the_database(self):
+        """Test spots, sessions and samples are put back after the run"""
+        spot = ParkingSpot.objects.first()
+        spot.availability = False
+        spot.save()
+        open_session = Session.objects.get(parking_spot=spot, end_time__isnull=True)
+        generation = cache.get(snapshot.GENERATION_KEY)
+        call_command(
+            'loadgen', '--rate', '100', '--duration', '0.3', '--clients', '1',
+            '--seed', '3', '--json', '--i-know', stdout=StringIO()
+        )
+        self.assertEqual(list(ParkingSpot.objects.filter(availability=False)), [spot])
+        self.assertEqual(ParkingLot.objects.get().occupancy, 1)
+        self.assertEqual(list(Session.objects.all()), [open_session])
+        self.assertIsNone(Session.objects.get().end_time)
+        self.assertFalse(OccupancySample.objects.exists())
+        # The restore went through the real cache
+        self.assertNotEqual(cache.get(snapshot.GENERATION_KEY), generation)
+
+    def test_refuses_without_i_know(self):
+        """Test loadgen won't write to the configured database unless told to"""
+        with self.assertRaises(CommandError):
+            call_command('loadgen', '--duration', '0.1', stdout=StringIO())
+        self.assertEqual(ParkingSpot.objects.filter(availability=True).count(), 20)
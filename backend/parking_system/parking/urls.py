@@ -7,7 +7,7 @@ router.register(r'lots', views.ParkingLotViewSet, basename='lots')
 router.register(r'spots', views.ParkingSpotViewSet, basename='spots')
 router.register(r'permits', views.PermitTypeViewSet)
 router.register(r'events', views.EventViewSet)
-router.register(r'sessions', views.SessionViewSet)
+router.register(r'sessions', views.SessionViewSet, basename='session')
 router.register(r'vehicles', views.VehicleViewSet, basename='vehicles')
 
 urlpatterns = [
@@ -17,6 +17,8 @@ urlpatterns = [
     path('me/', views.my_profile, name='my-profile'),
     path('events/active/', views.active_events, name='active-events'),
     path('lots/for-my-permit/', views.lots_for_permit, name='lots-for-permit'),
+    path('sensors/ingest/', views.ingest_readings, name='sensor-ingest'),
+    path('sensors/stats/', views.sensor_stats, name='sensor-stats'),
     # Router LAST
     path('', include(router.urls)),
 ]
\ No newline at end of file
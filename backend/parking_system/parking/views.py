@@ -1,10 +1,13 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from datetime import timedelta
+from django.conf import settings
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db.models import Count, Q
-from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from django.db.models import Prefetch
 from .models import PermitType, ParkingLot, ParkingSpot, Event, Session, User, Vehicle
 from .serializers import (
     PermitTypeSerializer,
@@ -13,33 +16,218 @@ from .serializers import (
     EventSerializer,
     SessionSerializer,
     VehicleSerializer,
-    UserProfileSerializer
+    UserProfileSerializer,
 )
+from .availability_index import availability_index
+from .broadcast import broadcaster, lot_summary
+from .etags import conditional, global_version, lot_version, make_etag, tagged
+from .history import BUCKET_WIDTHS, RAW, lot_history
+from .ingest import InvalidReading, parse_readings, apply_readings
+from .pagination import PkCursorPagination
+from .permits import permit_bit
+from .restrictions import resolver as restrictions
+from .sensor_filter import SUPPRESSED, sensor_filter
+from .sessions import current_sessions
+from .signing import InvalidSignature, is_signed, sensor_keys
+from .snapshot import get_dashboard
+from .spatial_index import spatial_index
+from .swr import StaleWhileRevalidate
+
+
+# lots_for_permit responses per permit and representation, versioned by generation
+lots_for_permit_cache = StaleWhileRevalidate('lots_for_permit', hard_ttl=60)
+
+
+def lot_queryset(spots=False):
+    """Lots with everything ParkingLotSerializer renders prefetched.
+
+    Counts come from the lot counters; spots (only the columns the compact
+    representation needs) are fetched in one query when requested.
+    """
+    prefetches = ['permit_types']
+    if spots:
+        prefetches.append(Prefetch(
+            'spots',
+            queryset=ParkingSpot.objects.only(
+                'parking_spot_id', 'parking_lot_id', 'availability'
+            ).order_by('parking_spot_id'),
+        ))
+    return ParkingLot.objects.prefetch_related(*prefetches).order_by('parking_lot_id')
+
+
+def representation_variant(request):
+    """The query parameters that change how lots are rendered.
+
+    Only names the serializer knows count, so clients can't mint cache keys.
+    """
+    return '.'.join(
+        ','.join(sorted(names)) for names in ParkingLotSerializer.requested(request)
+    ).strip('.')
 
 
 class ParkingLotViewSet(viewsets.ModelViewSet):
     serializer_class = ParkingLotSerializer
 
     def get_queryset(self):
-        # Prefetch spots and annotate counts to avoid N+1 queries
-        return ParkingLot.objects.prefetch_related(
-            'spots', 'permit_types'
-        ).annotate(
-            _total_spots=Count('spots'),
-            _available_spots=Count('spots', filter=Q(spots__availability=True))
-        ).order_by('parking_lot_id')
+        return lot_queryset(spots=ParkingLotSerializer.expands_spots(self.request))
+
+    def list(self, request, *args, **kwargs):
+        etag = make_etag('lots', global_version(), representation_variant(request))
+        return conditional(request, etag, lambda: super(ParkingLotViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs.get(self.lookup_field))
+        if not pk.isdigit():
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag('lot', pk, lot_version(pk), representation_variant(request))
+        return conditional(request, etag, lambda: super(ParkingLotViewSet, self).retrieve(request, *args, **kwargs))
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Occupancy over time: ?start=&end= (ISO 8601, default last 24h)
+        and optional ?granularity=raw|1m|15m|1h."""
+        lot = get_object_or_404(ParkingLot, pk=pk)
+        end = self._parse_time(request.query_params.get('end'), timezone.now())
+        start = self._parse_time(request.query_params.get('start'), end and end - timedelta(hours=24))
+        granularity = request.query_params.get('granularity')
+        if start is None or end is None or start >= end:
+            return Response(
+                {'error': 'start and end must be ISO 8601 datetimes with start before end'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if granularity not in (None, RAW, *BUCKET_WIDTHS):
+            return Response(
+                {'error': f"granularity must be one of: {', '.join([RAW, *BUCKET_WIDTHS])}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            granularity, points = lot_history(lot.parking_lot_id, start, end, granularity)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'lot_id': lot.parking_lot_id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'granularity': granularity,
+            'points': points,
+        })
+
+    @staticmethod
+    def _parse_time(value, default):
+        """Aware datetime from an ISO 8601 parameter; None when unparseable."""
+        if not value:
+            return default
+        try:
+            moment = parse_datetime(value)
+        except ValueError:
+            return None
+        if moment is not None and timezone.is_naive(moment):
+            moment = timezone.make_aware(moment, timezone.get_current_timezone())
+        return moment
 
 
 class ParkingSpotViewSet(viewsets.ModelViewSet):
     serializer_class = ParkingSpotSerializer
+    pagination_class = PkCursorPagination
 
     def get_queryset(self):
-        queryset = ParkingSpot.objects.select_related('parking_lot').order_by('parking_spot_id')
+        queryset = ParkingSpot.objects.select_related('parking_lot').prefetch_related(
+            'lot_permit_access'
+        ).order_by('parking_spot_id')
         lot_id = self.request.query_params.get('parking_lot')
+        available = self.request.query_params.get('available')
+        permit = self.request.query_params.get('permit', '')
         if lot_id:
             queryset = queryset.filter(parking_lot_id=lot_id)
+        if permit.isdigit():
+            # Spots open to this permit, from the denormalized access mask
+            queryset = queryset.filter(permit_mask__hasbit=permit_bit(int(permit)))
+        if available in ('true', 'false'):
+            if lot_id and lot_id.isdigit():
+                # Resolve matching ids from the bitmap index instead of scanning the lot
+                if available == 'true':
+                    spot_ids = availability_index.available_spot_ids(int(lot_id))
+                else:
+                    spot_ids = availability_index.occupied_spot_ids(int(lot_id))
+                queryset = queryset.filter(parking_spot_id__in=spot_ids)
+            else:
+                queryset = queryset.filter(availability=available == 'true')
         return queryset
 
+    def perform_update(self, serializer):
+        previous = serializer.instance.availability
+        spot = serializer.save()
+        if spot.availability != previous:
+            # Sequence and fan out API changes like sensor changes
+            lot = ParkingLot.objects.get(pk=spot.parking_lot_id)
+            broadcaster.add(lot_summary(lot), [
+                {'spot_id': spot.parking_spot_id, 'available': spot.availability}
+            ])
+
+    @action(detail=False, methods=['get'])
+    def free(self, request):
+        """First N free spot ids in a lot, answered from the bitmap index."""
+        lot_id = request.query_params.get('parking_lot', '')
+        limit = request.query_params.get('limit', '10')
+        if not lot_id.isdigit() or not limit.isdigit():
+            return Response(
+                {'error': 'parking_lot and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        bitmap = availability_index.get(int(lot_id))
+        return Response({
+            'lot_id': int(lot_id),
+            'available_spots': bitmap.available_count(),
+            'spot_ids': bitmap.first_available(min(int(limit), 1000)),
+        })
+
+    @action(detail=False, methods=['get'], url_path='nearest-available')
+    def nearest_available(self, request):
+        """Closest free spots to ?lat=&lon= (top ?k=, default 5, max 50).
+
+        Only lots open to the user's permit and not closed by an event are
+        considered; ?max_distance= (meters) bounds the search. Answered from
+        the in-process spatial and availability indexes.
+        """
+        try:
+            lat = float(request.query_params['lat'])
+            lon = float(request.query_params['lon'])
+            k = int(request.query_params.get('k', 5))
+            max_distance = request.query_params.get('max_distance')
+            max_distance = float(max_distance) if max_distance else None
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'lat and lon are required numbers; k must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or not 1 <= k <= 50:
+            return Response(
+                {'error': 'lat/lon out of range or k not between 1 and 50'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        permit_id = None
+        if request.user.is_authenticated and request.user.permit_type_id:
+            permit_id = request.user.permit_type_id
+        matches = spatial_index.nearest_available(
+            lat, lon, k, permit_id, max_distance, exclude_lots=restrictions.restricted_lots()
+        )
+        return Response({
+            'lat': lat,
+            'lon': lon,
+            'results': [
+                {
+                    'spot_id': spot_id,
+                    'lot_id': lot_id,
+                    'lot_name': spatial_index.lot_name(lot_id),
+                    'latitude': spot_lat,
+                    'longitude': spot_lon,
+                    'distance_m': round(distance, 1),
+                }
+                for distance, spot_id, lot_id, spot_lat, spot_lon in matches
+            ],
+        })
+
 
 class PermitTypeViewSet(viewsets.ModelViewSet):
     queryset = PermitType.objects.all()
@@ -49,11 +237,42 @@ class PermitTypeViewSet(viewsets.ModelViewSet):
 class EventViewSet(viewsets.ModelViewSet):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
+    pagination_class = PkCursorPagination
 
 
 class SessionViewSet(viewsets.ModelViewSet):
-    queryset = Session.objects.all()
     serializer_class = SessionSerializer
+    pagination_class = PkCursorPagination
+
+    def get_queryset(self):
+        if self.request.query_params.get('active') == 'true':
+            return current_sessions().order_by('session_id')
+        return Session.objects.order_by('session_id')
+
+    @action(detail=False, methods=['get'])
+    def current(self, request):
+        """Open sessions for ?spot=, ?parking_lot= and/or ?user= (default: the
+        caller's own). Served from the open-session indexes."""
+        filters = {}
+        for param, name in (('spot', 'spot_id'), ('parking_lot', 'lot_id'), ('user', 'user_id')):
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            if not value.isdigit():
+                return Response(
+                    {'error': f'{param} must be an integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            filters[name] = int(value)
+        if not filters:
+            if not request.user.is_authenticated:
+                return Response(
+                    {'error': 'spot, parking_lot or user is required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            filters['user_id'] = request.user.pk
+        page = self.paginate_queryset(current_sessions(**filters))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 
 class VehicleViewSet(viewsets.ModelViewSet):
@@ -72,35 +291,21 @@ def dashboard_summary(request):
     """Quick summary endpoint for the frontend dashboard.
 
     Optimized with:
-    - Single query using annotations (no N+1)
-    - 2-second cache to reduce redundant queries
+    - Single query reading the lot counters (no COUNT over spots)
+    - Stale-while-revalidate cache per status generation, pushed by producers
+    - ETag from the generation; unchanged clients get 304 without a query
+
+    Lots closed by an event right now are flagged ``restricted``.
     """
-    # Try cache first
-    cache_key = 'dashboard_summary'
-    data = cache.get(cache_key)
-
-    if data is None:
-        # Single query with annotations - no N+1 problem
-        lots = ParkingLot.objects.annotate(
-            total=Count('spots'),
-            available=Count('spots', filter=Q(spots__availability=True))
-        ).order_by('parking_lot_id')
-
-        data = [
-            {
-                'id': lot.parking_lot_id,
-                'name': lot.parking_lot_name,
-                'total_spots': lot.total,
-                'available_spots': lot.available,
-                'occupancy_percent': round((lot.total - lot.available) / lot.total * 100, 1) if lot.total > 0 else 0
-            }
-            for lot in lots
-        ]
-
-        # Cache for 2 seconds - balances freshness with performance
-        cache.set(cache_key, data, timeout=2)
-
-    return Response(data)
+    generation = global_version()
+    restricted, restriction_state = restrictions.at()
+
+    def respond():
+        version, rows = get_dashboard(generation)
+        rows = [{**row, 'restricted': row['id'] in restricted} for row in rows]
+        return tagged(Response(rows), make_etag('dashboard', version, restriction_state))
+
+    return conditional(request, make_etag('dashboard', generation, restriction_state), respond)
 
 
 @api_view(['GET'])
@@ -122,19 +327,84 @@ def active_events(request):
 
 @api_view(['GET'])
 def lots_for_permit(request):
-    """Get parking lots accessible for the current user's permit type."""
-    if not request.user.is_authenticated:
-        # Return all lots for anonymous users
-        lots = ParkingLot.objects.all().order_by('parking_lot_id')
-    elif request.user.permit_type:
-        # Return lots that allow this permit type
-        lots = ParkingLot.objects.filter(permit_types=request.user.permit_type).order_by('parking_lot_id')
-    else:
-        # User has no permit, return empty or all lots
-        lots = ParkingLot.objects.all().order_by('parking_lot_id')
-    
-    serializer = ParkingLotSerializer(lots, many=True)
-    return Response(serializer.data)
+    """Get parking lots accessible for the current user's permit type.
+
+    Every user with the same permit gets the same answer, so responses are
+    cached per permit type. The key (and ETag) includes the status generation,
+    which is bumped by availability changes and lot/permit mapping changes.
+    Lots closed by an event right now are left out; the restriction state is
+    part of the key too.
+    """
+    permit_id = None
+    if request.user.is_authenticated and request.user.permit_type_id:
+        permit_id = request.user.permit_type_id
+
+    generation = global_version()
+    restricted, restriction_state = restrictions.at()
+    variant = f"{permit_id or 'all'}:{representation_variant(request)}:{restriction_state}"
+
+    def compute():
+        lots = lot_queryset(spots=ParkingLotSerializer.expands_spots(request))
+        if restricted:
+            lots = lots.exclude(parking_lot_id__in=restricted)
+        if permit_id is not None:
+            # Return lots that allow this permit type (mask check, no M2M join)
+            lots = lots.filter(permit_mask__hasbit=permit_bit(permit_id))
+        # Anonymous users and users without a permit see every lot
+        return ParkingLotSerializer(lots, many=True, context={'request': request}).data
+
+    def respond():
+        version, data = lots_for_permit_cache.get(compute, generation, variant)
+        return tagged(Response(data), make_etag('permit-lots', version, variant))
+
+    return conditional(request, make_etag('permit-lots', generation, variant), respond)
+
+
+@api_view(['POST'])
+def ingest_readings(request):
+    """Apply a batch of sensor readings in one request.
+
+    Body: {"readings": [[spot_id, available, sensor_timestamp], ...]}, or a
+    signed batch {"device", "payload", "signature"} (see parking/signing.py).
+    A signed batch is verified as a whole before anything is written; with
+    PARKING_SENSOR_REQUIRE_SIGNATURE unsigned batches are refused.
+    Duplicate and flickering readings are dropped by the sensor filter
+    first; the rest are written set-based per lot and handed to the
+    coalescing broadcaster, which emits one batch_update per lot per window.
+    """
+    payload = request.data
+    try:
+        if is_signed(payload):
+            readings = sensor_keys.verify(payload)
+            received = len(readings)
+        elif getattr(settings, 'PARKING_SENSOR_REQUIRE_SIGNATURE', False):
+            raise InvalidSignature('Sensor batches must be signed')
+        else:
+            raw = payload.get('readings') if isinstance(payload, dict) else payload
+            readings = parse_readings(raw)
+            received = len(raw)
+    except InvalidSignature as exc:
+        # Not 401: the signature travels in the body, there is no WWW-Authenticate scheme to offer
+        return Response({'error': str(exc)}, status=status.HTTP_403_FORBIDDEN)
+    except InvalidReading as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    with sensor_filter.filtered(readings) as (accepted, counts):
+        summaries = apply_readings(accepted)
+    broadcaster.add_many(summaries)
+
+    return Response({
+        'received': received,
+        'suppressed': sum(counts[name] for name in SUPPRESSED),
+        'changed': sum(len(summary['spots']) for summary in summaries),
+        'lots_updated': len(summaries),
+    })
+
+
+@api_view(['GET'])
+def sensor_stats(request):
+    """Sensor filter counters (received, passed, suppressed by reason)."""
+    return Response(sensor_filter.stats())
 
 
 @api_view(['POST'])
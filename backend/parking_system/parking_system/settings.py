@@ -45,6 +45,47 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Seconds producers coalesce spot updates before broadcasting one frame per lot
+PARKING_BROADCAST_WINDOW = float(os.getenv('PARKING_BROADCAST_WINDOW', '0.15'))
+# Published change sets kept per lot for WebSocket delta resume
+PARKING_CHANGE_LOG_SIZE = int(os.getenv('PARKING_CHANGE_LOG_SIZE', '256'))
+# Rollups wait this long after a bucket ends, so late-committed samples still count
+PARKING_ROLLUP_GRACE_SECONDS = float(os.getenv('PARKING_ROLLUP_GRACE_SECONDS', '30'))
+# Hours of occupancy history kept per granularity (None = keep forever)
+PARKING_HISTORY_RETENTION_HOURS = {
+    'raw': int(os.getenv('PARKING_RETAIN_RAW_HOURS', '48')),
+    '1m': int(os.getenv('PARKING_RETAIN_MINUTE_HOURS', str(30 * 24))),
+    '15m': int(os.getenv('PARKING_RETAIN_QUARTER_HOURS', str(90 * 24))),
+    '1h': None,
+}
+# Event.restricted_lots are closed from LEAD hours before an event's start
+# until DURATION hours after it (events only record a start time)
+PARKING_EVENT_LEAD_HOURS = float(os.getenv('PARKING_EVENT_LEAD_HOURS', '3'))
+PARKING_EVENT_DURATION_HOURS = float(os.getenv('PARKING_EVENT_DURATION_HOURS', '5'))
+# Sensor changes within this many seconds of a spot's previous change are held
+# until they persist (per-spot override: ParkingSpot.debounce_seconds)
+PARKING_SENSOR_DEBOUNCE_SECONDS = float(os.getenv('PARKING_SENSOR_DEBOUNCE_SECONDS', '3'))
+# Repeated identical readings are dropped unless the last one passed was older
+PARKING_SENSOR_REFRESH_SECONDS = float(os.getenv('PARKING_SENSOR_REFRESH_SECONDS', '300'))
+# Spots whose last passed state each process remembers (least recent dropped)
+PARKING_SENSOR_FILTER_SIZE = int(os.getenv('PARKING_SENSOR_FILTER_SIZE', '100000'))
+# Signed sensor batches (parking/signing.py): reject unsigned ones when set,
+# allowed clock skew, and device keys cached per process (unknown names in their own LRU)
+PARKING_SENSOR_REQUIRE_SIGNATURE = os.getenv('PARKING_SENSOR_REQUIRE_SIGNATURE', 'False').lower() == 'true'
+PARKING_SENSOR_SIGNATURE_MAX_AGE = float(os.getenv('PARKING_SENSOR_SIGNATURE_MAX_AGE', '300'))
+PARKING_SENSOR_KEY_CACHE_SIZE = int(os.getenv('PARKING_SENSOR_KEY_CACHE_SIZE', '1024'))
+PARKING_SENSOR_UNKNOWN_CACHE_SIZE = int(os.getenv('PARKING_SENSOR_UNKNOWN_CACHE_SIZE', '256'))
+
+# Shared cache so per-process state (e.g. the availability index) can
+# coordinate across workers; falls back to Django's per-process LocMemCache
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -0,0 +1,17 @@
+"""
+Settings for the test suite: everything stays in-process, no Redis needed.
+
+``manage.py test`` picks this module up unless DJANGO_SETTINGS_MODULE is set;
+other runners (pytest-django, IDEs, ``coverage run -m django test``) should
+point DJANGO_SETTINGS_MODULE at ``parking_system.test_settings``.
+"""
+from .settings import *  # noqa: F401,F403
+
+CHANNEL_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+}
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+}
+# Broadcast synchronously so tests can assert on frames immediately
+PARKING_BROADCAST_WINDOW = 0
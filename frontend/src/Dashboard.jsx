@@ -27,6 +27,8 @@ function Dashboard() {
 
   const wsRef = useRef(null);
   const reconnectTimeoutRef = useRef(null);
+  // Last sequence seen per subscribed lot, sent as `resume` after a reconnect
+  const sequencesRef = useRef({});
 
   // Handle incoming WebSocket messages
   const handleWsMessage = useCallback((event) => {
@@ -41,7 +43,8 @@ function Dashboard() {
             name: lot.lot_name,
             total_spots: lot.total_spots,
             available_spots: lot.available_spots,
-            occupancy_percent: lot.occupancy_percent
+            occupancy_percent: lot.occupancy_percent,
+            restricted: (message.restricted || []).includes(lot.lot_id)
           })));
           setLastUpdated(new Date());
           setLoading(false);
@@ -76,6 +79,78 @@ function Dashboard() {
           setLastUpdated(new Date());
           break;
 
+        case 'batch_update': {
+          // Many spot changes for one lot in a single frame
+          const batch = message.data;
+          if (typeof batch.sequence === 'number') {
+            sequencesRef.current[batch.lot_id] = batch.sequence;
+          }
+          setLots(prevLots => prevLots.map(lot => {
+            const lotId = lot.id ?? lot.parking_lot_id;
+            if (lotId == batch.lot_id) {
+              return {
+                ...lot,
+                total_spots: batch.total_spots,
+                available_spots: batch.available_spots,
+                occupancy_percent: batch.occupancy_percent
+              };
+            }
+            return lot;
+          }));
+          if (batch.spots?.length) {
+            const changed = new Map(batch.spots.map(s => [s.spot_id, s.available]));
+            setSpots(prevSpots => prevSpots.map(spot =>
+              changed.has(spot.parking_spot_id)
+                ? { ...spot, availability: changed.get(spot.parking_spot_id) }
+                : spot
+            ));
+          }
+          setLastUpdated(new Date());
+          break;
+        }
+
+        case 'lots_summary': {
+          // Counters for every lot that changed in one producer batch
+          const summaries = new Map(message.data.map(lot => [lot.lot_id, lot]));
+          setLots(prevLots => prevLots.map(lot => {
+            const summary = summaries.get(lot.id ?? lot.parking_lot_id);
+            return summary
+              ? {
+                  ...lot,
+                  total_spots: summary.total_spots,
+                  available_spots: summary.available_spots,
+                  occupancy_percent: summary.occupancy_percent
+                }
+              : lot;
+          }));
+          setLastUpdated(new Date());
+          break;
+        }
+
+        case 'subscriptions':
+          break;
+
+        case 'lot_delta': {
+          // Spots that changed while we were disconnected
+          sequencesRef.current[message.lot_id] = message.sequence;
+          const changed = new Map(message.spots.map(s => [s.spot_id, s.available]));
+          setSpots(prevSpots => prevSpots.map(spot =>
+            changed.has(spot.parking_spot_id)
+              ? { ...spot, availability: changed.get(spot.parking_spot_id) }
+              : spot
+          ));
+          break;
+        }
+
+        case 'lot_snapshot':
+          // Too far behind for a delta - replace the lot's spots
+          sequencesRef.current[message.lot_id] = message.sequence;
+          setSpots(message.spots.map(spot => ({
+            parking_spot_id: spot.spot_id,
+            availability: spot.available
+          })));
+          break;
+
         case 'status_update':
           // Full status update (response to get_status request)
           setLots(message.data.map(lot => ({
@@ -83,7 +158,8 @@ function Dashboard() {
             name: lot.lot_name,
             total_spots: lot.total_spots,
             available_spots: lot.available_spots,
-            occupancy_percent: lot.occupancy_percent
+            occupancy_percent: lot.occupancy_percent,
+            restricted: (message.restricted || []).includes(lot.lot_id)
           })));
           setLastUpdated(new Date());
           break;
@@ -114,6 +190,15 @@ function Dashboard() {
       console.log('WebSocket connected');
       setWsConnected(true);
       setError(null);
+      // Catch up on lots we were following instead of refetching them
+      const sequences = sequencesRef.current;
+      if (Object.keys(sequences).length) {
+        ws.send(JSON.stringify({ type: 'resume', sequences }));
+        ws.send(JSON.stringify({
+          type: 'subscribe',
+          lot_ids: Object.keys(sequences).map(Number)
+        }));
+      }
     };
 
     ws.onmessage = handleWsMessage;
@@ -134,13 +219,28 @@ function Dashboard() {
     wsRef.current = ws;
   }, [handleWsMessage]);
 
-  // Request spots for a lot via WebSocket
+  // Request spots for a lot via WebSocket and subscribe to its spot updates
   const requestLotSpots = useCallback((lotId) => {
     if (wsRef.current?.readyState === WebSocket.OPEN) {
       wsRef.current.send(JSON.stringify({
         type: 'get_lot_spots',
         lot_id: lotId
       }));
+      wsRef.current.send(JSON.stringify({
+        type: 'subscribe',
+        lot_ids: [lotId]
+      }));
+    }
+  }, []);
+
+  // Stop spot-level updates for a lot we are no longer viewing
+  const unsubscribeLot = useCallback((lotId) => {
+    delete sequencesRef.current[lotId];
+    if (wsRef.current?.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify({
+        type: 'unsubscribe',
+        lot_ids: [lotId]
+      }));
     }
   }, []);
 
@@ -245,10 +345,17 @@ function Dashboard() {
 
   const fetchSpots = async (lotId) => {
     try {
-      const response = await fetch(`${API_URL}/api/spots/?parking_lot=${lotId}`);
-      if (!response.ok) throw new Error('Failed to fetch spots');
-      const data = await response.json();
-      setSpots(data);
+      // Spot lists are cursor-paginated - follow `next` until the lot is complete
+      let url = `${API_URL}/api/spots/?parking_lot=${lotId}&page_size=1000`;
+      const allSpots = [];
+      while (url) {
+        const response = await fetch(url);
+        if (!response.ok) throw new Error('Failed to fetch spots');
+        const data = await response.json();
+        allSpots.push(...(data.results ?? data));
+        url = data.next ?? null;
+      }
+      setSpots(allSpots);
     } catch (err) {
       console.error('Error fetching spots:', err);
     }
@@ -303,14 +410,17 @@ function Dashboard() {
       // Try WebSocket first, fall back to REST
       if (wsConnected) {
         requestLotSpots(selectedLot.id);
+        return () => unsubscribeLot(selectedLot.id);
       } else {
         fetchSpots(selectedLot.id);
       }
     }
-  }, [selectedLot, wsConnected, requestLotSpots]);
+  }, [selectedLot, wsConnected, requestLotSpots, unsubscribeLot]);
 
-  // Check if a lot is restricted by an active event
+  // Check if a lot is restricted by an event right now (flag comes from the server)
   const isLotRestricted = (lotId) => {
+    const lot = lots.find(l => l.id === lotId);
+    if (lot?.restricted !== undefined) return lot.restricted;
     return activeEvents.some(event =>
       event.restricted_lots?.some(lot => lot.parking_lot_id === lotId)
     );